@@ -1,4 +1,20 @@
 # train_mlp_with_shap.py
+#
+#   python MLP.py                         # in-memory fit on synthetic_medical_data.csv
+#   python MLP.py --stream                # out-of-core fit, CSV read in chunks
+#   python MLP.py --shards shards/        # out-of-core fit from synth.py shards
+#   python MLP.py --shards new/ --resume  # continue training the active model on new data
+#   python MLP.py --activate              # ...and make the new version live
+#
+# Checkpoints and the final files are written to --out (checkpoints/), never
+# next to the serving code: the trained model is published as a new
+# version of the artifact registry (artifacts.py), which the API workers
+# pick up only once the version is complete and activated.
+
+import os
+import copy
+import argparse
+import tempfile
 
 import pandas as pd
 import numpy as np
@@ -10,76 +26,251 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.neural_network import MLPRegressor
 from sklearn.metrics import mean_squared_error, r2_score
 
-# ----------------------------
-# Load Data
-# ----------------------------
-data = pd.read_csv("synthetic_medical_data.csv")
+from shards import FEATURES, TARGET, iter_batches
+from artifacts import ArtifactStore
 
-X = data[[
-    "Age",
-    "Sex",
-    "Heart_Rate",
-    "Systolic_BP",
-    "Diastolic_BP",
-    "Temperature"
-]]
+DATA_CSV = "synthetic_medical_data.csv"
+CHECKPOINT_DIR = "checkpoints"
+BACKGROUND_SIZE = 40
 
-y = data["Risk"]
 
-# ----------------------------
-# Split
-# ----------------------------
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42
-)
+def build_model(max_iter=600):
+    return MLPRegressor(
+        hidden_layer_sizes=(64, 32),
+        activation="relu",
+        solver="adam",
+        max_iter=max_iter,
+        random_state=42
+    )
 
-# ----------------------------
-# Scale
-# ----------------------------
-scaler = StandardScaler()
-X_train_scaled = scaler.fit_transform(X_train)
-X_test_scaled = scaler.transform(X_test)
 
-# ----------------------------
-# Model
-# ----------------------------
-mlp = MLPRegressor(
-    hidden_layer_sizes=(64, 32),
-    activation="relu",
-    solver="adam",
-    max_iter=600,
-    random_state=42
-)
+def evaluate(mlp, X_test_scaled, y_test):
+    y_pred = mlp.predict(X_test_scaled)
 
-mlp.fit(X_train_scaled, y_train)
+    print("MSE:", mean_squared_error(y_test, y_pred))
+    print("R2:", r2_score(y_test, y_pred))
 
 # ----------------------------
-# Evaluate
+# In-memory training (CSV)
 # ----------------------------
-y_pred = mlp.predict(X_test_scaled)
 
-print("MSE:", mean_squared_error(y_test, y_pred))
-print("R2:", r2_score(y_test, y_pred))
+def train_from_csv(path=DATA_CSV):
+    data = pd.read_csv(path)
 
-# ----------------------------
-# Build SHAP Explainer (ONCE)
-# ----------------------------
+    X = data[FEATURES]
+    y = data[TARGET]
+
+    # ----------------------------
+    # Split
+    # ----------------------------
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=42
+    )
 
-# Small background for efficiency
-background = X_train_scaled[
-    np.random.choice(len(X_train_scaled), 40, replace=False)
-]
+    # ----------------------------
+    # Scale
+    # ----------------------------
+    scaler = StandardScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+    X_test_scaled = scaler.transform(X_test)
 
-explainer = shap.KernelExplainer(
-    mlp.predict,
-    background
-)
+    # ----------------------------
+    # Model
+    # ----------------------------
+    mlp = build_model()
+    mlp.fit(X_train_scaled, y_train)
+
+    evaluate(mlp, X_test_scaled, y_test)
+
+    # Small background for efficiency
+    background = X_train_scaled[
+        np.random.choice(len(X_train_scaled), BACKGROUND_SIZE, replace=False)
+    ]
+
+    return mlp, scaler, background
 
 # ----------------------------
-# Save Everything
+# Streaming training (out-of-core)
 # ----------------------------
-joblib.dump(mlp, "mlp_regressor.pkl")
-joblib.dump(scaler, "scaler.pkl")
-joblib.dump(explainer, "shap_explainer.pkl")
 
-print("Saved: model, scaler, and SHAP explainer.")
+def csv_batches(path, batch_size):
+    for chunk in pd.read_csv(path, chunksize=batch_size):
+        yield chunk[FEATURES].to_numpy(dtype=np.float64), chunk[TARGET].to_numpy(dtype=np.float64)
+
+
+def shard_batches(directory, batch_size):
+    return iter_batches(directory, batch_size)
+
+
+def split_stream(batches, holdout_every):
+    """
+    Splits a stream into training and held-out rows by global row
+    position (every holdout_every-th row is held out). The source is read
+    in file order, so the same rows are held out on every pass.
+    Yields (X_train, y_train, X_holdout, y_holdout) per batch.
+    """
+    offset = 0
+    for X, y in batches:
+        held = (np.arange(offset, offset + len(y)) % holdout_every) == 0
+        offset += len(y)
+        yield X[~held], y[~held], X[held], y[held]
+
+
+def atomic_dump(obj, path):
+    """joblib.dump to a temp file next to path, then os.replace over it."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            joblib.dump(obj, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def checkpoint(mlp, scaler, directory=CHECKPOINT_DIR):
+    """
+    Writes mlp_regressor.pkl / scaler.pkl atomically: readers see either
+    the old or the new file, never a partial one. Both files are fully
+    written before the first rename, so the pair is swapped back to back.
+    """
+    os.makedirs(directory, exist_ok=True)
+    atomic_dump(scaler, os.path.join(directory, "scaler.pkl"))
+    atomic_dump(mlp, os.path.join(directory, "mlp_regressor.pkl"))
+
+
+def train_streaming(make_batches, epochs=20, patience=3, tol=1e-3, holdout_every=10,
+                    seed=42, resume_from=None, checkpoint_dir=CHECKPOINT_DIR):
+    """
+    Out-of-core training: nothing but one batch is held in memory.
+
+    Args:
+        make_batches (callable): Returns a fresh iterator of (X, y) batches
+            in a stable order; called once per pass.
+        epochs (int): Maximum passes over the training rows.
+        patience (int): Stop after this many epochs without the held-out
+            MSE improving by a relative tol.
+        holdout_every (int): Every n-th row is held out for validation.
+        resume_from (str): Directory with mlp_regressor.pkl / scaler.pkl to
+            continue training from (new data, no full retrain). The scaler
+            is kept frozen so the inputs the model learned stay valid.
+        checkpoint_dir (str): Where improved models are checkpointed.
+
+    Returns:
+        (mlp, scaler, background) of the best epoch.
+    """
+
+    rng = np.random.RandomState(seed)
+
+    if resume_from:
+        mlp = joblib.load(os.path.join(resume_from, "mlp_regressor.pkl"))
+        scaler = joblib.load(os.path.join(resume_from, "scaler.pkl"))
+    else:
+        mlp = build_model()
+        scaler = StandardScaler()
+        # Pass 0: feature statistics
+        for X, _, _, _ in split_stream(make_batches(), holdout_every):
+            scaler.partial_fit(X)
+
+    background = []
+    best_mse, best, stale = np.inf, None, 0
+
+    for epoch in range(epochs):
+        for X, y, _, _ in split_stream(make_batches(), holdout_every):
+            if not len(y):
+                continue
+            order = rng.permutation(len(y))
+            mlp.partial_fit(scaler.transform(X[order]), y[order])
+            if len(background) < BACKGROUND_SIZE:
+                background.extend(X[order[:BACKGROUND_SIZE - len(background)]])
+
+        # Held-out MSE, streamed
+        sse, n = 0.0, 0
+        for _, _, X_ho, y_ho in split_stream(make_batches(), holdout_every):
+            if len(y_ho):
+                sse += float(np.sum((mlp.predict(scaler.transform(X_ho)) - y_ho) ** 2))
+                n += len(y_ho)
+        mse = sse / max(n, 1)
+
+        improved = mse < best_mse * (1 - tol)
+        print(f"epoch {epoch + 1}/{epochs}: train loss {mlp.loss_:.6f}, "
+              f"held-out MSE {mse:.6f}{' *' if improved else ''}")
+
+        if improved:
+            best_mse, best, stale = mse, copy.deepcopy(mlp), 0
+            checkpoint(best, scaler, checkpoint_dir)
+        else:
+            stale += 1
+            if stale >= patience:
+                print(f"Early stopping: no improvement for {patience} epochs")
+                break
+
+    if best is None:
+        raise ValueError("No held-out rows were scored; check the data source")
+
+    print(f"Best held-out MSE: {best_mse:.6f}")
+    return best, scaler, scaler.transform(np.asarray(background))
+
+
+def save_artifacts(mlp, scaler, background, directory=CHECKPOINT_DIR):
+    # ----------------------------
+    # Build SHAP Explainer (ONCE)
+    # ----------------------------
+    explainer = shap.KernelExplainer(
+        mlp.predict,
+        background
+    )
+
+    # ----------------------------
+    # Save Everything
+    # ----------------------------
+    checkpoint(mlp, scaler, directory)
+    atomic_dump(explainer, os.path.join(directory, "shap_explainer.pkl"))
+
+    print(f"Saved: model, scaler, and SHAP explainer to {directory}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the vitals MLP and SHAP explainer")
+    parser.add_argument("--csv", default=DATA_CSV)
+    parser.add_argument("--stream", action="store_true", help="stream the CSV instead of loading it")
+    parser.add_argument("--shards", help="directory written by synth.py --format npy|parquet")
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--patience", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=4096)
+    parser.add_argument("--holdout-every", type=int, default=10)
+    parser.add_argument("--resume", action="store_true", help="continue from the active model version")
+    parser.add_argument("--out", default=CHECKPOINT_DIR, help="checkpoint directory (not served)")
+    parser.add_argument("--notes", default="", help="stored in the published version's manifest")
+    parser.add_argument("--activate", action="store_true", help="activate the published version")
+    args = parser.parse_args()
+
+    store = ArtifactStore()
+
+    if args.shards or args.stream:
+        if args.shards:
+            make_batches = lambda: shard_batches(args.shards, args.batch_size)
+        else:
+            make_batches = lambda: csv_batches(args.csv, args.batch_size)
+        model = train_streaming(
+            make_batches,
+            epochs=args.epochs,
+            patience=args.patience,
+            holdout_every=args.holdout_every,
+            resume_from=store.path(store.active()) if args.resume else None,
+            checkpoint_dir=args.out
+        )
+    else:
+        model = train_from_csv(args.csv)
+
+    save_artifacts(*model, directory=args.out)
+
+    version = store.publish(args.out, notes=args.notes)
+    print(f"Published vitals model version {version}")
+    if args.activate:
+        store.activate(version)
+        print(f"Activated {version}")
@@ -0,0 +1,319 @@
+# admission.py
+#
+# Deadline-aware admission control and load shedding for /triage.
+#
+# Every request gets a latency budget (TRIAGE_DEADLINE_MS, or the client's
+# X-Deadline-Ms header). Before the pipeline starts, the controller
+# estimates what each quality tier would cost right now and admits the
+# request at the best tier that fits:
+#
+#   full          zero-shot + vitals MLP + exact SHAP + LLM explanation
+#   no_llm        same scores; template explanation, local department routing
+#   approx_shap   as no_llm, with approximate SHAP (summarized background)
+#   vitals_only   vitals MLP + approximate SHAP; the zero-shot model is skipped
+#
+# Stage costs are EWMAs of the span durations tracing.py records (a slow
+# Groq shows up in explanation_llm, a saturated BART in zeroshot). Spans
+# cut short by a deadline or an error are left out, since their duration
+# is a lower bound. An estimate that gets no new samples (its tier is no
+# longer admitted) decays back toward its prior, with a half-life of
+# ADMISSION_DECAY_SECONDS, so a past slow spell cannot pin requests to a
+# degraded tier: the better tier is retried and re-measured. The
+# CPU-bound stages are scaled by the requests in flight per model worker,
+# so a burst degrades before the EWMAs have caught up. Only
+# ADMISSION_FULL_INFLIGHT requests run the richer tiers at once; beyond
+# that a surge is served vitals_only, which keeps a score for urgent
+# patients in bounded time. Requests that cannot meet even vitals_only, or
+# arrive past ADMISSION_MAX_INFLIGHT, are rejected up front with
+# Overloaded (503 + Retry-After in main.py).
+#
+# The estimate only picks the starting tier: combine.py also enforces the
+# deadline while running and steps down if a stage overruns.
+#
+#   ADMISSION=0                 -> every request runs the full pipeline, no deadline
+#   TRIAGE_DEADLINE_MS          -> default budget (3000)
+#   TRIAGE_DEADLINE_MAX_MS      -> cap on client-supplied budgets (30000)
+#   ADMISSION_CONCURRENCY       -> model workers the load factor divides by (MODEL_WORKERS)
+#   ADMISSION_FULL_INFLIGHT     -> in-flight cap for tiers above vitals_only (32)
+#   ADMISSION_MAX_INFLIGHT      -> in-flight cap before rejecting (256)
+#   ADMISSION_HEADROOM          -> safety factor on estimates (1.2)
+#   ADMISSION_EWMA_ALPHA        -> weight of the newest stage sample (0.2)
+#   ADMISSION_DECAY_SECONDS     -> half-life of an estimate without samples (30)
+
+import os
+import math
+import time
+import threading
+
+from tracing import add_span_listener
+
+ADMISSION = os.getenv("ADMISSION", "1") == "1"
+TRIAGE_DEADLINE_MS = float(os.getenv("TRIAGE_DEADLINE_MS", "3000"))
+TRIAGE_DEADLINE_MAX_MS = float(os.getenv("TRIAGE_DEADLINE_MAX_MS", "30000"))
+ADMISSION_CONCURRENCY = int(os.getenv("ADMISSION_CONCURRENCY", os.getenv("MODEL_WORKERS", "4")))
+ADMISSION_FULL_INFLIGHT = int(os.getenv("ADMISSION_FULL_INFLIGHT", "32"))
+ADMISSION_MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", "256"))
+ADMISSION_HEADROOM = float(os.getenv("ADMISSION_HEADROOM", "1.2"))
+ADMISSION_EWMA_ALPHA = float(os.getenv("ADMISSION_EWMA_ALPHA", "0.2"))
+ADMISSION_DECAY_SECONDS = float(os.getenv("ADMISSION_DECAY_SECONDS", "30"))
+
+# Best first
+TIERS = ["full", "no_llm", "approx_shap", "vitals_only"]
+
+# Stage costs (ms) assumed until the first spans are observed
+STAGE_PRIORS_MS = {
+    "zeroshot": 400.0,
+    "vitals_predict": 1.0,
+    "shap": 20.0,
+    "shap_approx": 1.0,
+    "explanation_llm": 1200.0,
+    "department_routing": 5.0,
+}
+
+
+class Overloaded(Exception):
+    """No tier can meet the request's deadline."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """One admitted request; release it (context manager) when done."""
+
+    def __init__(self, controller, tier, budget_ms, estimate_ms):
+        self.controller = controller
+        self.tier = tier
+        self.budget_ms = budget_ms
+        self.estimate_ms = estimate_ms
+        self.started = time.perf_counter()
+        self.deadline = self.started + budget_ms / 1000.0 if budget_ms is not None else None
+        self.served = None
+        self.released = False
+
+    def remaining(self):
+        """Seconds left before the deadline (None without one)."""
+        return None if self.deadline is None else self.deadline - time.perf_counter()
+
+    def serve(self, tier):
+        """Records the tier actually served (combine.py may step down)."""
+        self.served = tier
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.controller.release(self)
+
+
+class AdmissionController:
+
+    def __init__(self, enabled=ADMISSION, deadline_ms=TRIAGE_DEADLINE_MS, concurrency=ADMISSION_CONCURRENCY,
+                 full_inflight=ADMISSION_FULL_INFLIGHT, max_inflight=ADMISSION_MAX_INFLIGHT,
+                 headroom=ADMISSION_HEADROOM, alpha=ADMISSION_EWMA_ALPHA,
+                 decay_seconds=ADMISSION_DECAY_SECONDS):
+        """
+        Args:
+            enabled (bool): When False every request is admitted at "full"
+                without a deadline (the pre-admission behaviour).
+            deadline_ms (float): Budget for requests that do not set one.
+            concurrency (int): Requests the model stages run in parallel.
+            full_inflight (int): In-flight requests allowed above vitals_only.
+            max_inflight (int): In-flight requests allowed at all.
+            decay_seconds (float): Half-life toward the prior of a stage
+                estimate that gets no samples (0 disables decay).
+        """
+        self.enabled = enabled
+        self.deadline_ms = deadline_ms
+        self.concurrency = max(1, concurrency)
+        self.full_inflight = full_inflight
+        self.max_inflight = max_inflight
+        self.headroom = headroom
+        self.alpha = alpha
+        self.decay_seconds = decay_seconds
+
+        self._lock = threading.Lock()
+        self.stage_ms = dict(STAGE_PRIORS_MS)
+        self.stage_samples = {stage: 0 for stage in STAGE_PRIORS_MS}
+        self.stage_updated = {stage: time.monotonic() for stage in STAGE_PRIORS_MS}
+        self.stage_discarded = 0
+        self.request_ms = None
+        self.inflight = 0
+        self.inflight_rich = 0
+        self.admitted = {tier: 0 for tier in TIERS}
+        self.served = {tier: 0 for tier in TIERS}
+        self.stepped_down = 0
+        self.missed_deadline = 0
+        self.rejected = 0
+
+        add_span_listener(self.observe)
+
+    # ----------------------------
+    # Estimates
+    # ----------------------------
+
+    def _decayed(self, stage, now):
+        # Caller holds the lock
+        value = self.stage_ms[stage]
+        if self.decay_seconds <= 0:
+            return value
+        prior = STAGE_PRIORS_MS[stage]
+        weight = 0.5 ** ((now - self.stage_updated[stage]) / self.decay_seconds)
+        return prior + (value - prior) * weight
+
+    def observe(self, stage, seconds, completed=True):
+        """Span listener: folds one completed stage duration into its EWMA."""
+        if stage not in self.stage_ms:
+            return
+        with self._lock:
+            if not completed:
+                self.stage_discarded += 1
+                return
+            now = time.monotonic()
+            current = self._decayed(stage, now)
+            self.stage_ms[stage] = current + self.alpha * (seconds * 1000.0 - current)
+            self.stage_updated[stage] = now
+            self.stage_samples[stage] += 1
+
+    def stage_estimates(self):
+        """Current per-stage estimates (ms), decay applied."""
+        with self._lock:
+            now = time.monotonic()
+            return {stage: self._decayed(stage, now) for stage in self.stage_ms}
+
+    def estimate_ms(self, tier, inflight=None):
+        """Expected latency of `tier` for a request admitted now."""
+        ms = self.stage_estimates()
+        with self._lock:
+            inflight = self.inflight if inflight is None else inflight
+
+        # CPU stages queue behind the other requests in flight
+        load = max(1.0, (inflight + 1) / self.concurrency)
+        shap = ms["shap"] if tier in ("full", "no_llm") else ms["shap_approx"]
+        vitals = (ms["vitals_predict"] + shap) * load
+        if tier == "vitals_only":
+            total = vitals + ms["department_routing"]
+        else:
+            # Zero-shot runs alongside the vitals model
+            total = max(ms["zeroshot"] * load, vitals)
+            if tier == "full":
+                # Explanation and department LLM calls are concurrent
+                total += max(ms["explanation_llm"], ms["department_routing"])
+            else:
+                total += ms["department_routing"]
+        return total * self.headroom
+
+    def retry_after(self):
+        """Seconds until the work in flight has likely drained (>= 1)."""
+        with self._lock:
+            per_request = self.request_ms if self.request_ms is not None else self.deadline_ms
+            inflight = self.inflight
+        return max(1, math.ceil(inflight / self.concurrency * per_request / 1000.0))
+
+    # ----------------------------
+    # Admission
+    # ----------------------------
+
+    def budget(self, requested_ms=None):
+        if requested_ms is None or requested_ms <= 0:
+            return self.deadline_ms
+        return min(float(requested_ms), TRIAGE_DEADLINE_MAX_MS)
+
+    def admit(self, deadline_ms=None):
+        """
+        Picks the best tier whose estimate fits the budget.
+
+        Args:
+            deadline_ms (float | None): Client budget; the default when None.
+
+        Returns:
+            Ticket
+
+        Raises:
+            Overloaded: when even vitals_only cannot meet the budget.
+        """
+        if not self.enabled:
+            return self._admit("full", None, None)
+
+        budget_ms = self.budget(deadline_ms)
+        with self._lock:
+            inflight, rich = self.inflight, self.inflight_rich
+
+        if inflight >= self.max_inflight:
+            self._reject()
+            raise Overloaded(f"{inflight} triage requests in flight", self.retry_after())
+
+        candidates = TIERS if rich < self.full_inflight else TIERS[-1:]
+        for tier in candidates:
+            estimate = self.estimate_ms(tier, inflight)
+            if estimate <= budget_ms:
+                return self._admit(tier, budget_ms, estimate)
+
+        self._reject()
+        raise Overloaded(
+            f"cheapest tier needs ~{estimate:.0f} ms, budget is {budget_ms:.0f} ms", self.retry_after()
+        )
+
+    def _admit(self, tier, budget_ms, estimate_ms):
+        with self._lock:
+            self.inflight += 1
+            if tier != "vitals_only":
+                self.inflight_rich += 1
+            self.admitted[tier] += 1
+        return Ticket(self, tier, budget_ms, estimate_ms)
+
+    def _reject(self):
+        with self._lock:
+            self.rejected += 1
+
+    def release(self, ticket):
+        """Ends the ticket's in-flight accounting; later calls are no-ops."""
+        elapsed_ms = (time.perf_counter() - ticket.started) * 1000.0
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            self.inflight -= 1
+            if ticket.tier != "vitals_only":
+                self.inflight_rich -= 1
+            if ticket.served is not None:
+                self.served[ticket.served] += 1
+                # A triage cache hit may serve better than admitted
+                if TIERS.index(ticket.served) > TIERS.index(ticket.tier):
+                    self.stepped_down += 1
+                if ticket.budget_ms is not None and elapsed_ms > ticket.budget_ms:
+                    self.missed_deadline += 1
+                if self.request_ms is None:
+                    self.request_ms = elapsed_ms
+                else:
+                    self.request_ms += self.alpha * (elapsed_ms - self.request_ms)
+
+    # ----------------------------
+    # Stats
+    # ----------------------------
+
+    def stats(self):
+        estimates = {tier: round(self.estimate_ms(tier), 2) for tier in TIERS}
+        stage_ms = self.stage_estimates()
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "deadline_ms": self.deadline_ms,
+                "inflight": self.inflight,
+                "inflight_above_vitals_only": self.inflight_rich,
+                "admitted": dict(self.admitted),
+                "served": dict(self.served),
+                "stepped_down": self.stepped_down,
+                "missed_deadline": self.missed_deadline,
+                "rejected": self.rejected,
+                "stage_ms": {stage: round(ms, 2) for stage, ms in stage_ms.items()},
+                "stage_samples": dict(self.stage_samples),
+                "stage_samples_discarded": self.stage_discarded,
+                "tier_estimate_ms": estimates,
+                "request_ms_ewma": self.request_ms,
+            }
+
+
+admission = AdmissionController()
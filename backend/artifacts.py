@@ -0,0 +1,493 @@
+# artifacts.py
+#
+# Versioned artifact registry for the vitals model, with zero-downtime
+# hot-swap.
+#
+#   ARTIFACTS_DIR/
+#       ACTIVE                        {"version", "previous", "activated_at"}
+#       versions/<version>/
+#           manifest.json             {"version", "created_at", "notes",
+#                                      "files": {name: {"sha256", "bytes"}}}
+#           mlp_regressor.pkl
+#           scaler.pkl
+#           shap_explainer.pkl
+#
+# A version is written under a temporary directory and renamed into place
+# once its manifest is complete, and ACTIVE is replaced atomically (temp
+# file + os.replace), so readers never see a half-published version or a
+# torn pointer. Every load verifies the files against the manifest.
+#
+# Each worker runs a ModelWatcher that polls ACTIVE. A new version is
+# loaded, verified and warmed up (one inference) in the watcher's thread,
+# and only then swapped into the model registry: in-flight requests keep
+# the model object they started with and nothing waits on the load. The
+# previously active model stays in memory, so a rollback swaps back
+# without reloading.
+#
+# Without ARTIFACTS_DIR/ACTIVE, the legacy .pkl files next to this module
+# are served as version "legacy-<hash>". They are read once at startup and
+# never hot-swapped: files written in place can be caught half-updated (a
+# new scaler next to the old MLP). Only ACTIVE changes trigger a swap, and
+# the first activation snapshots the legacy files into a published version
+# so that rolling back never reads them again. MLP.py publishes here.
+#
+#   ARTIFACTS_DIR            -> registry root (default: ./artifacts)
+#   ARTIFACTS_POLL_SECONDS   -> ACTIVE polling interval, 0 disables (default 5)
+#
+#   python artifacts.py publish [--from DIR] [--version V] [--notes TEXT] [--activate]
+#   python artifacts.py list | active | verify [V] | activate V | rollback
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+import threading
+
+from registry import registry, artifact_path
+
+logger = logging.getLogger(__name__)
+
+ARTIFACTS_DIR = os.getenv("ARTIFACTS_DIR") or artifact_path("artifacts")
+ARTIFACTS_POLL_SECONDS = float(os.getenv("ARTIFACTS_POLL_SECONDS", "5"))
+
+VITALS_FILES = ["mlp_regressor.pkl", "scaler.pkl", "shap_explainer.pkl"]
+
+LEGACY_PREFIX = "legacy-"
+
+
+class ArtifactError(Exception):
+    """Missing version, bad manifest or checksum mismatch."""
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def describe_files(directory, names):
+    """{name: {"sha256", "bytes"}} for the files of one version."""
+    files = {}
+    for name in names:
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path):
+            raise ArtifactError(f"Missing artifact file: {path}")
+        files[name] = {"sha256": file_sha256(path), "bytes": os.path.getsize(path)}
+    return files
+
+
+def content_id(files):
+    """Short hash over the file checksums; identical artifacts share it."""
+    joined = "".join(f"{name}:{files[name]['sha256']}" for name in sorted(files))
+    return hashlib.sha256(joined.encode()).hexdigest()[:12]
+
+
+def _write_json_atomic(path, payload):
+    tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp, "w") as f:
+        json.dump(payload, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class ArtifactStore:
+
+    def __init__(self, root=ARTIFACTS_DIR, files=VITALS_FILES, legacy_dir=None):
+        """
+        Args:
+            root (str): Registry directory (versions/ and ACTIVE).
+            files (list): File names every version must contain.
+            legacy_dir (str | None): Served when no version is active
+                (default: the directory of this module).
+        """
+        self.root = root
+        self.files = list(files)
+        self.legacy_dir = legacy_dir or artifact_path("")
+        self.versions_dir = os.path.join(root, "versions")
+        self.pointer_path = os.path.join(root, "ACTIVE")
+        self._legacy = (None, None)  # (stat signature, version)
+
+    # ----------------------------
+    # Versions
+    # ----------------------------
+
+    def path(self, version):
+        if version.startswith(LEGACY_PREFIX):
+            return self.legacy_dir
+        return os.path.join(self.versions_dir, version)
+
+    def manifest(self, version):
+        if version.startswith(LEGACY_PREFIX):
+            files = describe_files(self.legacy_dir, self.files)
+            return {"version": LEGACY_PREFIX + content_id(files), "created_at": None,
+                    "notes": "unversioned files", "files": files}
+
+        path = os.path.join(self.path(version), "manifest.json")
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise ArtifactError(f"Unknown artifact version '{version}'")
+        except ValueError as e:
+            raise ArtifactError(f"Bad manifest for '{version}': {e}")
+
+    def versions(self):
+        """Manifests of all published versions, oldest first."""
+        if not os.path.isdir(self.versions_dir):
+            return []
+        manifests = []
+        for name in os.listdir(self.versions_dir):
+            if name.startswith("."):
+                continue  # publish in progress
+            try:
+                manifests.append(self.manifest(name))
+            except ArtifactError as e:
+                logger.warning("Skipping artifact version %s: %s", name, e)
+        return sorted(manifests, key=lambda m: m.get("created_at") or 0)
+
+    def verify(self, version):
+        """Checks every file against the manifest; returns the manifest."""
+        manifest = self.manifest(version)
+        directory = self.path(version)
+        actual = describe_files(directory, manifest["files"])
+        for name, expected in manifest["files"].items():
+            if actual[name]["sha256"] != expected["sha256"]:
+                raise ArtifactError(
+                    f"Checksum mismatch for {version}/{name}: "
+                    f"{actual[name]['sha256'][:12]} != {expected['sha256'][:12]}"
+                )
+        missing = set(self.files) - set(manifest["files"])
+        if missing:
+            raise ArtifactError(f"Version {version} lacks {sorted(missing)}")
+        return manifest
+
+    def publish(self, source_dir=None, version=None, notes=""):
+        """
+        Copies the artifact files from source_dir (default: the legacy
+        files) into a new version. Publishing content that already exists
+        returns the existing version.
+
+        Returns:
+            str: version
+        """
+        source_dir = source_dir or self.legacy_dir
+        files = describe_files(source_dir, self.files)
+        digest = content_id(files)
+
+        for manifest in self.versions():
+            if content_id(manifest["files"]) == digest:
+                return manifest["version"]
+
+        version = version or f"{time.strftime('%Y%m%d-%H%M%S')}-{digest[:8]}"
+        if os.path.sep in version or version.startswith((".", LEGACY_PREFIX)):
+            raise ArtifactError(f"Invalid version name '{version}'")
+        target = self.path(version)
+        if os.path.exists(target):
+            raise ArtifactError(f"Version '{version}' already exists")
+
+        os.makedirs(self.versions_dir, exist_ok=True)
+        staging = os.path.join(self.versions_dir, f".{version}.tmp-{os.getpid()}")
+        os.makedirs(staging)
+        try:
+            for name in self.files:
+                shutil.copy2(os.path.join(source_dir, name), os.path.join(staging, name))
+            _write_json_atomic(os.path.join(staging, "manifest.json"), {
+                "version": version,
+                "created_at": time.time(),
+                "notes": notes,
+                "files": files,
+            })
+            # Checks the copies, not just the source
+            if describe_files(staging, self.files) != files:
+                raise ArtifactError(f"Copy of {source_dir} does not match its checksums")
+            os.rename(staging, target)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        logger.info("Published artifact version %s", version)
+        return version
+
+    # ----------------------------
+    # ACTIVE pointer
+    # ----------------------------
+
+    def pointer(self):
+        """The ACTIVE record, or None when nothing was activated."""
+        try:
+            with open(self.pointer_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            raise ArtifactError(f"Bad ACTIVE pointer: {e}")
+
+    def legacy_version(self):
+        # Re-hashed only when a file's size or mtime changes
+        signature = []
+        for name in self.files:
+            try:
+                st = os.stat(os.path.join(self.legacy_dir, name))
+            except FileNotFoundError:
+                raise ArtifactError(f"Missing artifact file: {name}")
+            signature.append((st.st_size, st.st_mtime_ns))
+        if self._legacy[0] != signature:
+            self._legacy = (signature, LEGACY_PREFIX + content_id(describe_files(self.legacy_dir, self.files)))
+        return self._legacy[1]
+
+    def active(self):
+        """Active version name (the legacy files when nothing is active)."""
+        pointer = self.pointer()
+        if pointer is None:
+            return self.legacy_version()
+        return pointer["version"]
+
+    def activate(self, version):
+        """Atomically points ACTIVE at version (verified first)."""
+        if version.startswith(LEGACY_PREFIX):
+            raise ArtifactError(f"'{version}' is not a published version; publish the files first")
+        self.verify(version)
+        pointer = self.pointer()
+        if pointer:
+            previous = pointer["version"]
+            if previous == version:
+                return pointer
+        else:
+            # The first activation can be rolled back to a snapshot of the
+            # legacy files (unless they are the version being activated)
+            try:
+                previous = self.publish(self.legacy_dir, notes="legacy files, snapshot at first activation")
+            except ArtifactError:
+                previous = None
+            if previous == version:
+                previous = None
+        pointer = {"version": version, "previous": previous, "activated_at": time.time()}
+        os.makedirs(self.root, exist_ok=True)
+        _write_json_atomic(self.pointer_path, pointer)
+        logger.info("Activated artifact version %s (previous: %s)", version, previous)
+        return pointer
+
+    def rollback(self):
+        """Re-activates the previous version; rolling back twice toggles."""
+        pointer = self.pointer()
+        if not pointer or not pointer.get("previous"):
+            raise ArtifactError("No previous version to roll back to")
+        return self.activate(pointer["previous"])
+
+
+# ----------------------------
+# Hot-swap
+# ----------------------------
+
+class ModelWatcher:
+
+    def __init__(self, store, name, loader, warm_up=None, poll_seconds=ARTIFACTS_POLL_SECONDS):
+        """
+        Args:
+            store (ArtifactStore): Where versions and ACTIVE live.
+            name (str): Model registry entry that is swapped.
+            loader (callable): loader(directory) -> model object.
+            warm_up (callable | None): warm_up(model) runs one inference and
+                raises if the model is unusable; the swap is skipped then.
+            poll_seconds (float): ACTIVE polling interval (0 disables).
+        """
+        self.store = store
+        self.name = name
+        self.loader = loader
+        self.warm_up = warm_up
+        self.poll_seconds = poll_seconds
+
+        self.current = None
+        self.previous = None
+        self._models = {}  # version -> model, for current and previous
+        self._swap_lock = threading.Lock()
+        self._poller = None
+        self._poller_pid = None
+        self.swaps = 0
+        self.last_swap_ms = None
+        # version -> error; not retried until ACTIVE is rewritten
+        self.failed = {}
+        self._failed_at = {}
+
+    def _load(self, version):
+        started = time.perf_counter()
+        manifest = self.store.verify(version)
+        model = self.loader(self.store.path(version))
+        # Legacy ids are recomputed from the verified files
+        model.version = manifest["version"]
+        if self.warm_up is not None:
+            self.warm_up(model)
+        logger.info("Loaded %s model %s in %.0f ms", self.name, model.version,
+                    (time.perf_counter() - started) * 1000.0)
+        return model
+
+    def load_active(self):
+        """Registry loader: the active version (blocking, first load only)."""
+        with self._swap_lock:
+            version = self.store.active()
+            model = self._models.get(version) or self._load(version)
+            self._models[version] = model
+            self.current = version
+        self.start()
+        return model
+
+    def check(self):
+        """
+        Swaps to the ACTIVE version if it changed. Loading happens here, in
+        the caller's thread; requests keep using the old model meanwhile.
+
+        Returns:
+            bool: whether a swap happened
+        """
+        try:
+            pointer = self.store.pointer()
+            # Legacy files are never hot-swapped (see the module header)
+            if pointer is None:
+                return False
+            version = pointer["version"]
+        except (OSError, KeyError, ArtifactError) as e:
+            logger.warning("Cannot read the active %s version: %s", self.name, e)
+            return False
+
+        stamp = pointer.get("activated_at")
+        if version == self.current:
+            return False
+        if version in self.failed and self._failed_at.get(version) == stamp:
+            return False
+
+        with self._swap_lock:
+            if version == self.current:
+                return False
+            started = time.perf_counter()
+            model = self._models.get(version)
+            if model is None:
+                try:
+                    model = self._load(version)
+                except Exception as e:
+                    self.failed[version] = f"{type(e).__name__}: {e}"
+                    self._failed_at[version] = stamp
+                    logger.error("Not swapping to %s %s, keeping %s: %s",
+                                 self.name, version, self.current, e)
+                    return False
+
+            registry.set(self.name, model)
+            self._models[version] = model
+            self.previous, self.current = self.current, version
+            self._models = {
+                v: self._models[v] for v in (self.current, self.previous) if v in self._models
+            }
+            self.failed.pop(version, None)
+            self._failed_at.pop(version, None)
+            self.swaps += 1
+            self.last_swap_ms = (time.perf_counter() - started) * 1000.0
+
+        logger.info("Swapped %s model %s -> %s", self.name, self.previous, version)
+        return True
+
+    def activate(self, version):
+        """Points ACTIVE at version and swaps this worker right away."""
+        self.store.activate(version)
+        self.check()
+        return self.status()
+
+    def rollback(self):
+        """Previous version, swapped without a reload when still in memory."""
+        self.store.rollback()
+        self.check()
+        return self.status()
+
+    def start(self):
+        """Starts polling ACTIVE (once per process; restarted after fork)."""
+        if self.poll_seconds <= 0:
+            return
+        pid = os.getpid()
+        if self._poller_pid == pid and self._poller is not None and self._poller.is_alive():
+            return
+
+        def poll():
+            while True:
+                time.sleep(self.poll_seconds)
+                try:
+                    self.check()
+                except Exception:
+                    logger.exception("%s model watcher failed", self.name)
+
+        self._poller_pid = pid
+        self._poller = threading.Thread(target=poll, name=f"{self.name}-model-watcher", daemon=True)
+        self._poller.start()
+
+    def status(self):
+        return {
+            "name": self.name,
+            "current": self.current,
+            "previous": self.previous,
+            "in_memory": sorted(self._models),
+            "swaps": self.swaps,
+            "last_swap_ms": self.last_swap_ms,
+            "failed": dict(self.failed),
+            "poll_seconds": self.poll_seconds,
+        }
+
+
+# ----------------------------
+# CLI
+# ----------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vitals model artifact registry")
+    parser.add_argument("--root", default=ARTIFACTS_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    publish = commands.add_parser("publish", help="copy artifact files into a new version")
+    publish.add_argument("--from", dest="source", default=None, help="directory with the .pkl files")
+    publish.add_argument("--version", default=None)
+    publish.add_argument("--notes", default="")
+    publish.add_argument("--activate", action="store_true")
+
+    commands.add_parser("list", help="published versions")
+    commands.add_parser("active", help="the ACTIVE pointer")
+    verify = commands.add_parser("verify", help="check checksums")
+    verify.add_argument("version", nargs="?")
+    activate = commands.add_parser("activate", help="point ACTIVE at a version")
+    activate.add_argument("version")
+    commands.add_parser("rollback", help="re-activate the previous version")
+
+    args = parser.parse_args(argv)
+    store = ArtifactStore(args.root)
+
+    try:
+        if args.command == "publish":
+            version = store.publish(args.source, args.version, args.notes)
+            print(version)
+            if args.activate:
+                print(json.dumps(store.activate(version), indent=2))
+        elif args.command == "list":
+            active = store.active()
+            for manifest in store.versions():
+                marker = "*" if manifest["version"] == active else " "
+                print(f"{marker} {manifest['version']}  {manifest.get('notes', '')}")
+        elif args.command == "active":
+            print(json.dumps(store.pointer() or {"version": store.active()}, indent=2))
+        elif args.command == "verify":
+            manifest = store.verify(args.version or store.active())
+            print(f"{manifest['version']}: OK ({len(manifest['files'])} files)")
+        elif args.command == "activate":
+            print(json.dumps(store.activate(args.version), indent=2))
+        elif args.command == "rollback":
+            print(json.dumps(store.rollback(), indent=2))
+    except ArtifactError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    sys.exit(main())
@@ -0,0 +1,410 @@
+# audio.py
+#
+# Long-recording transcription for /process-symptoms.
+#
+# A recording is decoded to PCM, split at silences found by a simple
+# energy VAD (frame RMS against an adaptive noise floor), and the voiced
+# segments are sent to Sarvam concurrently (AUDIO_PARALLELISM at a time).
+# Transcripts come back in whatever order the calls finish and are
+# stitched in segment order; transcribe_stream() yields each segment as
+# soon as every segment before it is done, so clients can show partial
+# text while the rest of a long recording is still being transcribed.
+#
+# WAV is decoded with the stdlib. Anything else (e.g. browser webm/ogg)
+# is transcoded with ffmpeg when it is installed; otherwise the upload is
+# sent to Sarvam as-is in a single call, as before.
+#
+# Short clips skip all of this: a WAV whose header says it fits in one
+# segment, or another format no larger than AUDIO_PASSTHROUGH_BYTES, is
+# streamed to Sarvam straight from the spooled upload without being read
+# into memory. A recording in which the VAD finds no speech at all is also
+# sent whole, so Sarvam (not the energy threshold) decides it is silent.
+#
+#   AUDIO_SEGMENT_SECONDS      preferred max segment length (Sarvam's REST
+#                              limit is 30 s)
+#   AUDIO_PASSTHROUGH_BYTES    non-WAV uploads up to this size go out in one
+#                              call (default 256 KiB, ~30 s of browser opus)
+#   AUDIO_MIN_SEGMENT_SECONDS  don't cut before this much audio
+#   AUDIO_MIN_SILENCE_MS       pause length that counts as a boundary
+#   AUDIO_PARALLELISM          concurrent Sarvam calls per recording
+
+import io
+import os
+import wave
+import shutil
+import asyncio
+import logging
+import subprocess
+
+import numpy as np
+
+from http_client import get_upstream
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+SARVAM_URL = "https://api.sarvam.ai/speech-to-text-translate"
+
+AUDIO_SEGMENT_SECONDS = float(os.getenv("AUDIO_SEGMENT_SECONDS", "25"))
+AUDIO_MIN_SEGMENT_SECONDS = float(os.getenv("AUDIO_MIN_SEGMENT_SECONDS", "5"))
+AUDIO_MIN_SILENCE_MS = float(os.getenv("AUDIO_MIN_SILENCE_MS", "300"))
+AUDIO_PARALLELISM = int(os.getenv("AUDIO_PARALLELISM", "4"))
+AUDIO_PASSTHROUGH_BYTES = int(os.getenv("AUDIO_PASSTHROUGH_BYTES", str(256 * 1024)))
+
+FRAME_MS = 30
+# Frames this far (dB) above the noise floor are speech
+VAD_MARGIN_DB = 10.0
+# ... and never below this absolute level (full scale = 0 dB)
+VAD_MIN_DB = -50.0
+
+# --------------------------------------------------
+# Decoding
+# --------------------------------------------------
+
+class PCMAudio:
+
+    def __init__(self, frames, sample_rate, channels, sample_width):
+        """
+        Args:
+            frames (bytes): Interleaved little-endian PCM.
+            sample_rate (int): Samples per second per channel.
+            channels (int): Channel count.
+            sample_width (int): Bytes per sample (1, 2 or 4).
+        """
+        self.frames = frames
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_width = sample_width
+
+    @property
+    def n_samples(self):
+        return len(self.frames) // (self.channels * self.sample_width)
+
+    @property
+    def duration(self):
+        return self.n_samples / self.sample_rate
+
+    def mono(self):
+        """Float samples in [-1, 1], channels averaged."""
+        if self.sample_width == 1:
+            samples = (np.frombuffer(self.frames, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+        elif self.sample_width == 2:
+            samples = np.frombuffer(self.frames, dtype="<i2").astype(np.float32) / 32768.0
+        elif self.sample_width == 4:
+            samples = np.frombuffer(self.frames, dtype="<i4").astype(np.float32) / 2147483648.0
+        else:
+            raise ValueError(f"Unsupported sample width: {self.sample_width}")
+        return samples.reshape(-1, self.channels).mean(axis=1)
+
+    def wav_bytes(self, start=0, end=None):
+        """WAV file for samples [start, end)."""
+        step = self.channels * self.sample_width
+        end = self.n_samples if end is None else end
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as w:
+            w.setnchannels(self.channels)
+            w.setsampwidth(self.sample_width)
+            w.setframerate(self.sample_rate)
+            w.writeframes(self.frames[start * step:end * step])
+        return buffer.getvalue()
+
+
+def read_wav(data):
+    """data: WAV bytes or a binary file object."""
+    with wave.open(io.BytesIO(data) if isinstance(data, (bytes, bytearray)) else data, "rb") as w:
+        return PCMAudio(w.readframes(w.getnframes()), w.getframerate(), w.getnchannels(), w.getsampwidth())
+
+
+def wav_duration(source):
+    """Seconds of audio from a WAV header (None if not WAV); rewinds source."""
+    try:
+        with wave.open(source, "rb") as w:
+            return w.getnframes() / w.getframerate()
+    except (wave.Error, EOFError, ZeroDivisionError):
+        return None
+    finally:
+        source.seek(0)
+
+
+def upload_size(source):
+    source.seek(0, os.SEEK_END)
+    size = source.tell()
+    source.seek(0)
+    return size
+
+
+def fits_one_call(source, max_seconds=AUDIO_SEGMENT_SECONDS, max_bytes=AUDIO_PASSTHROUGH_BYTES):
+    """Whether the upload is short enough to send to Sarvam unsplit."""
+    duration = wav_duration(source)
+    if duration is not None:
+        return duration <= max_seconds
+    return upload_size(source) <= max_bytes
+
+
+def transcode_to_wav(data, sample_rate=16000):
+    """Any ffmpeg-readable container -> 16 kHz mono WAV bytes."""
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+         "-ac", "1", "-ar", str(sample_rate), "-f", "wav", "pipe:1"],
+        input=data, capture_output=True, timeout=120, check=True
+    )
+    return result.stdout
+
+
+def decode_audio(data):
+    """PCMAudio (data: bytes or a binary file object), or None when the
+    format can't be decoded here."""
+    if isinstance(data, (bytes, bytearray)):
+        data = io.BytesIO(data)
+    try:
+        return read_wav(data)
+    except (wave.Error, EOFError):
+        pass
+    if shutil.which("ffmpeg"):
+        data.seek(0)
+        try:
+            return read_wav(transcode_to_wav(data.read()))
+        except (subprocess.SubprocessError, wave.Error, EOFError) as e:
+            logger.warning("ffmpeg could not decode the upload: %s", e)
+    return None
+
+# --------------------------------------------------
+# Energy VAD + segmentation
+# --------------------------------------------------
+
+def frame_energy_db(samples, sample_rate, frame_ms=FRAME_MS):
+    """RMS level per frame in dBFS."""
+    size = max(1, int(sample_rate * frame_ms / 1000))
+    n = len(samples) // size
+    if n == 0:
+        return np.zeros(0)
+    frames = samples[:n * size].reshape(n, size)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    return 20.0 * np.log10(np.maximum(rms, 1e-6))
+
+
+def voiced_frames(energy_db):
+    if not energy_db.size:
+        return np.zeros(0, dtype=bool)
+    floor, peak = np.percentile(energy_db, [5, 95])
+    if peak - floor < VAD_MARGIN_DB:
+        # No clear pauses (e.g. continuous speech): anything audible is voiced
+        threshold = VAD_MIN_DB
+    else:
+        threshold = max(VAD_MIN_DB, min(floor + VAD_MARGIN_DB, (floor + peak) / 2.0))
+    return energy_db > threshold
+
+
+def split_segments(audio, max_seconds=AUDIO_SEGMENT_SECONDS, min_seconds=AUDIO_MIN_SEGMENT_SECONDS,
+                   min_silence_ms=AUDIO_MIN_SILENCE_MS):
+    """
+    Cuts the recording into (start_sample, end_sample) segments of at most
+    max_seconds, preferring the middle of pauses of at least
+    min_silence_ms. With no pause in range, cuts at the quietest frame.
+    Segments with no speech at all are dropped.
+    """
+    samples = audio.mono()
+    frame = max(1, int(audio.sample_rate * FRAME_MS / 1000))
+    energy = frame_energy_db(samples, audio.sample_rate)
+    voiced = voiced_frames(energy)
+    n_frames = len(energy)
+
+    # Middle frame of every long-enough silent run
+    cuts = []
+    min_run = max(1, int(min_silence_ms / FRAME_MS))
+    run_start = None
+    for i, is_voiced in enumerate(list(voiced) + [True]):
+        if not is_voiced and run_start is None:
+            run_start = i
+        elif is_voiced and run_start is not None:
+            if i - run_start >= min_run:
+                cuts.append((run_start + i) // 2)
+            run_start = None
+
+    max_frames = max(1, int(max_seconds * 1000 / FRAME_MS))
+    min_frames = min(max_frames, int(min_seconds * 1000 / FRAME_MS))
+
+    boundaries = [0]
+    while n_frames - boundaries[-1] > max_frames:
+        start = boundaries[-1]
+        candidates = [c for c in cuts if start + min_frames <= c <= start + max_frames]
+        if candidates:
+            boundaries.append(candidates[-1])
+        else:
+            window = energy[start + min_frames:start + max_frames + 1]
+            cut = start + min_frames + int(np.argmin(window)) if window.size else start + max_frames
+            boundaries.append(max(cut, start + 1))
+    boundaries.append(n_frames)
+
+    segments = []
+    for a, b in zip(boundaries, boundaries[1:]):
+        if voiced[a:b].any():
+            end = audio.n_samples if b == n_frames else b * frame
+            segments.append((a * frame, end))
+    return segments
+
+# --------------------------------------------------
+# Transcription
+# --------------------------------------------------
+
+async def transcribe_file(filename, content, content_type, model, url=None, api_key=None):
+    """One Sarvam speech-to-text-translate call; returns the parsed JSON."""
+    with span("transcription"):
+        response = await get_upstream("sarvam").request(
+            "POST",
+            url or os.getenv("SARVAM_URL", SARVAM_URL),
+            retry=True,
+            headers={"api-subscription-key": api_key or os.getenv("SARVAM_API_KEY")},
+            data={"model": model},
+            files={"file": (filename, content, content_type)}
+        )
+        response.raise_for_status()
+        return response.json()
+
+
+async def transcribe_stream(data, filename="audio.wav", content_type="audio/wav", model="saaras:v2.5",
+                            parallelism=AUDIO_PARALLELISM, url=None, api_key=None):
+    """
+    Async generator of per-segment results, in order:
+    {"index", "segments", "start", "end", "transcript", "translated_text"}.
+    Short clips, undecodable formats and recordings without detected
+    speech come back as one segment covering the whole upload.
+
+    Args:
+        data: Audio bytes, or a seekable binary file object (e.g. the
+            spooled upload), which short clips stream from unread.
+    """
+
+    source = io.BytesIO(data) if isinstance(data, (bytes, bytearray)) else data
+
+    async def whole():
+        source.seek(0)
+        result = await transcribe_file(filename, source, content_type, model, url, api_key)
+        return {
+            "index": 0, "segments": 1, "start": 0.0, "end": None,
+            "transcript": result.get("transcript"),
+            "translated_text": result.get("translated_text"),
+        }
+
+    if await asyncio.to_thread(fits_one_call, source):
+        yield await whole()
+        return
+
+    audio = await asyncio.to_thread(decode_audio, source)
+    segments = split_segments(audio) if audio is not None else []
+    if not segments:
+        yield await whole()
+        return
+
+    limit = asyncio.Semaphore(max(1, parallelism))
+
+    async def run(index, start, end):
+        async with limit:
+            return await transcribe_file(
+                f"segment-{index}.wav", audio.wav_bytes(start, end), "audio/wav", model, url, api_key
+            )
+
+    tasks = [asyncio.create_task(run(i, s, e)) for i, (s, e) in enumerate(segments)]
+    try:
+        for index, ((start, end), task) in enumerate(zip(segments, tasks)):
+            result = await task
+            yield {
+                "index": index,
+                "segments": len(segments),
+                "start": round(start / audio.sample_rate, 3),
+                "end": round(end / audio.sample_rate, 3),
+                "transcript": result.get("transcript"),
+                "translated_text": result.get("translated_text"),
+            }
+    finally:
+        for task in tasks:
+            if task.done() and not task.cancelled():
+                task.exception()  # retrieved; the first failure already propagated
+            task.cancel()
+
+
+def stitch(parts, key):
+    return " ".join(p[key].strip() for p in parts if p.get(key) and p[key].strip()) or None
+
+
+async def transcribe(data, **kwargs):
+    """Whole-recording result: {"transcript", "translated_text", "segments"}."""
+    parts = [part async for part in transcribe_stream(data, **kwargs)]
+    return {
+        "transcript": stitch(parts, "transcript"),
+        "translated_text": stitch(parts, "translated_text"),
+        "segments": parts,
+    }
+
+# --------------------------------------------------
+# CLI
+# --------------------------------------------------
+
+def synth_recording(freqs, tone_seconds=4.0, pause_seconds=0.6, sample_rate=16000, noise=0.003, seed=0):
+    """Test recording: one tone per entry of freqs, separated by pauses."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(tone_seconds * sample_rate)) / sample_rate
+    pause = np.zeros(int(pause_seconds * sample_rate))
+    parts = [pause]
+    for freq in freqs:
+        parts.extend([0.3 * np.sin(2 * np.pi * freq * t), pause])
+    samples = np.concatenate(parts) + rng.normal(0.0, noise, sum(len(p) for p in parts))
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+    return PCMAudio(pcm, sample_rate, 1, 2).wav_bytes()
+
+
+async def _selftest(parallelism_levels):
+    import time
+    from fake_services import start_fake_sarvam
+
+    sarvam = start_fake_sarvam(latency_ms=100.0, ms_per_second=20.0)
+    freqs = [300 + 40 * i for i in range(30)]  # ~2 minutes of audio
+    wav = synth_recording(freqs)
+    expected = " ".join(f"tone{f}" for f in freqs)
+
+    audio = read_wav(wav)
+    segments = split_segments(audio)
+    print(f"{audio.duration:.1f} s recording -> {len(segments)} segments: "
+          + ", ".join(f"{(e - s) / audio.sample_rate:.1f}s" for s, e in segments))
+
+    for parallelism in parallelism_levels:
+        started = time.perf_counter()
+        first = None
+        parts = []
+        async for part in transcribe_stream(wav, parallelism=parallelism):
+            if first is None:
+                first = time.perf_counter() - started
+            parts.append(part)
+        elapsed = time.perf_counter() - started
+        ok = stitch(parts, "transcript") == expected
+        print(f"parallelism {parallelism}: first segment {first * 1000:.0f} ms, "
+              f"total {elapsed * 1000:.0f} ms, transcript {'OK' if ok else 'MISMATCH'}")
+        if not ok:
+            raise SystemExit(f"expected {expected!r}\ngot      {stitch(parts, 'transcript')!r}")
+
+    await get_upstream("sarvam").aclose()
+    sarvam.stop()
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Audio segmentation / transcription")
+    parser.add_argument("command", choices=["split", "selftest"])
+    parser.add_argument("file", nargs="?", help="split: audio file")
+    parser.add_argument("--parallelism", type=int, nargs="+", default=[1, AUDIO_PARALLELISM])
+    args = parser.parse_args()
+
+    if args.command == "split":
+        if not args.file:
+            parser.error("split needs an audio file")
+        with open(args.file, "rb") as f:
+            audio = decode_audio(f)
+        if audio is None:
+            sys.exit("could not decode (WAV, or install ffmpeg)")
+        for i, (start, end) in enumerate(split_segments(audio)):
+            print(f"{i:3d}  {start / audio.sample_rate:8.2f}s - {end / audio.sample_rate:8.2f}s")
+    else:
+        # Runs against the local fake from fake_services.py (no network)
+        asyncio.run(_selftest(args.parallelism))
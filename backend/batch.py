@@ -0,0 +1,134 @@
+# batch.py
+#
+# Bulk triage scoring. Items are processed in fixed-size chunks: each
+# chunk's vitals go through the scaler, MLP and SHAP as one matrix, and its
+# texts go to the zero-shot model in batches. Results are yielded per chunk
+# so callers can stream them out and memory stays flat for long lists.
+
+import os
+import numpy as np
+
+from zeroshot import compute_risk_scores
+from mplinf import run_mlp_inference_batch
+from explain import build_shap_payload, generate_explanation_structured
+from cache import TRIAGE_CACHE, zeroshot_cache, text_key
+from registry import registry
+from tracing import span
+
+FEATURES = ["Age", "Sex", "Heart_Rate", "Systolic_BP", "Diastolic_BP", "Temperature"]
+
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "256"))
+BATCH_ZEROSHOT_SIZE = int(os.getenv("BATCH_ZEROSHOT_SIZE", "16"))
+
+
+def _zeroshot_batch(texts):
+    scores = [None] * len(texts)
+    todo = []
+
+    for i, text in enumerate(texts):
+        if TRIAGE_CACHE:
+            scores[i] = zeroshot_cache.get(text_key(text))
+        if scores[i] is None:
+            todo.append(i)
+
+    for start in range(0, len(todo), BATCH_ZEROSHOT_SIZE):
+        idx = todo[start:start + BATCH_ZEROSHOT_SIZE]
+        with span("zeroshot"):
+            batch_scores = compute_risk_scores([texts[i] for i in idx])
+        for i, score in zip(idx, batch_scores):
+            scores[i] = score
+            if TRIAGE_CACHE:
+                zeroshot_cache.set(text_key(texts[i]), score)
+
+    return scores
+
+
+def score_chunk(items, explain=False):
+    """
+    Scores one chunk of patients.
+
+    Args:
+        items (list of dict): Each with "text", "vitals" (dict keyed by
+            FEATURES) and optionally "patient_id" / "index".
+        explain (bool): Also run the LLM explanation per patient (slow,
+            paid); otherwise the department comes from the local router.
+
+    Returns:
+        list of dict: One result (or {"error": ...}) per item, in order.
+    """
+
+    results = [None] * len(items)
+
+    valid = []
+    for i, item in enumerate(items):
+        missing = [k for k in FEATURES if item["vitals"].get(k) is None]
+        if missing:
+            results[i] = {"error": f"Missing vitals: {missing}"}
+        else:
+            valid.append(i)
+
+    if valid:
+        vitals_matrix = np.array(
+            [[item["vitals"][k] for k in FEATURES] for item in (items[i] for i in valid)],
+            dtype=np.float64
+        )
+        # One model for the whole chunk, even across a hot-swap
+        model = registry.get("vitals")
+        vitals_scores, contributions, base_value = run_mlp_inference_batch(vitals_matrix, model)
+        zeroshot_scores = _zeroshot_batch([items[i]["text"] for i in valid])
+
+        for j, i in enumerate(valid):
+            item = items[i]
+            zeroshot_score = zeroshot_scores[j]
+            vitals_score = float(vitals_scores[j])
+            final_score = 0.5 * zeroshot_score[0] + 0.5 * vitals_score
+
+            try:
+                if explain:
+                    results[i] = generate_explanation_structured(
+                        item["text"],
+                        zeroshot_score,
+                        vitals_score,
+                        contributions[j],
+                        final_score,
+                        base_value,
+                        item["vitals"]
+                    )
+                else:
+                    with span("department_routing"):
+                        route = registry.get("department_router").route(item["text"], zeroshot_score[1])
+                    results[i] = {
+                        "risk_score": int(np.clip(final_score * 100, 0, 100)),
+                        "shap": build_shap_payload(
+                            contributions[j], final_score, base_value, item["vitals"]
+                        ),
+                        "recommended_department": route["department_id"]
+                    }
+                results[i]["model_version"] = model.version
+            except Exception as e:
+                results[i] = {"error": str(e)}
+
+    for item, result in zip(items, results):
+        if "patient_id" in item:
+            result["patient_id"] = item["patient_id"]
+        if "index" in item:
+            result["index"] = item["index"]
+
+    return results
+
+
+def run_batch_risk_assessment(items, explain=False, chunk_size=BATCH_CHUNK_SIZE):
+    """
+    Generator over results for an iterable of items (see score_chunk),
+    scored chunk_size at a time.
+    """
+
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield from score_chunk(chunk, explain=explain)
+            chunk = []
+
+    if chunk:
+        yield from score_chunk(chunk, explain=explain)
@@ -0,0 +1,183 @@
+# batcher.py
+#
+# In-process micro-batcher: concurrent callers submit single items, a
+# background thread groups whatever is pending (up to max_batch_size, or
+# until the oldest item has waited max_wait_ms) and runs one batched call.
+# With workers > 1, that many threads form batches from the same queue, so
+# up to `workers` calls to fn can be in flight at once (e.g. one per
+# inference process, see inference_server.py).
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+# Queue-wait histogram bucket upper bounds (milliseconds)
+WAIT_BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, float("inf")]
+
+
+class MicroBatcher:
+
+    def __init__(self, fn, max_batch_size=8, max_wait_ms=5.0, name="batcher", workers=1):
+        """
+        Args:
+            fn (callable): Takes a list of items, returns a list of results
+                in the same order.
+            max_batch_size (int): Upper bound on items per call to fn.
+            max_wait_ms (float): How long the oldest pending item may wait
+                for the batch to fill before it is flushed anyway.
+            workers (int): Batches run concurrently (fn must be thread-safe
+                when > 1).
+        """
+        self.fn = fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+        self.workers = max(1, int(workers))
+
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._worker_pid = None
+
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    # ----------------------------
+    # Public API
+    # ----------------------------
+
+    def submit(self, item):
+        future = Future()
+        with self._cond:
+            self._ensure_worker()
+            self._pending.append((item, future, time.perf_counter()))
+            self._cond.notify()
+        return future
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    def stats(self):
+        with self._stats_lock:
+            batches = self._batches
+            return {
+                "name": self.name,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "workers": self.workers,
+                "pending": len(self._pending),
+                "batches": batches,
+                "items": self._items,
+                "errors": self._errors,
+                "mean_batch_size": self._items / batches if batches else 0.0,
+                "batch_size_counts": dict(sorted(self._size_counts.items())),
+                "queue_wait_ms": {
+                    "sum": self._wait_sum * 1000.0,
+                    "max": self._wait_max * 1000.0,
+                    "buckets": {
+                        ("+Inf" if b == float("inf") else str(b)): c
+                        for b, c in zip(WAIT_BUCKETS_MS, self._wait_buckets)
+                    },
+                },
+                "run_ms_sum": self._run_sum * 1000.0,
+            }
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._reset_stats()
+
+    # ----------------------------
+    # Worker
+    # ----------------------------
+
+    def _reset_stats(self):
+        self._batches = 0
+        self._items = 0
+        self._errors = 0
+        self._size_counts = {}
+        self._wait_sum = 0.0
+        self._wait_max = 0.0
+        self._wait_buckets = [0] * len(WAIT_BUCKETS_MS)
+        self._run_sum = 0.0
+
+    def _ensure_worker(self):
+        # Started lazily (and restarted after fork) so importing the module
+        # never spawns threads in a process that will not use them.
+        pid = os.getpid()
+        if self._worker_pid != pid:
+            self._worker_pid = pid
+            self._threads = []
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(
+                target=self._run, name=f"{self.name}-worker-{len(self._threads)}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def _next_batch(self):
+        with self._cond:
+            while True:
+                while not self._pending:
+                    self._cond.wait()
+
+                deadline = self._pending[0][2] + self.max_wait
+                while len(self._pending) < self.max_batch_size:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                # Another worker may have taken the items while we waited
+                n = min(len(self._pending), self.max_batch_size)
+                batch = [self._pending.popleft() for _ in range(n)]
+
+                # Callers that gave up while queued (e.g. a request past its
+                # deadline) are dropped unscored
+                batch = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+                if batch:
+                    return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            started = time.perf_counter()
+            items = [item for item, _, _ in batch]
+
+            try:
+                results = self.fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(
+                        f"{self.name}: got {len(results)} results for {len(items)} items"
+                    )
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                failed = True
+            else:
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+                failed = False
+
+            self._record(batch, started, time.perf_counter(), failed)
+
+    def _record(self, batch, started, finished, failed):
+        with self._stats_lock:
+            size = len(batch)
+            self._batches += 1
+            self._items += size
+            self._errors += int(failed)
+            self._size_counts[size] = self._size_counts.get(size, 0) + 1
+            self._run_sum += finished - started
+
+            for _, _, enqueued in batch:
+                wait = started - enqueued
+                self._wait_sum += wait
+                self._wait_max = max(self._wait_max, wait)
+                wait_ms = wait * 1000.0
+                for i, bound in enumerate(WAIT_BUCKETS_MS):
+                    if wait_ms <= bound:
+                        self._wait_buckets[i] += 1
+                        break
@@ -0,0 +1,92 @@
+# bench_queue.py
+#
+# Benchmarks the per-department triage queue against a naive
+# "sort the whole waiting list" read, at tens of thousands of patients.
+# Both backends are measured: the in-process heap (TriageQueue) and the
+# shared SQLite file used under gunicorn (SQLiteTriageQueue). The
+# per-operation cost should stay flat as n_patients grows.
+#
+# Usage: python bench_queue.py [n_patients] [n_departments]
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+from triage_queue import TriageQueue, SQLiteTriageQueue
+
+
+def timed(label, n, fn):
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<34} {elapsed * 1e6 / n:9.2f} us/op  ({n} ops)")
+    return elapsed
+
+
+def run(queue, patients, departments, rng):
+    n_patients = len(patients)
+    n_departments = len(departments)
+
+    def enqueue_all():
+        for pid, dept, risk, arrival in patients:
+            queue.enqueue(pid, dept, risk, arrival)
+
+    timed("enqueue", n_patients, enqueue_all)
+
+    # Enqueue cost once the queue is already full
+    late = 2_000
+    timed("enqueue (queue full)", late, lambda: [
+        queue.enqueue(f"late-{i}", departments[i % n_departments], rng.randint(0, 100)) for i in range(late)
+    ])
+
+    reads = 2_000
+    timed("top-10 per department", reads, lambda: [queue.top(departments[i % n_departments], 10) for i in range(reads)])
+
+    updates = 20_000
+    def reprioritize():
+        for i in range(updates):
+            pid = patients[rng.randrange(n_patients)][0]
+            queue.reprioritize(pid, rng.randint(0, 100))
+
+    timed("re-prioritize", updates, reprioritize)
+    timed("top-10 after updates", reads, lambda: [queue.top(departments[i % n_departments], 10) for i in range(reads)])
+
+    removals = min(10_000, n_patients // 4)
+    timed("remove", removals, lambda: [queue.remove(patients[i][0]) for i in range(removals)])
+
+    pops = min(10_000, n_patients // 4)
+    timed("pop", pops, lambda: [queue.pop(departments[i % n_departments]) for i in range(pops)])
+
+    print(f"still waiting: {queue.size()}")
+
+
+def main(n_patients=50_000, n_departments=10):
+    rng = random.Random(0)
+    departments = [f"dept-{i}" for i in range(n_departments)]
+    patients = [
+        (f"patient-{i}", rng.choice(departments), rng.randint(0, 100), float(i))
+        for i in range(n_patients)
+    ]
+
+    print("== in-process heap (TriageQueue)")
+    run(TriageQueue(), patients, departments, rng)
+
+    reads = 100
+    def naive():
+        for i in range(reads):
+            dept = departments[i % n_departments]
+            waiting = [p for p in patients if p[1] == dept]
+            sorted(waiting, key=lambda p: (-p[2], p[3]))[:10]
+
+    timed("naive scan + sort top-10", reads, naive)
+
+    print("\n== shared SQLite file (SQLiteTriageQueue)")
+    with tempfile.TemporaryDirectory() as directory:
+        run(SQLiteTriageQueue(os.path.join(directory, "queue.sqlite3")), patients, departments, rng)
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    main(*args)
@@ -0,0 +1,82 @@
+# bench_shap.py
+#
+# Compares the sampled KernelExplainer (nsamples=60, as used per request)
+# against the exact 64-coalition engine: per-call latency and attribution
+# error. Exact values are the reference; KernelExplainer with a full
+# enumeration budget is checked against them as a sanity check.
+#
+# Usage: python bench_shap.py [n_samples]
+
+import sys
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from exact_shap import ExactShapExplainer
+from registry import artifact_path
+
+FEATURES = ["Age", "Sex", "Heart_Rate", "Systolic_BP", "Diastolic_BP", "Temperature"]
+
+
+def timed(fn, repeats):
+    times = []
+    out = None
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t0)
+    return out, np.array(times) * 1000.0
+
+
+def main(n_samples=20):
+    mlp = joblib.load(artifact_path("mlp_regressor.pkl"))
+    scaler = joblib.load(artifact_path("scaler.pkl"))
+    kernel = joblib.load(artifact_path("shap_explainer.pkl"))
+    exact = ExactShapExplainer.from_kernel_explainer(mlp, kernel)
+
+    data = pd.read_csv(artifact_path("synthetic_medical_data.csv"))
+    rows = data[FEATURES].sample(n_samples, random_state=0)
+    X = scaler.transform(rows)
+    preds = mlp.predict(X)
+
+    kernel_ms, exact_ms = [], []
+    kernel_err, full_err, kernel_add, exact_add = [], [], [], []
+
+    for i in range(n_samples):
+        x = X[i:i + 1]
+
+        phi_exact, t = timed(lambda: exact.shap_values(x), 5)
+        exact_ms.append(np.median(t))
+
+        phi_kernel, t = timed(lambda: kernel.shap_values(x, nsamples=60, silent=True), 3)
+        kernel_ms.append(np.median(t))
+
+        phi_full = kernel.shap_values(x, nsamples=2 ** len(FEATURES) + 2, silent=True)
+
+        kernel_err.append(np.abs(phi_kernel - phi_exact).max())
+        full_err.append(np.abs(phi_full - phi_exact).max())
+        kernel_add.append(abs(phi_kernel.sum() + kernel.expected_value - preds[i]))
+        exact_add.append(abs(phi_exact.sum() + exact.expected_value - preds[i]))
+
+    _, batch_t = timed(lambda: exact.shap_values(X), 3)
+
+    print(f"Samples: {n_samples}, background rows: {exact.n_background}\n")
+    print("Latency per explanation (ms, median over samples)")
+    print(f"  kernel (nsamples=60): {np.median(kernel_ms):8.2f}")
+    print(f"  exact (64 coalitions): {np.median(exact_ms):7.2f}")
+    print(f"  exact, batched:       {np.median(batch_t) / n_samples:8.2f}")
+    print(f"  speedup:              {np.median(kernel_ms) / np.median(exact_ms):8.1f}x\n")
+
+    print("Max |phi - phi_exact| per sample")
+    print(f"  kernel (nsamples=60):  mean {np.mean(kernel_err):.2e}  max {np.max(kernel_err):.2e}")
+    print(f"  kernel (full enum):    mean {np.mean(full_err):.2e}  max {np.max(full_err):.2e}\n")
+
+    print("Additivity error |sum(phi) + base - f(x)|")
+    print(f"  kernel (nsamples=60):  max {np.max(kernel_add):.2e}")
+    print(f"  exact:                 max {np.max(exact_add):.2e}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,331 @@
+# bench_triage.py
+#
+# End-to-end benchmarks for the triage path, run offline against the
+# fakes in fake_services.py (Supabase + Groq with configurable latency).
+#
+#   python bench_triage.py micro [--iterations 200]
+#   python bench_triage.py load  [--concurrency 1 8 32] [--requests 200]
+#   python bench_triage.py all   --out results.json [--baseline baseline.json]
+#   python bench_triage.py compare results.json baseline.json [--threshold 0.2]
+#
+# micro: per-call latency of compute_risk_score, run_mlp_inference /
+#        run_vitals_inference and generate_explanation_structured.
+# load:  drives the FastAPI app in-process (httpx ASGI transport) at fixed
+#        concurrency levels; reports throughput, end-to-end p50/p95/p99 and
+#        the same percentiles per traced stage (see tracing.py).
+#
+# Results are JSON. With --baseline (or `compare`), latencies that grew
+# and throughput that dropped by more than --threshold are flagged as
+# regressions and the exit status is 1.
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import subprocess
+
+import numpy as np
+
+from fake_services import start_fakes
+
+FEATURES = ["Age", "Sex", "Heart_Rate", "Systolic_BP", "Diastolic_BP", "Temperature"]
+
+SYMPTOMS = [
+    "Severe crushing chest pain radiating to the left arm with sweating",
+    "Mild sore throat and runny nose for two days",
+    "Sudden weakness on the right side of the body and slurred speech",
+    "High fever, stiff neck and confusion since this morning",
+    "Itchy rash on both forearms after gardening",
+    "Shortness of breath and wheezing, history of asthma",
+    "Twisted ankle while running, mild swelling, can walk",
+    "Vomiting blood and feeling lightheaded",
+]
+
+
+def summarize(samples_ms):
+    if not samples_ms:
+        return {"count": 0}
+    a = np.asarray(samples_ms)
+    return {
+        "count": int(a.size),
+        "mean_ms": float(a.mean()),
+        "p50_ms": float(np.percentile(a, 50)),
+        "p95_ms": float(np.percentile(a, 95)),
+        "p99_ms": float(np.percentile(a, 99)),
+        "max_ms": float(a.max()),
+    }
+
+
+def random_vitals(rng):
+    return {
+        "Age": rng.randint(18, 90),
+        "Sex": rng.randint(0, 1),
+        "Heart_Rate": rng.randint(50, 160),
+        "Systolic_BP": rng.randint(90, 200),
+        "Diastolic_BP": rng.randint(55, 120),
+        "Temperature": round(rng.uniform(36.0, 40.0), 1),
+    }
+
+
+def _timed(fn, iterations, warmup=3):
+    for _ in range(warmup):
+        fn(0)
+    samples = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - started) * 1000.0)
+    return summarize(samples)
+
+# ----------------------------
+# Microbenchmarks
+# ----------------------------
+
+def run_micro(iterations=200):
+    import pandas as pd
+    from zeroshot import compute_risk_score
+    from mplinf import run_mlp_inference, run_vitals_inference
+    from explain import generate_explanation_structured
+    from registry import registry
+
+    registry.warm_up()
+    rng = random.Random(0)
+    vitals = [random_vitals(rng) for _ in range(iterations)]
+    frames = [pd.DataFrame([v], columns=FEATURES) for v in vitals]
+
+    explain_args = []
+    for i in range(min(iterations, 50)):
+        text = SYMPTOMS[i % len(SYMPTOMS)]
+        prediction, contributions, base_value = run_vitals_inference(vitals[i])
+        zeroshot = compute_risk_score(text)
+        explain_args.append((
+            text, zeroshot, prediction, contributions,
+            0.5 * zeroshot[0] + 0.5 * prediction, base_value, vitals[i]
+        ))
+
+    results = {
+        "compute_risk_score": _timed(
+            lambda i: compute_risk_score(SYMPTOMS[i % len(SYMPTOMS)]), iterations
+        ),
+        "run_mlp_inference": _timed(
+            lambda i: run_mlp_inference(frames[i % len(frames)]), iterations
+        ),
+        "run_vitals_inference": _timed(
+            lambda i: run_vitals_inference(vitals[i % len(vitals)]), iterations
+        ),
+        "generate_explanation_structured": _timed(
+            lambda i: generate_explanation_structured(*explain_args[i % len(explain_args)]),
+            min(iterations, 50)
+        ),
+    }
+
+    for name, r in results.items():
+        print(f"{name:<32} p50 {r['p50_ms']:9.2f} ms  p95 {r['p95_ms']:9.2f} ms  p99 {r['p99_ms']:9.2f} ms")
+    return results
+
+# ----------------------------
+# Load test
+# ----------------------------
+
+async def _drive(app, concurrency, n_requests, rng):
+    import httpx
+
+    payloads = []
+    for i in range(n_requests):
+        v = random_vitals(rng)
+        payloads.append({
+            # Unique text per request (and level) so the result caches are not hit
+            "symptoms": f"{SYMPTOMS[i % len(SYMPTOMS)]} (case {concurrency}-{i})",
+            "heart_rate": v["Heart_Rate"],
+            "systolic_bp": v["Systolic_BP"],
+            "diastolic_bp": v["Diastolic_BP"],
+            "temperature": v["Temperature"],
+            "patient_id": f"bench-{rng.randint(0, 10_000)}",
+        })
+
+    latencies, errors = [], 0
+    cursor = iter(payloads)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+
+        async def worker():
+            nonlocal errors
+            for payload in cursor:
+                started = time.perf_counter()
+                response = await client.post("/triage", json=payload)
+                latencies.append((time.perf_counter() - started) * 1000.0)
+                if response.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return latencies, errors, elapsed
+
+
+def run_load(concurrency_levels=(1, 8, 32), n_requests=200):
+    import main
+    from registry import registry
+    from tracing import add_trace_listener, remove_trace_listener
+
+    registry.warm_up()
+
+    # One event loop for every level: the async Groq client's pooled
+    # connections belong to the loop that opened them
+    async def run_levels():
+        results = {}
+        for concurrency in concurrency_levels:
+            stages = {}
+
+            def collect(route, seconds, trace):
+                if route == "/triage":
+                    for stage, ms in trace.breakdown_ms().items():
+                        stages.setdefault(stage, []).append(ms)
+
+            add_trace_listener(collect)
+            try:
+                latencies, errors, elapsed = await _drive(
+                    main.app, concurrency, n_requests, random.Random(concurrency)
+                )
+            finally:
+                remove_trace_listener(collect)
+
+            results[f"c{concurrency}"] = {
+                "concurrency": concurrency,
+                "requests": n_requests,
+                "errors": errors,
+                "throughput_rps": n_requests / elapsed,
+                "latency": summarize(latencies),
+                "stages": {stage: summarize(samples) for stage, samples in sorted(stages.items())},
+            }
+        return results
+
+    results = asyncio.run(run_levels())
+
+    for result in results.values():
+        lat = result["latency"]
+        print(f"\nconcurrency {result['concurrency']:>3}: {result['throughput_rps']:8.1f} req/s, "
+              f"p50 {lat['p50_ms']:.1f} ms, p95 {lat['p95_ms']:.1f} ms, p99 {lat['p99_ms']:.1f} ms, "
+              f"errors {result['errors']}")
+        for stage, s in result["stages"].items():
+            print(f"  {stage:<20} p50 {s['p50_ms']:9.2f}  p95 {s['p95_ms']:9.2f}  p99 {s['p99_ms']:9.2f} ms")
+
+    return results
+
+# ----------------------------
+# Baseline comparison
+# ----------------------------
+
+def _metrics(results):
+    """Flattens results into {metric path: (value, higher_is_better)}."""
+    flat = {}
+    for name, r in results.get("micro", {}).items():
+        for p in ("p50_ms", "p95_ms"):
+            if p in r:
+                flat[f"micro.{name}.{p}"] = (r[p], False)
+    for level, r in results.get("load", {}).items():
+        flat[f"load.{level}.throughput_rps"] = (r["throughput_rps"], True)
+        for p in ("p50_ms", "p95_ms", "p99_ms"):
+            if p in r["latency"]:
+                flat[f"load.{level}.{p}"] = (r["latency"][p], False)
+        for stage, s in r.get("stages", {}).items():
+            if "p95_ms" in s:
+                flat[f"load.{level}.stage.{stage}.p95_ms"] = (s["p95_ms"], False)
+    return flat
+
+
+def compare(results, baseline, threshold=0.2):
+    """
+    Returns the list of regressions: metrics present in both runs that got
+    worse by more than `threshold` (relative).
+    """
+
+    current, previous = _metrics(results), _metrics(baseline)
+    regressions = []
+
+    print(f"\n{'metric':<52} {'baseline':>10} {'current':>10} {'change':>8}")
+    for key in sorted(set(current) & set(previous)):
+        value, higher_is_better = current[key]
+        base, _ = previous[key]
+        if base == 0:
+            continue
+        change = (value - base) / base
+        worse = -change if higher_is_better else change
+        flag = worse > threshold
+        if flag:
+            regressions.append({"metric": key, "baseline": base, "current": value, "change": change})
+        print(f"{key:<52} {base:>10.2f} {value:>10.2f} {change:>+7.0%}{'  REGRESSION' if flag else ''}")
+
+    print(f"\n{len(regressions)} regression(s) over {threshold:.0%}")
+    return regressions
+
+# ----------------------------
+# CLI
+# ----------------------------
+
+def _meta(args):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "zeroshot_backend": os.getenv("ZEROSHOT_BACKEND", "pytorch"),
+        "shap_engine": os.getenv("SHAP_ENGINE", "exact"),
+        "supabase_latency_ms": args.supabase_latency_ms,
+        "groq_latency_ms": args.groq_latency_ms,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Triage benchmarks")
+    parser.add_argument("command", choices=["micro", "load", "all", "compare"])
+    parser.add_argument("files", nargs="*", help="compare: results.json baseline.json")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--supabase-latency-ms", type=float, default=10.0)
+    parser.add_argument("--groq-latency-ms", type=float, default=200.0)
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--baseline", help="baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        if len(args.files) != 2:
+            parser.error("compare needs results.json and baseline.json")
+        with open(args.files[0]) as f:
+            results = json.load(f)
+        with open(args.files[1]) as f:
+            baseline = json.load(f)
+        sys.exit(1 if compare(results, baseline, args.threshold) else 0)
+
+    # Fakes must be up (and the env pointed at them) before main/explain import
+    start_fakes(args.supabase_latency_ms, args.groq_latency_ms)
+
+    results = {"meta": _meta(args)}
+    if args.command in ("micro", "all"):
+        results["micro"] = run_micro(args.iterations)
+    if args.command in ("load", "all"):
+        results["load"] = run_load(args.concurrency, args.requests)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        sys.exit(1 if compare(results, baseline, args.threshold) else 0)
@@ -0,0 +1,237 @@
+# cache.py
+#
+# Content-addressed result cache for triage assessments.
+#
+# Each tier is an in-memory LRU with per-entry TTL, optionally backed by a
+# SQLite file so entries survive restarts. Keys are SHA-256 digests of the
+# normalized symptom text and/or the vitals tuple, so identical resubmits
+# (kiosk retries, dashboard refreshes) hit regardless of whitespace/case.
+
+import os
+import json
+import time
+import pickle
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+FEATURES = ["Age", "Sex", "Heart_Rate", "Systolic_BP", "Diastolic_BP", "Temperature"]
+
+_MISSING = object()
+
+# --------------------------------------------------
+# Keys
+# --------------------------------------------------
+
+def _digest(payload):
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def normalize_text(text):
+    return " ".join((text or "").split()).casefold()
+
+
+def text_key(text):
+    return _digest("text:" + normalize_text(text))
+
+
+def vitals_key(vitals, model_version=None):
+    # Keyed by model version too, so a hot-swapped model never serves the
+    # previous model's cached outputs
+    values = []
+    for name in FEATURES:
+        v = vitals.get(name)
+        values.append(None if v is None else round(float(v), 4))
+    prefix = f"vitals@{model_version}:" if model_version else "vitals:"
+    return _digest(prefix + json.dumps(values))
+
+
+def combined_key(text, vitals, model_version=None):
+    return _digest(text_key(text) + vitals_key(vitals, model_version))
+
+# --------------------------------------------------
+# Disk backend
+# --------------------------------------------------
+
+class SQLiteBackend:
+
+    def __init__(self, path, maxsize):
+        self.path = path
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value BLOB, expires REAL, accessed REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache(accessed)")
+
+    def get(self, key, now):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return _MISSING
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return _MISSING
+            self._conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        return pickle.loads(row[0]), row[1]
+
+    def set(self, key, value, expires, now):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                (key, blob, expires, now)
+            )
+            self._conn.execute("DELETE FROM cache WHERE expires <= ?", (now,))
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                " SELECT key FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,)
+            )
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+
+# --------------------------------------------------
+# Cache tier
+# --------------------------------------------------
+
+class TTLCache:
+
+    def __init__(self, name, maxsize=1024, ttl=3600.0, disk_path=None, disk_maxsize=None):
+        """
+        Args:
+            name (str): Tier name, used in stats.
+            maxsize (int): Max in-memory entries (LRU eviction beyond this).
+            ttl (float): Seconds an entry stays valid.
+            disk_path (str | None): Optional SQLite file for a persistent tier.
+            disk_maxsize (int | None): Max on-disk entries (defaults to 10x maxsize).
+        """
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.disk = None
+        if disk_path:
+            self.disk = SQLiteBackend(disk_path, disk_maxsize or maxsize * 10)
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                self.expirations += 1
+
+        if self.disk is not None:
+            entry = self.disk.get(key, now)
+            if entry is not _MISSING:
+                value, expires = entry
+                with self._lock:
+                    self.disk_hits += 1
+                    self._store(key, value, expires)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def set(self, key, value):
+        now = time.time()
+        expires = now + self.ttl
+        with self._lock:
+            self._store(key, value, expires)
+        if self.disk is not None:
+            self.disk.set(key, value, expires, now)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def _store(self, key, value, expires):
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "persistent": self.disk is not None,
+            }
+
+# --------------------------------------------------
+# Triage tiers
+# --------------------------------------------------
+# TRIAGE_CACHE=0        -> disable caching
+# TRIAGE_CACHE_TTL      -> seconds (default 3600)
+# TRIAGE_CACHE_SIZE     -> in-memory entries per tier (default 2048)
+# TRIAGE_CACHE_DIR      -> enable the on-disk tier under this directory
+
+TRIAGE_CACHE = os.getenv("TRIAGE_CACHE", "1") == "1"
+TRIAGE_CACHE_TTL = float(os.getenv("TRIAGE_CACHE_TTL", "3600"))
+TRIAGE_CACHE_SIZE = int(os.getenv("TRIAGE_CACHE_SIZE", "2048"))
+TRIAGE_CACHE_DIR = os.getenv("TRIAGE_CACHE_DIR")
+
+
+def _make_tier(name):
+    disk_path = None
+    if TRIAGE_CACHE_DIR:
+        os.makedirs(TRIAGE_CACHE_DIR, exist_ok=True)
+        disk_path = os.path.join(TRIAGE_CACHE_DIR, f"{name}.sqlite3")
+    return TTLCache(name, TRIAGE_CACHE_SIZE, TRIAGE_CACHE_TTL, disk_path)
+
+
+zeroshot_cache = _make_tier("zeroshot")
+vitals_cache = _make_tier("vitals")
+explanation_cache = _make_tier("explanation")
+
+
+def cache_stats():
+    return {
+        "enabled": TRIAGE_CACHE,
+        "tiers": [t.stats() for t in (zeroshot_cache, vitals_cache, explanation_cache)]
+    }
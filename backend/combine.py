@@ -1,8 +1,110 @@
+import os
 import json
-import pandas as pd
-from zeroshot import compute_risk_score
-from mplinf import run_mlp_inference
-from explain import generate_explanation_structured
+import time
+import asyncio
+import inspect
+import contextvars
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from zeroshot import compute_risk_score, batcher, ZEROSHOT_MAX_BATCH, ZEROSHOT_SERVER
+from mplinf import run_vitals_inference, run_vitals_inference_approx
+from registry import registry
+from explain import (
+    generate_explanation_structured,
+    generate_explanation_structured_async,
+    generate_explanation_template,
+    build_shap_payload,
+    select_department_async,
+    stream_explanation_async
+)
+from cache import (
+    TRIAGE_CACHE,
+    zeroshot_cache,
+    vitals_cache,
+    explanation_cache,
+    text_key,
+    vitals_key,
+    combined_key
+)
+from tracing import span
+
+# Bounded pool for CPU-bound model work on the async path
+MODEL_WORKERS = int(os.getenv("MODEL_WORKERS", "4"))
+model_executor = ThreadPoolExecutor(
+    max_workers=MODEL_WORKERS,
+    thread_name_prefix="model"
+)
+
+
+# ----------------------------
+# Cached Model Calls
+# ----------------------------
+
+def _zeroshot_cached(text):
+    if not TRIAGE_CACHE:
+        with span("zeroshot"):
+            return compute_risk_score(text)
+
+    key = text_key(text)
+    zeroshot_score = zeroshot_cache.get(key)
+    if zeroshot_score is None:
+        with span("zeroshot"):
+            zeroshot_score = compute_risk_score(text)
+        zeroshot_cache.set(key, zeroshot_score)
+    return zeroshot_score
+
+
+def _vitals_cached(vitals, model):
+    key = vitals_key(vitals, model.version) if TRIAGE_CACHE else None
+    if key is not None:
+        hit = vitals_cache.get(key)
+        if hit is not None:
+            return hit
+
+    prediction, contributions, base_value = run_vitals_inference(vitals, model)
+    result = (
+        float(prediction),
+        {k: float(v) for k, v in contributions.items()},
+        float(base_value)
+    )
+
+    if key is not None:
+        vitals_cache.set(key, result)
+    return result
+
+
+def _vitals_approx(vitals, model):
+    # A cached exact result is as cheap as the approximation
+    if TRIAGE_CACHE:
+        hit = vitals_cache.get(vitals_key(vitals, model.version))
+        if hit is not None:
+            return hit
+
+    prediction, contributions, base_value = run_vitals_inference_approx(vitals, model)
+    return (
+        float(prediction),
+        {k: float(v) for k, v in contributions.items()},
+        float(base_value)
+    )
+
+
+async def _vitals_model():
+    # Pinned once per request, so a hot-swap mid-request never mixes
+    # versions; the first load is kept off the event loop
+    if registry.is_loaded("vitals"):
+        return registry.get("vitals")
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(model_executor, registry.get, "vitals")
+
+
+async def _before(awaitable, deadline):
+    """Result of awaitable, or None (and it is cancelled) if the deadline passes first."""
+    if deadline is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, max(0.0, deadline - time.perf_counter()))
+    except asyncio.TimeoutError:
+        return None
 
 
 def run_combined_risk_assessment(text: str, vitals: dict):
@@ -15,17 +117,24 @@ def run_combined_risk_assessment(text: str, vitals: dict):
             Age, Sex, Heart_Rate, Systolic_BP, Diastolic_BP, Temperature
 
     Returns:
-        dict: Final structured JSON output
+        dict: Final structured JSON output, with the "model_version" used
     """
 
+    model = registry.get("vitals")
+
+    result_key = combined_key(text, vitals, model.version) if TRIAGE_CACHE else None
+    if result_key is not None:
+        cached = explanation_cache.get(result_key)
+        if cached is not None:
+            return cached
+
     # ----------------------------
     # Run Models
     # ----------------------------
 
-    zeroshot_score = compute_risk_score(text)
+    zeroshot_score = _zeroshot_cached(text)
 
-    vitals_df = pd.DataFrame([vitals])
-    vitals_score, contributions, base_value = run_mlp_inference(vitals_df)
+    vitals_score, contributions, base_value = _vitals_cached(vitals, model)
 
     final_score = 0.5 * zeroshot_score[0] + 0.5 * vitals_score
 
@@ -42,5 +151,238 @@ def run_combined_risk_assessment(text: str, vitals: dict):
         base_value,
         vitals
     )
+    final_json["model_version"] = model.version
+
+    if result_key is not None:
+        explanation_cache.set(result_key, final_json)
+
+    return final_json
+
+
+def _submit_zeroshot(text):
+    # With batching on, the batcher's own worker runs the model, so no
+    # executor thread is held while the request waits for its batch.
+    # Same for the shared inference server, which answers with a future.
+    if ZEROSHOT_SERVER:
+        return registry.get("zeroshot_server").submit(text)
+    if ZEROSHOT_MAX_BATCH > 1:
+        return batcher.submit(text)
+    return model_executor.submit(compute_risk_score, text)
+
+
+async def _zeroshot_cached_async(text):
+    key = text_key(text) if TRIAGE_CACHE else None
+    if key is not None:
+        zeroshot_score = zeroshot_cache.get(key)
+        if zeroshot_score is not None:
+            return zeroshot_score
+
+    with span("zeroshot"):
+        zeroshot_score = await asyncio.wrap_future(_submit_zeroshot(text))
+
+    if key is not None:
+        zeroshot_cache.set(key, zeroshot_score)
+    return zeroshot_score
+
+
+async def _run_models_async(text, vitals, tier="full", deadline=None):
+    """
+    Shared first half of the async paths: pins the vitals model, checks
+    the triage cache, and runs the zero-shot and vitals stages for `tier`.
+    The zero-shot model starts immediately, while `vitals` may still be
+    resolving; a zero-shot score not ready by the deadline steps the
+    request down to "vitals_only".
+
+    Returns:
+        (vitals, model, result_key, cached_result, scores, tier) where
+        scores is (zeroshot_score, vitals_score, contributions, base_value),
+        zeroshot_score None for vitals_only, and scores is None when
+        cached_result is set.
+    """
+
+    loop = asyncio.get_running_loop()
+
+    zeroshot_task = None
+    if tier != "vitals_only":
+        zeroshot_task = asyncio.ensure_future(_zeroshot_cached_async(text))
+
+    try:
+        model = await _vitals_model()
+        if inspect.isawaitable(vitals):
+            vitals = await vitals
+
+        # A cached full result beats any degraded one
+        result_key = combined_key(text, vitals, model.version) if TRIAGE_CACHE else None
+        if result_key is not None:
+            cached = explanation_cache.get(result_key)
+            if cached is not None:
+                if zeroshot_task is not None:
+                    zeroshot_task.cancel()
+                return vitals, model, result_key, cached, None, "full"
+
+        # run_in_executor does not carry contextvars; copy them so the
+        # vitals spans land on this request's trace
+        vitals_fn = _vitals_cached if tier in ("full", "no_llm") else _vitals_approx
+        vitals_score, contributions, base_value = await loop.run_in_executor(
+            model_executor, contextvars.copy_context().run, vitals_fn, vitals, model
+        )
+
+        zeroshot_score = None
+        if zeroshot_task is not None:
+            zeroshot_score = await _before(zeroshot_task, deadline)
+            if zeroshot_score is None:
+                tier = "vitals_only"
+    except BaseException:
+        if zeroshot_task is not None:
+            zeroshot_task.cancel()
+        raise
+
+    return vitals, model, result_key, None, (zeroshot_score, vitals_score, contributions, base_value), tier
+
+
+def _final_score(zeroshot_score, vitals_score):
+    if zeroshot_score is None:
+        return vitals_score
+    return 0.5 * zeroshot_score[0] + 0.5 * vitals_score
+
+
+async def run_combined_risk_assessment_async(text: str, vitals, tier="full", deadline=None):
+    """
+    Async variant of run_combined_risk_assessment.
+
+    The zero-shot model starts immediately, while `vitals` may still be
+    resolving (e.g. a pending patient lookup). Model work runs on the
+    bounded model executor, and both LLM calls are issued concurrently.
+
+    With a tier below "full" (see admission.py) the LLM calls, exact SHAP
+    or the zero-shot model are skipped. With a deadline, a zero-shot score
+    or LLM explanation that is not ready in time is dropped and the
+    result steps down to the next tier that is.
+
+    Args:
+        text (str): Patient symptom description
+        vitals (dict | awaitable): Vitals dict, or an awaitable returning it
+        tier (str): Quality tier to start from (admission.TIERS)
+        deadline (float | None): time.perf_counter() value to finish by
+
+    Returns:
+        dict: Final structured JSON output, with the "tier" served and
+            the "model_version" used
+    """
+
+    vitals, model, result_key, cached, scores, tier = await _run_models_async(text, vitals, tier, deadline)
+    if cached is not None:
+        return {**cached, "tier": tier}
+
+    zeroshot_score, vitals_score, contributions, base_value = scores
+    final_score = _final_score(zeroshot_score, vitals_score)
+
+    args = (text, zeroshot_score, vitals_score, contributions, final_score, base_value, vitals)
+
+    final_json = None
+    if tier == "full":
+        final_json = await _before(generate_explanation_structured_async(*args), deadline)
+        if final_json is None:
+            tier = "no_llm"
+    if final_json is None:
+        final_json = generate_explanation_template(*args)
+    final_json["model_version"] = model.version
+
+    if result_key is not None and tier == "full":
+        explanation_cache.set(result_key, final_json)
+
+    return {**final_json, "tier": tier}
+
+
+def _replay(final_json, tier):
+    yield "result", {**{k: v for k, v in final_json.items() if k != "explainability"}, "tier": tier}
+    yield "token", {"text": final_json["explainability"]}
+    yield "done", {"explainability": final_json["explainability"]}
+
+
+async def stream_combined_risk_assessment(text: str, vitals, tier="full", deadline=None):
+    """
+    Streaming variant of run_combined_risk_assessment_async, with the same
+    tiers and deadline (for the "result" event; the explanation then
+    streams as fast as the LLM writes it).
+
+    Yields (event, data) pairs:
+        ("result", {risk_score, shap, recommended_department, model_version, tier})
+            as soon as the models and department routing are done;
+        ("token", {"text": delta}) per explanation chunk from the LLM;
+        ("done", {"explainability": full_text}).
+
+    A cached result, and any tier below "full" (template explanation),
+    is sent as result + a single token + done.
+    """
+
+    vitals, model, result_key, cached, scores, tier = await _run_models_async(text, vitals, tier, deadline)
+
+    if cached is not None:
+        for event in _replay(cached, tier):
+            yield event
+        return
+
+    zeroshot_score, vitals_score, contributions, base_value = scores
+    final_score = _final_score(zeroshot_score, vitals_score)
+    args = (text, zeroshot_score, vitals_score, contributions, final_score, base_value, vitals)
+
+    if tier != "full":
+        final_json = {**generate_explanation_template(*args), "model_version": model.version}
+        for event in _replay(final_json, tier):
+            yield event
+        return
+
+    risk_score_int = int(np.clip(final_score * 100, 0, 100))
+
+    # The explanation request starts now, alongside department routing
+    # (which may itself call the LLM); its tokens are buffered until the
+    # result event is out.
+    deltas = asyncio.Queue()
+
+    async def produce():
+        try:
+            async for delta in stream_explanation_async(
+                text, zeroshot_score, vitals_score, contributions, risk_score_int
+            ):
+                deltas.put_nowait(delta)
+        finally:
+            deltas.put_nowait(None)
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        department = await _before(select_department_async(text, zeroshot_score, risk_score_int), deadline)
+        if department is None:
+            # The LLM is too slow for this request: no_llm instead
+            producer.cancel()
+            final_json = {**generate_explanation_template(*args), "model_version": model.version}
+            for event in _replay(final_json, "no_llm"):
+                yield event
+            return
+
+        result = {
+            "risk_score": risk_score_int,
+            "shap": build_shap_payload(contributions, final_score, base_value, vitals),
+            "recommended_department": department,
+            "model_version": model.version
+        }
+        yield "result", {**result, "tier": tier}
+
+        parts = []
+        while True:
+            delta = await deltas.get()
+            if delta is None:
+                break
+            parts.append(delta)
+            yield "token", {"text": delta}
+
+        # Re-raises if the LLM stream failed
+        await producer
+    finally:
+        producer.cancel()
+
+    explanation_text = "".join(parts).strip()
+    yield "done", {"explainability": explanation_text}
 
-    return final_json
\ No newline at end of file
+    if result_key is not None:
+        explanation_cache.set(result_key, {**result, "explainability": explanation_text})
\ No newline at end of file
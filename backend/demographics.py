@@ -0,0 +1,207 @@
+# demographics.py
+#
+# Patient demographics (age, gender) cache in front of Supabase.
+#
+# /triage needs age and gender before the vitals model can run, and the
+# same patient is typically triaged several times (re-assessments, queue
+# re-prioritization). Lookups go through a TTLCache tier keyed by
+# patient_id (bounded LRU + TTL, optionally persisted next to the triage
+# caches), so repeat patients cost no round trip. Missing or placeholder
+# ids ("unknown", "null", ...) short-circuit without a query, patients
+# not found are not cached (they may be created moments later), and the
+# queue endpoints prefetch their patients in one bulk `in_` query.
+#
+# When a patient record changes, call invalidate(patient_id) (wired to the
+# Supabase database webhook in main.py and fanned out to every worker by
+# invalidation.py).
+#
+#   DEMOGRAPHICS_CACHE=0       -> disable (every lookup hits Supabase)
+#   DEMOGRAPHICS_CACHE_TTL     -> seconds (default 900)
+#   DEMOGRAPHICS_CACHE_SIZE    -> max cached patients (default 50000)
+
+import os
+import time
+import threading
+
+from cache import TTLCache, TRIAGE_CACHE_DIR
+from tracing import span
+
+DEMOGRAPHICS_CACHE = os.getenv("DEMOGRAPHICS_CACHE", "1") == "1"
+DEMOGRAPHICS_CACHE_TTL = float(os.getenv("DEMOGRAPHICS_CACHE_TTL", "900"))
+DEMOGRAPHICS_CACHE_SIZE = int(os.getenv("DEMOGRAPHICS_CACHE_SIZE", "50000"))
+
+# Placeholder ids the frontend sends for walk-ins; never looked up
+UNKNOWN_IDS = {"", "unknown", "null", "none", "undefined", "anonymous"}
+
+NOT_FOUND = (None, None)
+
+# Supabase `in_` filters are sent in the URL; keep each query bounded
+PREFETCH_CHUNK = 200
+
+
+def is_unknown(patient_id):
+    return patient_id is None or str(patient_id).strip().lower() in UNKNOWN_IDS
+
+
+class DemographicsCache:
+
+    def __init__(self, client, enabled=DEMOGRAPHICS_CACHE, maxsize=DEMOGRAPHICS_CACHE_SIZE,
+                 ttl=DEMOGRAPHICS_CACHE_TTL, disk_dir=TRIAGE_CACHE_DIR):
+        """
+        Args:
+            client: Supabase client (anything with the table().select() API).
+            enabled (bool): When False every lookup goes to Supabase.
+            disk_dir (str | None): Directory for the persistent SQLite tier.
+        """
+        self.client = client
+        self.enabled = enabled
+
+        disk_path = None
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            disk_path = os.path.join(disk_dir, "demographics.sqlite3")
+        self.cache = TTLCache("demographics", maxsize, ttl, disk_path)
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.short_circuits = 0
+        self.not_found = 0
+        self.prefetched = 0
+        self.invalidations = 0
+        self.lookups = 0
+        self.lookup_seconds = 0.0
+
+    def _count(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    # ----------------------------
+    # Supabase
+    # ----------------------------
+
+    def _query(self, patient_ids):
+        started = time.perf_counter()
+        with span("supabase_lookup"):
+            if len(patient_ids) == 1:
+                query = self.client.table("patients").select("patient_id, age, gender") \
+                    .eq("patient_id", patient_ids[0])
+            else:
+                query = self.client.table("patients").select("patient_id, age, gender") \
+                    .in_("patient_id", patient_ids)
+            rows = query.execute().data or []
+        self._count(lookups=1, lookup_seconds=time.perf_counter() - started)
+
+        found = {}
+        for row in rows:
+            value = (row.get("age"), row.get("gender"))
+            found[row["patient_id"]] = value
+            if self.enabled:
+                self.cache.set(row["patient_id"], value)
+        return found
+
+    # ----------------------------
+    # Lookups
+    # ----------------------------
+
+    def cached(self, patient_id):
+        """
+        (age, gender) if the answer is known without a query (cache hit or
+        unknown id), else None. Cheap enough to call on the event loop.
+        """
+        if is_unknown(patient_id):
+            self._count(short_circuits=1)
+            return NOT_FOUND
+        if not self.enabled:
+            return None
+        value = self.cache.get(patient_id)
+        if value is not None:
+            self._count(hits=1)
+            return tuple(value)
+        return None
+
+    def get(self, patient_id):
+        """(age, gender) for one patient; (None, None) if unknown or not found."""
+        value = self.cached(patient_id)
+        if value is not None:
+            return value
+        return self.fetch(patient_id)
+
+    def fetch(self, patient_id):
+        """Cache miss path of get(): one Supabase query (blocking)."""
+        self._count(misses=1)
+        value = self._query([patient_id]).get(patient_id)
+        if value is None:
+            self._count(not_found=1)
+            return NOT_FOUND
+        return value
+
+    def get_many(self, patient_ids):
+        """
+        {patient_id: (age, gender)} for the known ids among patient_ids;
+        cache misses are fetched in bulk.
+        """
+        result = {}
+        todo = []
+        for patient_id in dict.fromkeys(patient_ids):
+            value = self.cached(patient_id)
+            if value is None:
+                todo.append(patient_id)
+            elif value != NOT_FOUND:
+                result[patient_id] = value
+
+        if todo:
+            self._count(misses=len(todo))
+            for start in range(0, len(todo), PREFETCH_CHUNK):
+                chunk = todo[start:start + PREFETCH_CHUNK]
+                found = self._query(chunk)
+                self._count(not_found=len(chunk) - len(found))
+                result.update(found)
+
+        return result
+
+    def prefetch(self, patient_ids):
+        """Warms the cache for patients that are about to be triaged."""
+        if not self.enabled:
+            return 0
+        todo = [
+            pid for pid in dict.fromkeys(patient_ids)
+            if not is_unknown(pid) and self.cache.get(pid) is None
+        ]
+        for start in range(0, len(todo), PREFETCH_CHUNK):
+            self._query(todo[start:start + PREFETCH_CHUNK])
+        self._count(prefetched=len(todo))
+        return len(todo)
+
+    def invalidate(self, patient_id=None):
+        """Drops one patient (or everything) after a record change."""
+        if patient_id is None:
+            self.cache.clear()
+        else:
+            self.cache.delete(patient_id)
+        self._count(invalidations=1)
+
+    # ----------------------------
+    # Stats
+    # ----------------------------
+
+    def stats(self):
+        with self._lock:
+            resolved = self.hits + self.misses
+            mean_lookup_ms = self.lookup_seconds * 1000.0 / self.lookups if self.lookups else 0.0
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "short_circuits": self.short_circuits,
+                "not_found": self.not_found,
+                "prefetched": self.prefetched,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / resolved if resolved else 0.0,
+                "supabase_queries": self.lookups,
+                "mean_lookup_ms": mean_lookup_ms,
+                # Each hit or short-circuit would otherwise have been a query
+                "saved_ms_estimate": (self.hits + self.short_circuits) * mean_lookup_ms,
+                "cache": self.cache.stats(),
+            }
@@ -0,0 +1,413 @@
+# departments.py
+#
+# Department catalog: the one place department ids, names and aliases are
+# resolved.
+#
+# Each load builds an immutable snapshot with
+#   - an id index and a normalized name/alias index (dict lookups, so
+#     "Cardiology", "cardiology.", "Department of Cardiology" and
+#     "cardiac" all resolve in O(1)),
+#   - a character-trigram index for near-miss names ("Cardiolgy",
+#     "Orthopaedic Surgery"), used only when the exact lookup misses.
+#
+# reload() builds the new snapshot off to the side and swaps it in with a
+# single assignment, so readers never see a half-built catalog and never
+# take a lock. Sources:
+#
+#   DEPARTMENTS_SOURCE=csv       -> departments_rows.csv (default)
+#   DEPARTMENTS_SOURCE=supabase  -> the `departments` table
+#   DEPARTMENTS_SOURCES          -> sources POST /departments/reload may switch
+#                                   to (default: DEPARTMENTS_SOURCE only)
+#   DEPARTMENTS_RELOAD_SECONDS   -> poll the source and reload when it
+#                                   changes (0 = only on POST /departments/reload,
+#                                   which main.py broadcasts to every worker)
+#   DEPARTMENT_FUZZY_MIN         -> trigram similarity needed for a fuzzy match
+#
+# Extra aliases can live in an optional `aliases` column ("|"-separated),
+# so a department or alias is added by editing the table, not the code.
+#
+#   python departments.py bench   # lookup cost per path
+
+import os
+import re
+import csv
+import time
+import hashlib
+import logging
+import threading
+
+from registry import registry, artifact_path
+
+logger = logging.getLogger(__name__)
+
+DEPARTMENTS_SOURCE = os.getenv("DEPARTMENTS_SOURCE", "csv").lower()
+DEPARTMENTS_CSV = os.getenv("DEPARTMENTS_CSV") or artifact_path("departments_rows.csv")
+DEPARTMENTS_SOURCES = [
+    s.strip().lower() for s in os.getenv("DEPARTMENTS_SOURCES", DEPARTMENTS_SOURCE).split(",") if s.strip()
+]
+DEPARTMENTS_RELOAD_SECONDS = float(os.getenv("DEPARTMENTS_RELOAD_SECONDS", "0"))
+DEPARTMENT_FUZZY_MIN = float(os.getenv("DEPARTMENT_FUZZY_MIN", "0.6"))
+
+# --------------------------------------------------
+# Built-in aliases (normalized department name -> alternative names)
+# --------------------------------------------------
+
+DEPARTMENT_ALIASES = {
+    "emergency": ["emergency medicine", "emergency room", "er", "ed", "a and e", "casualty", "accident and emergency"],
+    "cardiology": ["cardiac", "cardiac care", "heart", "cardiovascular medicine"],
+    "neurology": ["neuro", "neurosciences"],
+    "pulmonology": ["pulmonary medicine", "respiratory medicine", "chest medicine", "respiratory"],
+    "general medicine": ["internal medicine", "general practice", "gp", "medicine", "family medicine"],
+    "gastroenterology": ["gastro", "gi", "hepatology"],
+    "orthopedics": ["orthopaedics", "ortho", "orthopedic surgery", "orthopaedic surgery"],
+    "ent": ["ear nose and throat", "otolaryngology", "otorhinolaryngology"],
+    "obstetrics": ["maternity", "ob"],
+    "gynecology": ["gynaecology", "obgyn", "ob gyn", "obstetrics and gynecology"],
+    "pediatrics": ["paediatrics", "children", "child health"],
+    "neonatology": ["nicu", "newborn care"],
+    "hematology": ["haematology"],
+    "oncology": ["cancer care", "medical oncology"],
+    "anesthesiology": ["anaesthesiology", "anesthesia", "anaesthesia"],
+    "psychiatry": ["mental health"],
+    "dermatology": ["skin"],
+    "ophthalmology": ["eye", "eyes"],
+    "diabetology": ["diabetes"],
+    "endocrinology": ["endocrine"],
+    "nephrology": ["renal", "kidney"],
+    "dentistry": ["dental"],
+    "allergy and asthma": ["allergy", "allergology"],
+    "physiotherapy": ["physical therapy"],
+    "rehabilitation medicine": ["rehabilitation", "rehab", "physical medicine and rehabilitation"],
+    "toxicology": ["poison control"],
+    "radiology": ["imaging"],
+    "palliative care": ["hospice"],
+}
+
+# Filler words an LLM (or a person) wraps around a department name
+_FILLER = {"the", "department", "dept", "of", "unit", "ward", "clinic", "division"}
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_name(name):
+    """'Department of Allergy & Asthma.' -> 'allergy and asthma'."""
+    text = str(name or "").lower().replace("&", " and ")
+    words = [w for w in _NON_WORD.split(text) if w and w not in _FILLER]
+    return " ".join(words)
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _split_aliases(value):
+    return [a.strip() for a in str(value or "").split("|") if a.strip()]
+
+# --------------------------------------------------
+# Snapshot (immutable once built)
+# --------------------------------------------------
+
+class CatalogSnapshot:
+
+    def __init__(self, rows, source, fingerprint):
+        self.source = source
+        self.fingerprint = fingerprint
+        self.loaded_at = time.time()
+
+        self.departments = []
+        self.by_id = {}
+        self.by_name = {}
+        for row in rows:
+            department = {
+                "department_id": str(row["department_id"]),
+                "name": str(row["name"]).strip(),
+                "description": row.get("description") or "",
+                "aliases": _split_aliases(row.get("aliases")),
+            }
+            self.departments.append(department)
+            self.by_id[department["department_id"]] = department
+
+        # Names first so an alias never shadows a real department name
+        for department in self.departments:
+            self.by_name[normalize_name(department["name"])] = department
+        for department in self.departments:
+            key = normalize_name(department["name"])
+            for alias in DEPARTMENT_ALIASES.get(key, []) + department["aliases"]:
+                self.by_name.setdefault(normalize_name(alias), department)
+
+        # Trigram -> names containing it, over every indexed name and alias
+        self._names = list(self.by_name)
+        self._name_sizes = []
+        self._trigram_index = {}
+        for i, name in enumerate(self._names):
+            grams = _trigrams(name)
+            self._name_sizes.append(len(grams))
+            for gram in grams:
+                self._trigram_index.setdefault(gram, []).append(i)
+
+        # Raw key -> department for keys seen before (ids and names are
+        # seeded), so repeat lookups skip normalization entirely
+        self.resolved = dict(self.by_id)
+        for department in self.departments:
+            self.resolved[department["name"]] = department
+        self._fuzzy_memo = {}
+
+    def remember(self, key, department):
+        if len(self.resolved) < 4096:
+            self.resolved[key] = department
+
+    def fuzzy(self, key, min_score=DEPARTMENT_FUZZY_MIN):
+        """Best trigram (Dice) match for a normalized key, or None."""
+        if key in self._fuzzy_memo:
+            return self._fuzzy_memo[key]
+
+        grams = _trigrams(key)
+        shared = {}
+        for gram in grams:
+            for i in self._trigram_index.get(gram, ()):
+                shared[i] = shared.get(i, 0) + 1
+
+        best, best_score = None, 0.0
+        for i, count in shared.items():
+            score = 2.0 * count / (len(grams) + self._name_sizes[i])
+            if score > best_score:
+                best, best_score = i, score
+
+        match = self.by_name[self._names[best]] if best is not None and best_score >= min_score else None
+        if len(self._fuzzy_memo) < 4096:
+            self._fuzzy_memo[key] = match
+        return match
+
+
+def _fingerprint(rows):
+    digest = hashlib.sha256()
+    for row in sorted(rows, key=lambda r: str(r["department_id"])):
+        digest.update(repr((
+            str(row["department_id"]), row.get("name"), row.get("description"), row.get("aliases")
+        )).encode())
+    return digest.hexdigest()[:16]
+
+# --------------------------------------------------
+# Sources
+# --------------------------------------------------
+
+def read_csv_rows(path=DEPARTMENTS_CSV):
+    with open(path, newline="", encoding="utf-8") as f:
+        return [row for row in csv.DictReader(f) if row.get("department_id") and row.get("name")]
+
+
+def read_supabase_rows(client=None):
+    if client is None:
+        from supabase import create_client
+        client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_ROLE_KEY"))
+    rows = client.table("departments").select("*").execute().data or []
+    return [row for row in rows if row.get("department_id") and row.get("name")]
+
+# --------------------------------------------------
+# Catalog
+# --------------------------------------------------
+
+class DepartmentCatalog:
+
+    def __init__(self, source=DEPARTMENTS_SOURCE, csv_path=DEPARTMENTS_CSV, client=None):
+        """
+        Args:
+            source (str): "csv" or "supabase".
+            csv_path (str): CSV for the csv source.
+            client: Supabase client for the supabase source (created from
+                the environment when None).
+        """
+        self.source = source
+        self.csv_path = csv_path
+        self.client = client
+        self._snapshot = None
+        self._csv_mtime = None
+        self._reload_lock = threading.Lock()
+        self._listeners = []
+        self._poller = None
+        self._poller_pid = None
+        self.reloads = 0
+
+    # ----------------------------
+    # Loading
+    # ----------------------------
+
+    def _read(self, source):
+        if source == "csv":
+            return read_csv_rows(self.csv_path)
+        if source == "supabase":
+            return read_supabase_rows(self.client)
+        raise ValueError(f"Unknown DEPARTMENTS_SOURCE: '{source}' (expected 'csv' or 'supabase')")
+
+    def reload(self, source=None, force=True):
+        """
+        Re-reads the source and swaps in a new snapshot if anything changed
+        (or always, with force). Listeners run after the swap.
+
+        Returns:
+            dict: count, version (content fingerprint) and whether it changed.
+        """
+        source = source or self.source
+        with self._reload_lock:
+            if source == "csv":
+                self._csv_mtime = os.path.getmtime(self.csv_path)
+            rows = self._read(source)
+            if not rows:
+                raise ValueError(f"Department source '{source}' returned no departments")
+
+            fingerprint = _fingerprint(rows)
+            current = self._snapshot
+            changed = current is None or current.fingerprint != fingerprint or current.source != source
+            if changed or force:
+                snapshot = CatalogSnapshot(rows, source, fingerprint)
+                self._snapshot = snapshot  # atomic swap
+                self.source = source
+                self.reloads += 1
+                logger.info("Department catalog loaded from %s: %d departments (%s)",
+                            source, len(snapshot.departments), fingerprint)
+                for listener in list(self._listeners):
+                    try:
+                        listener(self)
+                    except Exception:
+                        logger.exception("Department catalog listener failed")
+
+        return {"count": len(self._snapshot.departments), "version": fingerprint, "changed": changed}
+
+    def reload_if_changed(self):
+        if self.source == "csv" and self._csv_mtime == os.path.getmtime(self.csv_path):
+            return None
+        return self.reload(force=False)
+
+    def start_auto_reload(self, interval=DEPARTMENTS_RELOAD_SECONDS):
+        """
+        Polls the source every `interval` seconds in a daemon thread (once
+        per process; restarted after fork).
+        """
+        pid = os.getpid()
+        if interval <= 0 or (self._poller_pid == pid and self._poller is not None and self._poller.is_alive()):
+            return
+
+        def poll():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload_if_changed()
+                except Exception as e:
+                    logger.warning("Department catalog reload failed, keeping the current one: %s", e)
+
+        self._poller_pid = pid
+        self._poller = threading.Thread(target=poll, name="department-catalog-reload", daemon=True)
+        self._poller.start()
+
+    def add_listener(self, fn):
+        """fn(catalog) runs after every reload that swaps the snapshot."""
+        self._listeners.append(fn)
+
+    @property
+    def snapshot(self):
+        if self._snapshot is None:
+            self.reload()
+        return self._snapshot
+
+    # ----------------------------
+    # Lookups
+    # ----------------------------
+
+    def get(self, key, fuzzy=True):
+        """
+        Department dict for an id, name or alias; near-miss names fall back
+        to the trigram index unless fuzzy=False. None if nothing matches.
+        """
+        snapshot = self.snapshot
+        department = snapshot.resolved.get(key)
+        if department is not None:
+            return department
+
+        name = normalize_name(key)
+        department = snapshot.by_name.get(name)
+        if department is not None:
+            snapshot.remember(key, department)
+        elif fuzzy and name:
+            department = snapshot.fuzzy(name)
+        return department
+
+    def department_id(self, name, fuzzy=True):
+        department = self.get(name, fuzzy)
+        return department["department_id"] if department is not None else None
+
+    def names(self):
+        return [d["name"] for d in self.snapshot.departments]
+
+    def all(self):
+        return list(self.snapshot.departments)
+
+    def frame(self):
+        """DataFrame with department_id, name, description (for the router)."""
+        import pandas as pd
+        return pd.DataFrame(
+            self.snapshot.departments, columns=["department_id", "name", "description"]
+        )
+
+    def stats(self):
+        snapshot = self.snapshot
+        return {
+            "source": snapshot.source,
+            "version": snapshot.fingerprint,
+            "loaded_at": snapshot.loaded_at,
+            "departments": len(snapshot.departments),
+            "indexed_names": len(snapshot.by_name),
+            "reloads": self.reloads,
+            "auto_reload_seconds": DEPARTMENTS_RELOAD_SECONDS,
+        }
+
+
+catalog = DepartmentCatalog()
+
+
+def load_catalog():
+    catalog.snapshot
+    catalog.start_auto_reload()
+    return catalog
+
+
+registry.register("departments", load_catalog)
+
+
+if __name__ == "__main__":
+    import sys
+    import timeit
+
+    if sys.argv[1:] != ["bench"]:
+        sys.exit("usage: python departments.py bench")
+
+    catalog.reload()
+    some_id = catalog.all()[0]["department_id"]
+    cases = [
+        ("id", some_id),
+        ("exact name", "Cardiology"),
+        ("alias", "Ear, Nose and Throat"),
+        ("alias (repeat)", "Otolaryngology Dept"),
+        ("fuzzy (memoized)", "Cardiolgy"),
+    ]
+    for label, key in cases:
+        n = 200_000
+        seconds = timeit.timeit(lambda: catalog.get(key), number=n)
+        print(f"{label:<18} {key!r:<40} -> {catalog.get(key)['name']:<20} {seconds / n * 1e9:8.0f} ns")
+
+    def alias_cold():
+        catalog.snapshot.resolved.pop("Otolaryngology Dept", None)
+        catalog.get("Otolaryngology Dept")
+
+    def fuzzy_cold():
+        catalog.snapshot._fuzzy_memo.clear()
+        catalog.get("Orthopaedic Surgeon")
+
+    n = 20_000
+    seconds = timeit.timeit(alias_cold, number=n)
+    print(f"{'alias (cold)':<18} {'Otolaryngology Dept'!r:<40} -> "
+          f"{catalog.get('Otolaryngology Dept')['name']:<20} {seconds / n * 1e9:8.0f} ns")
+
+    n = 2_000
+    seconds = timeit.timeit(fuzzy_cold, number=n)
+    print(f"{'fuzzy (cold)':<18} {'Orthopaedic Surgeon'!r:<40} -> "
+          f"{catalog.get('Orthopaedic Surgeon')['name']:<20} {seconds / n * 1e9:8.0f} ns")
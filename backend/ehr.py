@@ -0,0 +1,161 @@
+# ehr.py
+#
+# Streaming EHR PDF extraction: the download is spooled to a temporary
+# file in chunks over the pooled "ehr" upstream client (http_client.py,
+# timeout EHR_DOWNLOAD_TIMEOUT), pages are extracted lazily (or a window at a time in a
+# process pool) and extraction stops as soon as the character budget is
+# reached, so pages past the cutoff are never parsed.
+
+import io
+import os
+import time
+import asyncio
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pdfplumber
+
+from http_client import get_upstream
+
+EHR_MAX_CHARS = int(os.getenv("EHR_MAX_CHARS", "20000"))
+EHR_PAGE_WORKERS = int(os.getenv("EHR_PAGE_WORKERS", "0"))  # 0 -> serial
+EHR_MAX_BYTES = int(os.getenv("EHR_MAX_BYTES", str(100 * 1024 * 1024)))
+
+_pool = None
+
+
+def _get_pool(workers):
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=workers)
+    return _pool
+
+# ----------------------------
+# Download
+# ----------------------------
+
+async def download_to_tempfile_async(url, chunk_size=64 * 1024):
+    """
+    Streams url into a named temporary file over the pooled "ehr" upstream
+    client (keep-alive, timeouts, retries). Caller removes the file.
+
+    Returns:
+        (path, bytes_written)
+    """
+
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    written = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            async with get_upstream("ehr").stream("GET", url) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes(chunk_size):
+                    written += len(chunk)
+                    if written > EHR_MAX_BYTES:
+                        raise ValueError(f"EHR file exceeds {EHR_MAX_BYTES} bytes")
+                    out.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+
+    return path, written
+
+# ----------------------------
+# Page extraction
+# ----------------------------
+
+def _extract_page(path, page_number):
+    started = time.perf_counter()
+    with pdfplumber.open(path) as pdf:
+        text = pdf.pages[page_number].extract_text() or ""
+    return text, (time.perf_counter() - started) * 1000.0
+
+
+def _iter_pages_serial(path):
+    with pdfplumber.open(path) as pdf:
+        yield len(pdf.pages)
+        for page in pdf.pages:
+            started = time.perf_counter()
+            text = page.extract_text() or ""
+            elapsed = (time.perf_counter() - started) * 1000.0
+            # Drop the parsed layout objects; we only need the text
+            page.close()
+            yield text, elapsed
+
+
+def _iter_pages_parallel(path, workers):
+    with pdfplumber.open(path) as pdf:
+        n_pages = len(pdf.pages)
+    yield n_pages
+
+    pool = _get_pool(workers)
+    for start in range(0, n_pages, workers):
+        window = [
+            pool.submit(_extract_page, path, i)
+            for i in range(start, min(start + workers, n_pages))
+        ]
+        for future in window:
+            yield future.result()
+
+
+def extract_pdf_text(path, max_chars=EHR_MAX_CHARS, workers=EHR_PAGE_WORKERS):
+    """
+    Extracts text from the PDF at path, stopping once max_chars is reached.
+
+    Returns:
+        (text, report) where report has per-page timings and skip counts.
+    """
+
+    started = time.perf_counter()
+
+    pages = _iter_pages_parallel(path, workers) if workers > 1 else _iter_pages_serial(path)
+    n_pages = next(pages)
+
+    buffer = io.StringIO()
+    chars = 0
+    page_ms = []
+
+    try:
+        for text, elapsed in pages:
+            page_ms.append(round(elapsed, 2))
+            buffer.write(text)
+            chars += len(text)
+            if chars >= max_chars:
+                break
+    finally:
+        pages.close()
+
+    extracted = buffer.getvalue()[:max_chars]
+
+    return extracted, {
+        "pages_total": n_pages,
+        "pages_extracted": len(page_ms),
+        "pages_skipped": n_pages - len(page_ms),
+        "chars": len(extracted),
+        "truncated": chars > max_chars or len(page_ms) < n_pages,
+        "page_ms": page_ms,
+        "extract_ms": round((time.perf_counter() - started) * 1000.0, 2)
+    }
+
+
+async def extract_ehr_from_url_async(url, max_chars=EHR_MAX_CHARS):
+    """
+    Downloads and extracts an EHR PDF: pooled download, extraction in a
+    worker thread.
+
+    Returns:
+        (text, report)
+    """
+
+    started = time.perf_counter()
+    path, size = await download_to_tempfile_async(url)
+    download_ms = (time.perf_counter() - started) * 1000.0
+
+    try:
+        text, report = await asyncio.to_thread(extract_pdf_text, path, max_chars)
+    finally:
+        os.remove(path)
+
+    report["bytes"] = size
+    report["download_ms"] = round(download_ms, 2)
+    return text, report
@@ -0,0 +1,451 @@
+# ehr_features.py
+#
+# Ingest-time EHR features.
+#
+# /extract-ehr runs build_features() once per uploaded document: rule-based
+# extraction of conditions (with simple negation handling), medications and
+# baseline vitals, a fixed-size feature vector, a compact hashed text
+# embedding and a short summary. The result is stored next to the raw text
+# together with a SHA-256 of the text, so re-uploading an unchanged
+# document skips the processing entirely.
+#
+# Triage never touches the raw text: EHRFeatureStore keeps the features in
+# a TTL cache keyed by patient_id (filled write-through at ingest, or with
+# one small select on a miss), so /triage reads them in O(1) and uses the
+# baseline vitals for any vital the request leaves out.
+#
+# Storage (patients table):
+#
+#   alter table patients add column if not exists ehr_hash text;
+#   alter table patients add column if not exists ehr_features jsonb;
+#
+# Without those columns the raw text is still stored and features are only
+# kept in the process cache.
+#
+#   EHR_FEATURES=0             -> skip the ingest stage and the triage lookup
+#   EHR_EMBEDDING_DIM          -> embedding size (default 64)
+#   EHR_SUMMARY=llm            -> summarize with Groq instead of the template
+#   EHR_FEATURES_CACHE_TTL     -> seconds (default 3600)
+#   EHR_FEATURES_CACHE_SIZE    -> max cached patients (default 20000)
+#
+#   python ehr_features.py <file.txt|file.pdf>   # print the features
+
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+
+import numpy as np
+
+from cache import TTLCache, TRIAGE_CACHE_DIR
+from demographics import is_unknown
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+EHR_FEATURES = os.getenv("EHR_FEATURES", "1") == "1"
+EHR_EMBEDDING_DIM = int(os.getenv("EHR_EMBEDDING_DIM", "64"))
+EHR_SUMMARY = os.getenv("EHR_SUMMARY", "template").lower()
+EHR_FEATURES_CACHE_TTL = float(os.getenv("EHR_FEATURES_CACHE_TTL", "3600"))
+EHR_FEATURES_CACHE_SIZE = int(os.getenv("EHR_FEATURES_CACHE_SIZE", "20000"))
+
+# Bumped whenever extraction changes, so stored features are rebuilt
+FEATURES_VERSION = 1
+
+# --------------------------------------------------
+# Vocabularies
+# --------------------------------------------------
+
+# condition -> (group, patterns)
+CONDITIONS = {
+    "hypertension": ("cardiovascular", [r"hypertension", r"\bhtn\b", r"high blood pressure"]),
+    "coronary artery disease": ("cardiovascular", [r"coronary artery disease", r"\bcad\b", r"ischa?emic heart disease", r"\bihd\b", r"angina"]),
+    "myocardial infarction": ("cardiovascular", [r"myocardial infarction", r"heart attack", r"\bstemi\b", r"\bnstemi\b"]),
+    "heart failure": ("cardiovascular", [r"heart failure", r"\bchf\b", r"\bhfref\b", r"\bhfpef\b"]),
+    "atrial fibrillation": ("cardiovascular", [r"atrial fibrillation", r"\bafib\b", r"\ba\.?\s?fib\b"]),
+    "stroke": ("neurological", [r"\bstroke\b", r"\bcva\b", r"cerebrovascular accident", r"\btia\b"]),
+    "epilepsy": ("neurological", [r"epilepsy", r"seizure disorder"]),
+    "diabetes": ("metabolic", [r"diabetes", r"\bt[12]dm\b", r"\bdm\s?(type\s?)?[12]?\b", r"diabetic"]),
+    "hypothyroidism": ("metabolic", [r"hypothyroidism"]),
+    "hyperthyroidism": ("metabolic", [r"hyperthyroidism", r"graves"]),
+    "asthma": ("respiratory", [r"asthma"]),
+    "copd": ("respiratory", [r"\bcopd\b", r"chronic obstructive", r"emphysema", r"chronic bronchitis"]),
+    "tuberculosis": ("respiratory", [r"tuberculosis", r"\btb\b"]),
+    "chronic kidney disease": ("renal", [r"chronic kidney disease", r"\bckd\b", r"renal failure", r"dialysis"]),
+    "liver disease": ("hepatic", [r"cirrhosis", r"hepatitis", r"liver disease"]),
+    "cancer": ("oncology", [r"cancer", r"carcinoma", r"malignan", r"lymphoma", r"leuka?emia", r"chemotherapy"]),
+    "hiv": ("immune", [r"\bhiv\b", r"\baids\b"]),
+    "pregnancy": ("obstetric", [r"pregnan", r"gravida", r"antenatal"]),
+    "anemia": ("hematologic", [r"ana?emia"]),
+    "depression": ("psychiatric", [r"depression", r"depressive disorder"]),
+}
+
+# medication -> (class, patterns)
+MEDICATIONS = {
+    "metformin": ("antidiabetic", [r"metformin", r"glucophage"]),
+    "insulin": ("antidiabetic", [r"insulin", r"glargine", r"lispro", r"aspart"]),
+    "glimepiride": ("antidiabetic", [r"glimepiride", r"gliclazide", r"glipizide"]),
+    "lisinopril": ("antihypertensive", [r"lisinopril", r"enalapril", r"ramipril"]),
+    "losartan": ("antihypertensive", [r"losartan", r"telmisartan", r"valsartan"]),
+    "amlodipine": ("antihypertensive", [r"amlodipine"]),
+    "metoprolol": ("beta blocker", [r"metoprolol", r"atenolol", r"bisoprolol", r"propranolol", r"carvedilol"]),
+    "furosemide": ("diuretic", [r"furosemide", r"lasix", r"hydrochlorothiazide", r"\bhctz\b", r"spironolactone"]),
+    "atorvastatin": ("statin", [r"atorvastatin", r"rosuvastatin", r"simvastatin"]),
+    "aspirin": ("antiplatelet", [r"aspirin", r"ecosprin"]),
+    "clopidogrel": ("antiplatelet", [r"clopidogrel", r"ticagrelor"]),
+    "warfarin": ("anticoagulant", [r"warfarin"]),
+    "apixaban": ("anticoagulant", [r"apixaban", r"rivaroxaban", r"dabigatran", r"enoxaparin", r"heparin"]),
+    "salbutamol": ("bronchodilator", [r"salbutamol", r"albuterol", r"\bventolin\b"]),
+    "inhaled steroid": ("bronchodilator", [r"budesonide", r"fluticasone", r"formoterol", r"tiotropium"]),
+    "prednisone": ("steroid", [r"prednis", r"dexamethasone", r"hydrocortisone"]),
+    "levothyroxine": ("thyroid", [r"levothyroxine", r"thyroxine", r"eltroxin"]),
+    "immunosuppressant": ("immunosuppressant", [r"tacrolimus", r"cyclosporine", r"methotrexate", r"azathioprine", r"mycophenolate"]),
+    "antiretroviral": ("antiretroviral", [r"tenofovir", r"dolutegravir", r"efavirenz", r"lamivudine"]),
+    "ssri": ("antidepressant", [r"sertraline", r"fluoxetine", r"escitalopram", r"citalopram", r"paroxetine"]),
+}
+
+# Fixed-size flag vector (order is part of the stored format)
+FLAG_NAMES = [
+    "cardiovascular", "respiratory", "metabolic", "renal", "neurological",
+    "oncology", "immune", "obstetric", "anticoagulated", "immunosuppressed",
+]
+VITAL_NAMES = ["Heart_Rate", "Systolic_BP", "Diastolic_BP", "Temperature"]
+
+# Negation cue shortly before a mention ("no history of asthma")
+_NEGATION = re.compile(
+    r"\b(no|denies|denied|negative for|without|not known|no known|ruled out|r/o|absence of)\b[^.;\n]{0,40}$"
+)
+
+_VITAL_PATTERNS = {
+    "bp": re.compile(r"\b(?:bp|blood pressure)\s*[:=-]?\s*(\d{2,3})\s*/\s*(\d{2,3})", re.I),
+    "Heart_Rate": re.compile(r"\b(?:hr|heart rate|pulse(?: rate)?|pr)\s*[:=-]?\s*(\d{2,3})\b", re.I),
+    "Temperature": re.compile(r"\b(?:temp(?:erature)?)\s*[:=-]?\s*(\d{2,3}(?:\.\d+)?)\s*°?\s*([cf])?\b", re.I),
+}
+
+_COMPILED = {}
+
+
+def _compiled(vocabulary):
+    key = id(vocabulary)
+    if key not in _COMPILED:
+        _COMPILED[key] = {
+            name: (group, re.compile("|".join(patterns), re.I))
+            for name, (group, patterns) in vocabulary.items()
+        }
+    return _COMPILED[key]
+
+# --------------------------------------------------
+# Extraction
+# --------------------------------------------------
+
+def content_hash(text):
+    normalized = " ".join((text or "").split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def _mentions(text, vocabulary, negation=True):
+    found = {}
+    lowered = text.lower()
+    for name, (group, pattern) in _compiled(vocabulary).items():
+        for match in pattern.finditer(lowered):
+            if negation and _NEGATION.search(lowered[max(0, match.start() - 60):match.start()]):
+                continue
+            found[name] = group
+            break
+    return found
+
+
+def extract_conditions(text):
+    return _mentions(text, CONDITIONS)
+
+
+def extract_medications(text):
+    return _mentions(text, MEDICATIONS, negation=False)
+
+
+def extract_baseline_vitals(text):
+    """Median of every plausible reading per vital (None if never recorded)."""
+    readings = {name: [] for name in VITAL_NAMES}
+
+    for systolic, diastolic in _VITAL_PATTERNS["bp"].findall(text):
+        systolic, diastolic = int(systolic), int(diastolic)
+        if 60 <= systolic <= 260 and 30 <= diastolic <= 160 and diastolic < systolic:
+            readings["Systolic_BP"].append(systolic)
+            readings["Diastolic_BP"].append(diastolic)
+
+    for value in _VITAL_PATTERNS["Heart_Rate"].findall(text):
+        if 25 <= int(value) <= 250:
+            readings["Heart_Rate"].append(int(value))
+
+    for value, unit in _VITAL_PATTERNS["Temperature"].findall(text):
+        value = float(value)
+        if unit.lower() == "f" or (not unit and value > 50):
+            value = (value - 32.0) * 5.0 / 9.0
+        if 33.0 <= value <= 43.0:
+            readings["Temperature"].append(round(value, 1))
+
+    return {
+        name: (float(np.median(values)) if values else None)
+        for name, values in readings.items()
+    }
+
+
+def embed(text, dim=EHR_EMBEDDING_DIM):
+    """Hashed word/bigram embedding: fixed size, no fitted vocabulary."""
+    from sklearn.feature_extraction.text import HashingVectorizer
+
+    vectorizer = HashingVectorizer(
+        n_features=dim, ngram_range=(1, 2), stop_words="english", alternate_sign=True, norm="l2"
+    )
+    vector = vectorizer.transform([text or ""]).toarray().ravel()
+    return [round(float(v), 4) for v in vector]
+
+
+def feature_vector(conditions, medications, baseline):
+    groups = set(conditions.values())
+    classes = set(medications.values())
+    flags = {name: name in groups for name in FLAG_NAMES}
+    flags["anticoagulated"] = "anticoagulant" in classes
+    flags["immunosuppressed"] = "immunosuppressant" in classes or "immune" in groups
+
+    vector = [1.0 if flags[name] else 0.0 for name in FLAG_NAMES]
+    vector += [float(len(conditions)), float(len(medications))]
+    vector += [baseline[name] if baseline[name] is not None else float("nan") for name in VITAL_NAMES]
+    return vector
+
+
+def template_summary(conditions, medications, baseline):
+    parts = []
+    if conditions:
+        parts.append("History of " + ", ".join(sorted(conditions)) + ".")
+    if medications:
+        parts.append("Takes " + ", ".join(sorted(medications)) + ".")
+    recorded = []
+    if baseline["Systolic_BP"] is not None:
+        recorded.append(f"BP {baseline['Systolic_BP']:.0f}/{baseline['Diastolic_BP']:.0f}")
+    if baseline["Heart_Rate"] is not None:
+        recorded.append(f"HR {baseline['Heart_Rate']:.0f}")
+    if baseline["Temperature"] is not None:
+        recorded.append(f"temp {baseline['Temperature']:.1f} C")
+    if recorded:
+        parts.append("Baseline " + ", ".join(recorded) + ".")
+    return " ".join(parts) or "No conditions, medications or vitals found in the record."
+
+
+def llm_summary(text, fallback):
+    from registry import registry
+    try:
+        response = registry.get("groq").chat.completions.create(
+            model=os.getenv("EHR_SUMMARY_MODEL", "llama-3.1-8b-instant"),
+            messages=[
+                {"role": "system", "content": "Summarize this patient record for a triage nurse in at most 3 sentences. Plain text only."},
+                {"role": "user", "content": text[:8000]},
+            ],
+            temperature=0
+        )
+        return response.choices[0].message.content.strip() or fallback
+    except Exception as e:
+        logger.warning("EHR LLM summary failed, using the template: %s", e)
+        return fallback
+
+
+def build_features(text, text_hash=None):
+    """
+    Everything triage needs from one EHR document.
+
+    Returns:
+        dict: content_hash, version, conditions, medications,
+              baseline_vitals, vector, embedding, summary, built_at
+    """
+
+    with span("ehr_features"):
+        conditions = extract_conditions(text)
+        medications = extract_medications(text)
+        baseline = extract_baseline_vitals(text)
+        summary = template_summary(conditions, medications, baseline)
+        if EHR_SUMMARY == "llm":
+            summary = llm_summary(text, summary)
+
+        vector = feature_vector(conditions, medications, baseline)
+        return {
+            "content_hash": text_hash or content_hash(text),
+            "version": FEATURES_VERSION,
+            "conditions": sorted(conditions),
+            "medications": sorted(medications),
+            "baseline_vitals": baseline,
+            # NaN is not valid JSON; missing baselines are stored as null
+            "vector": [None if v != v else v for v in vector],
+            "embedding": embed(text),
+            "summary": summary,
+            "built_at": time.time(),
+        }
+
+
+def is_current(features, text_hash):
+    return bool(features) and features.get("content_hash") == text_hash \
+        and features.get("version") == FEATURES_VERSION
+
+# --------------------------------------------------
+# Store (triage-side reads, ingest-side writes)
+# --------------------------------------------------
+
+class EHRFeatureStore:
+
+    def __init__(self, client, enabled=EHR_FEATURES):
+        self.client = client
+        self.enabled = enabled
+        disk_path = None
+        if TRIAGE_CACHE_DIR:
+            os.makedirs(TRIAGE_CACHE_DIR, exist_ok=True)
+            disk_path = os.path.join(TRIAGE_CACHE_DIR, "ehr_features.sqlite3")
+        self.cache = TTLCache("ehr_features", EHR_FEATURES_CACHE_SIZE, EHR_FEATURES_CACHE_TTL, disk_path)
+
+        # Cleared when the ehr_* columns turn out not to exist
+        self.columns_available = True
+        self._lock = threading.Lock()
+        self.built = 0
+        self.skipped_unchanged = 0
+
+    def cached(self, patient_id):
+        """
+        Features dict ({} if the patient has none) when known without a
+        query, else None.
+        """
+        if not self.enabled or is_unknown(patient_id):
+            return {}
+        value = self.cache.get(patient_id)
+        if value is None and not self.columns_available:
+            return {}
+        return value
+
+    def fetch(self, patient_id):
+        """Cache miss path: one select of the stored features."""
+        try:
+            with span("supabase_lookup"):
+                rows = self.client.table("patients").select("ehr_features") \
+                    .eq("patient_id", patient_id).execute().data or []
+        except Exception as e:
+            if not self._columns_missing(e):
+                # Triage goes on without EHR context; retried next time
+                logger.warning("EHR feature lookup failed for %s: %s", patient_id, e)
+            return {}
+
+        features = (rows[0].get("ehr_features") if rows else None) or {}
+        self.cache.set(patient_id, features)
+        return features
+
+    def get(self, patient_id):
+        features = self.cached(patient_id)
+        return features if features is not None else self.fetch(patient_id)
+
+    def ingest(self, patient_id, text):
+        """
+        Builds (or reuses) the features for a freshly extracted document and
+        stores raw text, hash and features on the patient row.
+
+        Returns:
+            (features, rebuilt)
+        """
+
+        text_hash = content_hash(text)
+        previous = self.get(patient_id) if self.enabled else {}
+        rebuilt = not is_current(previous, text_hash)
+        with self._lock:
+            if rebuilt:
+                self.built += 1
+            else:
+                self.skipped_unchanged += 1
+
+        if not self.enabled:
+            self._update(patient_id, {"ehr_data": text})
+            return None, False
+
+        features = build_features(text, text_hash) if rebuilt else previous
+        if self.columns_available:
+            try:
+                self._update(patient_id, {"ehr_data": text, "ehr_hash": text_hash, "ehr_features": features})
+            except Exception as e:
+                if not self._columns_missing(e):
+                    raise
+                self._update(patient_id, {"ehr_data": text})
+        else:
+            self._update(patient_id, {"ehr_data": text})
+
+        self.cache.set(patient_id, features)
+        return features, rebuilt
+
+    def invalidate(self, patient_id=None):
+        if patient_id is None:
+            self.cache.clear()
+        else:
+            self.cache.delete(patient_id)
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "columns_available": self.columns_available,
+            "built": self.built,
+            "skipped_unchanged": self.skipped_unchanged,
+            "cache": self.cache.stats(),
+        }
+
+    def _update(self, patient_id, values):
+        self.client.table("patients").update(values).eq("patient_id", patient_id).execute()
+
+    def _columns_missing(self, error):
+        """True (and switches to cache-only mode) if error is a missing ehr_* column."""
+        if "ehr_" not in str(error):
+            return False
+        if self.columns_available:
+            logger.warning("patients.ehr_hash / ehr_features unavailable (%s); "
+                           "features are kept in the process cache only", error)
+            self.columns_available = False
+        return True
+
+
+def triage_context(features):
+    """The part of the features returned with a triage result."""
+    if not features:
+        return None
+    return {
+        "content_hash": features.get("content_hash"),
+        "conditions": features.get("conditions", []),
+        "medications": features.get("medications", []),
+        "summary": features.get("summary"),
+    }
+
+
+def fill_missing_vitals(vitals, features):
+    """Replaces missing request vitals with the EHR baseline; returns the names filled."""
+    baseline = (features or {}).get("baseline_vitals") or {}
+    filled = []
+    for name in VITAL_NAMES:
+        if vitals.get(name) is None and baseline.get(name) is not None:
+            vitals[name] = baseline[name]
+            filled.append(name)
+    return filled
+
+
+if __name__ == "__main__":
+    import sys
+    import json
+
+    if len(sys.argv) != 2:
+        sys.exit("usage: python ehr_features.py <file.txt|file.pdf>")
+
+    path = sys.argv[1]
+    if path.lower().endswith(".pdf"):
+        from ehr import extract_pdf_text
+        text, _ = extract_pdf_text(path)
+    else:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            text = f.read()
+
+    started = time.perf_counter()
+    features = build_features(text)
+    elapsed = (time.perf_counter() - started) * 1000.0
+    features["embedding"] = f"<{len(features['embedding'])} floats>"
+    print(json.dumps(features, indent=2))
+    print(f"built in {elapsed:.1f} ms")
@@ -0,0 +1,146 @@
+# exact_shap.py
+#
+# Exact Shapley values for the vitals MLPRegressor.
+#
+# With six features there are only 2^6 = 64 coalitions, so instead of
+# sampling them (KernelExplainer) we enumerate all of them. For each
+# coalition S the value v(S) is the mean model output over the background
+# set with features in S taken from the sample and the rest from the
+# background row (the same interventional definition KernelExplainer
+# estimates). All coalitions x background rows are pushed through the
+# network weights in one NumPy forward pass.
+
+from itertools import product
+from math import factorial
+
+import numpy as np
+
+_ACTIVATIONS = {
+    "identity": lambda z: z,
+    "relu": lambda z: np.maximum(z, 0.0, out=z),
+    "tanh": lambda z: np.tanh(z, out=z),
+    "logistic": lambda z: np.divide(1.0, 1.0 + np.exp(-z), out=z),
+}
+
+
+def mlp_forward(mlp, X):
+    """
+    Forward pass through a fitted sklearn MLPRegressor using its raw
+    coefs_/intercepts_ (no input validation). X is already scaled.
+    """
+    hidden = _ACTIVATIONS[mlp.activation]
+    out = _ACTIVATIONS[mlp.out_activation_]
+
+    a = np.asarray(X, dtype=np.float64)
+    last = len(mlp.coefs_) - 1
+    for i, (W, b) in enumerate(zip(mlp.coefs_, mlp.intercepts_)):
+        a = a @ W
+        a += b
+        a = out(a) if i == last else hidden(a)
+
+    return a[:, 0] if a.shape[1] == 1 else a
+
+
+class ExactShapExplainer:
+
+    def __init__(self, predict, background, max_rows_per_pass=200_000):
+        """
+        Args:
+            predict (callable): Maps an (n, M) scaled matrix to (n,) outputs.
+            background (array): (B, M) scaled background rows.
+            max_rows_per_pass (int): Caps the size of a single forward pass
+                when explaining many samples at once.
+        """
+        self.predict = predict
+        self.background = np.asarray(background, dtype=np.float64)
+        self.n_background, self.n_features = self.background.shape
+        self.max_rows_per_pass = max_rows_per_pass
+
+        M = self.n_features
+
+        # (2^M, M) boolean coalition masks
+        self.masks = np.array(list(product([False, True], repeat=M)))
+
+        # Shapley weight matrix: phi = weights @ v(S)
+        sizes = self.masks.sum(axis=1)
+        w = np.array([
+            factorial(s) * factorial(M - s - 1) / factorial(M)
+            for s in range(M)
+        ])
+        self.weights = np.zeros((M, len(self.masks)))
+        for i in range(M):
+            has_i = self.masks[:, i]
+            self.weights[i, has_i] = w[sizes[has_i] - 1]
+            self.weights[i, ~has_i] = -w[sizes[~has_i]]
+
+        self.expected_value = float(np.mean(self.predict(self.background)))
+
+    @classmethod
+    def from_mlp(cls, mlp, background, **kwargs):
+        return cls(lambda X: mlp_forward(mlp, X), background, **kwargs)
+
+    @classmethod
+    def from_kernel_explainer(cls, mlp, kernel_explainer, **kwargs):
+        """Reuses the background set of a fitted shap.KernelExplainer."""
+        data = kernel_explainer.data
+        background = getattr(data, "data", data)
+        return cls.from_mlp(mlp, background, **kwargs)
+
+    def coalition_values(self, X):
+        """
+        Returns v(S) for every sample and coalition, shape (n, 2^M).
+        """
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        n = X.shape[0]
+        C, B, M = len(self.masks), self.n_background, self.n_features
+
+        per_sample = C * B
+        chunk = max(1, self.max_rows_per_pass // per_sample)
+
+        values = np.empty((n, C))
+        for start in range(0, n, chunk):
+            Xc = X[start:start + chunk]
+            # (k, C, B, M): sample features where the mask is set, background elsewhere
+            Z = np.where(
+                self.masks[None, :, None, :],
+                Xc[:, None, None, :],
+                self.background[None, None, :, :]
+            )
+            out = self.predict(Z.reshape(-1, M)).reshape(len(Xc), C, B)
+            values[start:start + chunk] = out.mean(axis=2)
+
+        return values
+
+    def shap_values(self, X, **_):
+        """
+        Exact Shapley values, shape (n, M). Extra keyword arguments (e.g.
+        nsamples) are accepted for drop-in compatibility and ignored.
+        """
+        return self.coalition_values(X) @ self.weights.T
+
+    def summarized(self, n_rows=8):
+        """
+        Approximate explainer over n_rows summary rows (means of background
+        rows grouped by model output): about n_background / n_rows times
+        cheaper. Used by the degraded triage tiers (see admission.py).
+        """
+        order = np.argsort(self.predict(self.background))
+        groups = np.array_split(order, min(n_rows, self.n_background))
+        summary = np.array([self.background[g].mean(axis=0) for g in groups])
+        return SummaryShapExplainer(self.predict, summary, self.expected_value)
+
+
+class SummaryShapExplainer(ExactShapExplainer):
+    """
+    Exact Shapley values against a summarized background, shifted so they
+    still sum to prediction - expected_value of the full background.
+    """
+
+    def __init__(self, predict, summary, expected_value, **kwargs):
+        super().__init__(predict, summary, **kwargs)
+        self.summary_value = self.expected_value
+        self.expected_value = float(expected_value)
+
+    def shap_values(self, X, **_):
+        phi = super().shap_values(X)
+        return phi + (self.summary_value - self.expected_value) / self.n_features
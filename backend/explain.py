@@ -3,58 +3,76 @@
 
 import os
 import json
+import asyncio
+import logging
 import numpy as np
-import pandas as pd
 from dotenv import load_dotenv
-from groq import Groq
+from groq import Groq, AsyncGroq
+from router import DepartmentRouter
+from registry import registry
+from departments import catalog as department_catalog
+from http_client import get_upstream
+from tracing import span
+
+logger = logging.getLogger(__name__)
 
 # --------------------------------------------------
 # Setup
 # --------------------------------------------------
 
 load_dotenv()
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+
+# Groq clients share the pooled, timed "groq" upstream (see http_client.py);
+# the SDK's own retry loop is kept, capped at the upstream's retry count
+registry.register("groq", lambda: Groq(
+    api_key=os.getenv("GROQ_API_KEY"),
+    http_client=get_upstream("groq").new_sync_client(),
+    max_retries=get_upstream("groq").config.retries
+))
+registry.register("groq_async", lambda: AsyncGroq(
+    api_key=os.getenv("GROQ_API_KEY"),
+    http_client=get_upstream("groq").new_client(),
+    max_retries=get_upstream("groq").config.retries
+))
+
+GROQ_MODEL = "llama-3.1-8b-instant"
 
 # --------------------------------------------------
-# Load Departments CSV
+# Department Routing
 # --------------------------------------------------
+# DEPARTMENT_ROUTER=local -> local TF-IDF router (no network call)
+# DEPARTMENT_ROUTER=llm   -> Groq picks the department; the local route is
+#                            used if the call fails or returns an off-list name
+# ROUTER_LLM_FALLBACK=1   -> in local mode, ask the LLM only when the local
+#                            route is low-confidence
+
+DEPARTMENT_ROUTER = os.getenv("DEPARTMENT_ROUTER", "local").lower()
+ROUTER_LLM_FALLBACK = os.getenv("ROUTER_LLM_FALLBACK", "0") == "1"
+
+def load_department_router():
+    return DepartmentRouter(
+        registry.get("departments").frame(),
+        min_score=float(os.getenv("ROUTER_MIN_SCORE", "0.05"))
+    )
+
+registry.register("department_router", load_department_router)
 
-departments_df = pd.read_csv("departments_rows.csv")
-departments_df["name_lower"] = departments_df["name"].str.lower().str.strip()
+# Rebuild the router whenever the department catalog reloads
+def _refresh_router(catalog):
+    if registry.is_loaded("department_router"):
+        registry.set("department_router", load_department_router())
 
-department_list = departments_df["name"].tolist()
+department_catalog.add_listener(_refresh_router)
 
 def get_department_id(name):
-    match = departments_df[
-        departments_df["name_lower"] == name.lower().strip()
-    ]
-    if not match.empty:
-        return match.iloc[0]["department_id"]
-    return None
+    # id, name, alias or near-miss name (see departments.py)
+    return registry.get("departments").department_id(name)
 
 # --------------------------------------------------
-# Main Function
+# SHAP Waterfall Payload
 # --------------------------------------------------
 
-def generate_explanation_structured(
-    text,
-    zeroshot_score,
-    vitals_score,
-    contributions,
-    final_score,
-    base_value,
-    input_values  # <-- pass original vitals dict here
-):
-
-    # --------------------------------------------------
-    # Risk score (keep your logic)
-    # --------------------------------------------------
-
-    risk_score_int = int(np.clip(final_score * 100, 0, 100))
-
-    # --------------------------------------------------
-    # Build SHAP structured dict for waterfall
-    # --------------------------------------------------
+def build_shap_payload(contributions, final_score, base_value, input_values):
 
     base_value = float(base_value)
     prediction = float(final_score)
@@ -106,13 +124,20 @@ def generate_explanation_structured(
 
     # Optional integrity check
     if abs(current - prediction) > 1e-3:
-        print("⚠️ Warning: SHAP sum mismatch")
+        logger.warning("SHAP sum mismatch: %.4f vs prediction %.4f", current, prediction)
 
-    # --------------------------------------------------
-    # 1️⃣ EXPLANATION PROMPT
-    # --------------------------------------------------
+    return {
+        "base_value": base_value,
+        "prediction": prediction,
+        "features": features_sorted,
+        "steps": steps
+    }
+
+# --------------------------------------------------
+# 1️⃣ EXPLANATION PROMPT
+# --------------------------------------------------
 
-    explanation_system_prompt = """
+explanation_system_prompt = """
 You are a medical explainability assistant.
 
 Explain ONLY the highest predicted severity category.
@@ -128,6 +153,8 @@ Keep explanation under 120 words.
 Return ONLY plain text explanation.
 """
 
+def explanation_messages(text, zeroshot_score, vitals_score, contributions, risk_score_int):
+
     explanation_user_prompt = f"""
 Patient Text:
 {text}
@@ -148,22 +175,16 @@ Final Combined Risk Score:
 {risk_score_int}
 """
 
-    explanation_response = client.chat.completions.create(
-        model="llama-3.1-8b-instant",
-        messages=[
-            {"role": "system", "content": explanation_system_prompt},
-            {"role": "user", "content": explanation_user_prompt}
-        ],
-        temperature=0.3
-    )
-
-    explanation_text = explanation_response.choices[0].message.content.strip()
+    return [
+        {"role": "system", "content": explanation_system_prompt},
+        {"role": "user", "content": explanation_user_prompt}
+    ]
 
-    # --------------------------------------------------
-    # 2️⃣ Department Selection
-    # --------------------------------------------------
+# --------------------------------------------------
+# 2️⃣ Department Selection
+# --------------------------------------------------
 
-    department_system_prompt = f"""
+department_system_prompt_template = """
 You are a medical triage router.
 
 Based on the patient's condition,
@@ -176,6 +197,8 @@ Do NOT explain.
 Do NOT add extra text.
 """
 
+def department_messages(text, zeroshot_score, risk_score_int):
+
     department_user_prompt = f"""
 Patient Text:
 {text}
@@ -187,15 +210,17 @@ Final Risk Score:
 {risk_score_int}
 """
 
-    department_response = client.chat.completions.create(
-        model="llama-3.1-8b-instant",
-        messages=[
-            {"role": "system", "content": department_system_prompt},
-            {"role": "user", "content": department_user_prompt}
-        ],
-        temperature=0
+    department_system_prompt = department_system_prompt_template.format(
+        department_list=registry.get("departments").names()
     )
 
+    return [
+        {"role": "system", "content": department_system_prompt},
+        {"role": "user", "content": department_user_prompt}
+    ]
+
+def parse_department_response(department_response):
+
     department_name = department_response.choices[0].message.content.strip()
     department_name = department_name.replace("\n", "").strip()
 
@@ -206,18 +231,204 @@ Final Risk Score:
             f"Invalid department returned by LLM: '{department_name}'"
         )
 
+    return department_id
+
+def _use_llm_router(local_route):
+    if DEPARTMENT_ROUTER == "llm":
+        return True
+    return ROUTER_LLM_FALLBACK and not local_route["confident"]
+
+def select_department(text, zeroshot_score, risk_score_int):
+
+    with span("department_routing"):
+        local_route = registry.get("department_router").route(text, zeroshot_score[1])
+        if not _use_llm_router(local_route):
+            return local_route["department_id"]
+
+        try:
+            department_response = registry.get("groq").chat.completions.create(
+                model=GROQ_MODEL,
+                messages=department_messages(text, zeroshot_score, risk_score_int),
+                temperature=0
+            )
+            return parse_department_response(department_response)
+        except Exception as e:
+            logger.warning("LLM department routing failed, using local route: %s", e)
+            return local_route["department_id"]
+
+async def select_department_async(text, zeroshot_score, risk_score_int):
+
+    with span("department_routing"):
+        local_route = registry.get("department_router").route(text, zeroshot_score[1])
+        if not _use_llm_router(local_route):
+            return local_route["department_id"]
+
+        try:
+            department_response = await registry.get("groq_async").chat.completions.create(
+                model=GROQ_MODEL,
+                messages=department_messages(text, zeroshot_score, risk_score_int),
+                temperature=0
+            )
+            return parse_department_response(department_response)
+        except Exception as e:
+            logger.warning("LLM department routing failed, using local route: %s", e)
+            return local_route["department_id"]
+
+# --------------------------------------------------
+# Main Function
+# --------------------------------------------------
+
+def generate_explanation_structured(
+    text,
+    zeroshot_score,
+    vitals_score,
+    contributions,
+    final_score,
+    base_value,
+    input_values  # <-- pass original vitals dict here
+):
+
+    # Risk score (keep your logic)
+    risk_score_int = int(np.clip(final_score * 100, 0, 100))
+
+    shap_payload = build_shap_payload(
+        contributions, final_score, base_value, input_values
+    )
+
+    with span("explanation_llm"):
+        explanation_response = registry.get("groq").chat.completions.create(
+            model=GROQ_MODEL,
+            messages=explanation_messages(
+                text, zeroshot_score, vitals_score, contributions, risk_score_int
+            ),
+            temperature=0.3
+        )
+
+    explanation_text = explanation_response.choices[0].message.content.strip()
+
+    department_id = select_department(text, zeroshot_score, risk_score_int)
+
     # --------------------------------------------------
     # Final JSON
     # --------------------------------------------------
 
     return {
         "risk_score": risk_score_int,
-        "shap": {
-            "base_value": base_value,
-            "prediction": prediction,
-            "features": features_sorted,
-            "steps": steps
-        },
+        "shap": shap_payload,
         "explainability": explanation_text,
         "recommended_department": department_id
     }
+
+# --------------------------------------------------
+# Async Variant (LLM calls in flight together)
+# --------------------------------------------------
+
+async def _explanation_async(messages):
+    with span("explanation_llm"):
+        return await registry.get("groq_async").chat.completions.create(
+            model=GROQ_MODEL,
+            messages=messages,
+            temperature=0.3
+        )
+
+async def stream_explanation_async(text, zeroshot_score, vitals_score, contributions, risk_score_int):
+    """
+    Async generator over explanation text deltas as Groq produces them.
+    """
+
+    with span("explanation_llm"):
+        stream = await registry.get("groq_async").chat.completions.create(
+            model=GROQ_MODEL,
+            messages=explanation_messages(
+                text, zeroshot_score, vitals_score, contributions, risk_score_int
+            ),
+            temperature=0.3,
+            stream=True
+        )
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+
+async def generate_explanation_structured_async(
+    text,
+    zeroshot_score,
+    vitals_score,
+    contributions,
+    final_score,
+    base_value,
+    input_values
+):
+
+    risk_score_int = int(np.clip(final_score * 100, 0, 100))
+
+    shap_payload = build_shap_payload(
+        contributions, final_score, base_value, input_values
+    )
+
+    explanation_response, department_id = await asyncio.gather(
+        _explanation_async(explanation_messages(
+            text, zeroshot_score, vitals_score, contributions, risk_score_int
+        )),
+        select_department_async(text, zeroshot_score, risk_score_int)
+    )
+
+    explanation_text = explanation_response.choices[0].message.content.strip()
+
+    return {
+        "risk_score": risk_score_int,
+        "shap": shap_payload,
+        "explainability": explanation_text,
+        "recommended_department": department_id
+    }
+
+# --------------------------------------------------
+# Degraded Variant (no LLM, see admission.py)
+# --------------------------------------------------
+
+def template_explanation(zeroshot_score, contributions, input_values, risk_score_int, top=3):
+    """Plain-text explanation from the scores alone, when the LLM is skipped."""
+
+    drivers = sorted(contributions.items(), key=lambda x: abs(x[1]), reverse=True)[:top]
+    parts = [
+        f"{name.replace('_', ' ')} {input_values[name]:g} ({'raises' if value > 0 else 'lowers'} risk)"
+        for name, value in drivers
+    ]
+
+    sources = "symptoms and vitals" if zeroshot_score is not None else "vitals only"
+    text = f"Combined risk score {risk_score_int}/100 ({sources}). Main vitals factors: {', '.join(parts)}."
+    if zeroshot_score is not None:
+        text += f" Symptoms most consistent with: {zeroshot_score[1]}."
+    return text
+
+def generate_explanation_template(
+    text,
+    zeroshot_score,
+    vitals_score,
+    contributions,
+    final_score,
+    base_value,
+    input_values
+):
+    """
+    Same output as generate_explanation_structured without any LLM call:
+    template explanation and local department routing. zeroshot_score may
+    be None (vitals-only tier).
+    """
+
+    risk_score_int = int(np.clip(final_score * 100, 0, 100))
+
+    shap_payload = build_shap_payload(
+        contributions, final_score, base_value, input_values
+    )
+
+    top_label = zeroshot_score[1] if zeroshot_score is not None else None
+    with span("department_routing"):
+        department_id = registry.get("department_router").route(text, top_label)["department_id"]
+
+    return {
+        "risk_score": risk_score_int,
+        "shap": shap_payload,
+        "explainability": template_explanation(zeroshot_score, contributions, input_values, risk_score_int),
+        "recommended_department": department_id
+    }
@@ -0,0 +1,434 @@
+# fake_services.py
+#
+# Local stand-ins for Supabase (PostgREST) and Groq (OpenAI-compatible chat
+# completions) with configurable latency, so benchmarks and load tests run
+# offline and are not skewed by network jitter or rate limits.
+#
+#   python fake_services.py --supabase-port 54321 --groq-port 54322 --latency-ms 20
+#
+# then start the app with
+#
+#   SUPABASE_URL=http://127.0.0.1:54321 GROQ_BASE_URL=http://127.0.0.1:54322
+#
+# Supabase: GET /rest/v1/patients synthesizes a deterministic patient
+# (age/gender derived from the id) for eq./in. filters on patient_id; ids
+# starting with "unknown" have no row. PATCH/POST return an empty list.
+# GET /rest/v1/departments serves departments_rows.csv.
+#
+# Groq: POST /openai/v1/chat/completions answers department prompts with
+# "General Medicine" and everything else with a fixed explanation, as a
+# plain JSON completion or, with "stream": true, as SSE chunks.
+#
+# Sarvam: POST /speech-to-text-translate takes a multipart WAV upload and
+# "transcribes" every voiced burst as a word naming its dominant frequency
+# ("tone440"), so tests can build recordings whose expected transcript is
+# known. Latency grows with the audio length (--sarvam-ms-per-second).
+#
+# Upstream (for http_client.py's self-check): GET/POST /fail/<key>/<n>
+# answers 503 (Retry-After: 0) to the first n requests for key, then 200;
+# /slow/<ms> waits that long before answering; /redirect/<path> answers
+# 302 to /<path>. Responses report how many requests the key has seen.
+
+import os
+import csv
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from email.parser import BytesParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from registry import artifact_path
+
+EXPLANATION_TEXT = (
+    "The risk score reflects the reported symptoms together with the recorded "
+    "vitals. Elevated heart rate and blood pressure contribute most to the "
+    "vitals-based estimate; clinical review is recommended."
+)
+
+
+class LatencyProfile:
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, token_ms=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.token_ms = token_ms  # delay between streamed chunks
+
+    def sleep(self):
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+    def should_fail(self):
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    profile = LatencyProfile()
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                chunk = self.rfile.read(size + 2)[:size]  # chunk + CRLF
+                if not size:
+                    break
+                chunks.append(chunk)
+            return b"".join(chunks)
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _json(self, status, payload, headers=()):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in headers:
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _delay_or_fail(self):
+        self.profile.sleep()
+        if self.profile.should_fail():
+            self._json(503, {"error": "injected failure"}, [("Retry-After", "0")])
+            return True
+        return False
+
+# ----------------------------
+# Supabase (PostgREST subset)
+# ----------------------------
+
+def fake_patient(patient_id):
+    digest = hashlib.sha256(str(patient_id).encode()).digest()
+    return {
+        "patient_id": patient_id,
+        "age": 18 + digest[0] % 72,
+        "gender": "Male" if digest[1] % 2 else "Female",
+    }
+
+
+def _load_departments():
+    with open(artifact_path("departments_rows.csv"), newline="") as f:
+        return list(csv.DictReader(f))
+
+
+class SupabaseHandler(_Handler):
+    departments = None
+
+    def _select(self, rows, query):
+        columns = query.get("select", ["*"])[0]
+        if columns == "*":
+            return rows
+        names = [c.strip() for c in columns.split(",")]
+        return [{k: row.get(k) for k in names} for row in rows]
+
+    def do_GET(self):
+        if self._delay_or_fail():
+            return
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        table = url.path.rstrip("/").split("/")[-1]
+
+        if table == "patients":
+            ids = []
+            for condition in query.get("patient_id", []):
+                op, _, value = condition.partition(".")
+                if op == "eq":
+                    ids.append(value)
+                elif op == "in":
+                    ids.extend(v.strip('"') for v in value.strip("()").split(",") if v)
+            rows = [fake_patient(pid) for pid in ids if not pid.startswith("unknown")]
+        elif table == "departments":
+            if SupabaseHandler.departments is None:
+                SupabaseHandler.departments = _load_departments()
+            rows = SupabaseHandler.departments
+        else:
+            rows = []
+
+        self._json(200, self._select(rows, query))
+
+    def do_PATCH(self):
+        self._body()
+        if self._delay_or_fail():
+            return
+        self._json(200, [])
+
+    do_POST = do_PATCH
+
+# ----------------------------
+# Groq (OpenAI-compatible)
+# ----------------------------
+
+class GroqHandler(_Handler):
+
+    def _answer(self, request):
+        system = " ".join(
+            m.get("content", "") for m in request.get("messages", []) if m.get("role") == "system"
+        )
+        if "department" in system.lower() and "ONLY the department name" in system:
+            return "General Medicine"
+        return EXPLANATION_TEXT
+
+    def do_POST(self):
+        request = json.loads(self._body() or b"{}")
+        if self._delay_or_fail():
+            return
+
+        content = self._answer(request)
+        created = int(time.time())
+        model = request.get("model", "fake")
+
+        if not request.get("stream"):
+            self._json(200, {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+            return
+
+        # SSE: one chunk per word, then [DONE]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        words = content.split(" ")
+        for i, word in enumerate(words):
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": word if i == 0 else " " + word},
+                    "finish_reason": None,
+                }],
+            }
+            if i and self.profile.token_ms:
+                time.sleep(self.profile.token_ms / 1000.0)
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+# ----------------------------
+# Sarvam (speech-to-text-translate)
+# ----------------------------
+
+def fake_transcript(wav):
+    """One "tone<Hz>" word per voiced burst, rounded to 10 Hz."""
+    import numpy as np
+    from audio import read_wav, frame_energy_db, voiced_frames, FRAME_MS
+
+    audio = read_wav(wav)
+    samples = audio.mono()
+    frame = max(1, int(audio.sample_rate * FRAME_MS / 1000))
+    voiced = list(voiced_frames(frame_energy_db(samples, audio.sample_rate))) + [False]
+
+    words, start = [], None
+    for i, is_voiced in enumerate(voiced):
+        if is_voiced and start is None:
+            start = i
+        elif not is_voiced and start is not None:
+            burst = samples[start * frame:i * frame]
+            spectrum = np.abs(np.fft.rfft(burst))
+            freq = np.fft.rfftfreq(len(burst), 1.0 / audio.sample_rate)[int(np.argmax(spectrum))]
+            words.append(f"tone{int(round(freq / 10.0)) * 10}")
+            start = None
+    return " ".join(words), audio.duration
+
+
+class SarvamHandler(_Handler):
+    ms_per_second = 0.0  # extra latency per second of audio
+
+    def do_POST(self):
+        body = self._body()
+        message = BytesParser().parsebytes(
+            f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode() + body
+        )
+        upload = None
+        for part in message.get_payload() if message.is_multipart() else []:
+            if part.get_param("name", header="content-disposition") == "file":
+                upload = part.get_payload(decode=True)
+
+        if self._delay_or_fail():
+            return
+        if upload is None:
+            self._json(400, {"error": "file is required"})
+            return
+
+        try:
+            transcript, duration = fake_transcript(upload)
+        except Exception as e:
+            self._json(400, {"error": f"unreadable audio: {e}"})
+            return
+        if self.ms_per_second:
+            time.sleep(duration * self.ms_per_second / 1000.0)
+
+        self._json(200, {
+            "request_id": hashlib.sha256(upload).hexdigest()[:12],
+            "transcript": transcript,
+            "translated_text": transcript.replace("tone", "Tone "),
+            "language_code": "en-IN",
+        })
+
+# ----------------------------
+# Scriptable upstream
+# ----------------------------
+
+class UpstreamHandler(_Handler):
+    hits = {}
+    hits_lock = threading.Lock()
+
+    def _handle(self):
+        body = self._body()
+        parts = urlparse(self.path).path.strip("/").split("/")
+        with self.hits_lock:
+            self.hits[self.path] = hits = self.hits.get(self.path, 0) + 1
+
+        if parts[0] == "redirect":
+            self.send_response(302)
+            self.send_header("Location", "/" + "/".join(parts[1:]))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if parts[0] == "slow":
+            time.sleep(float(parts[1]) / 1000.0)
+        elif parts[0] == "fail" and hits <= int(parts[2]):
+            self._json(503, {"error": "scripted failure", "hits": hits}, [("Retry-After", "0")])
+            return
+        try:
+            self._json(200, {"hits": hits, "bytes": len(body)})
+        except ConnectionError:
+            pass  # the client gave up on a /slow request
+
+    do_GET = _handle
+    do_POST = _handle
+
+# ----------------------------
+# Lifecycle
+# ----------------------------
+
+class FakeServer:
+
+    def __init__(self, handler, port=0, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, token_ms=0.0):
+        # Per-server handler subclass so each fake has its own latency profile
+        handler = type(handler.__name__, (handler,), {
+            "profile": LatencyProfile(latency_ms, jitter_ms, error_rate, token_ms)
+        })
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def profile(self):
+        return self.server.RequestHandlerClass.profile
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def start_fakes(supabase_latency_ms=10.0, groq_latency_ms=200.0, jitter_ms=0.0, error_rate=0.0,
+                supabase_port=0, groq_port=0, configure_env=True, groq_token_ms=0.0):
+    """
+    Starts both fakes in background threads. With configure_env the
+    SUPABASE_* / GROQ_* variables are pointed at them; do this before
+    importing main / explain, which read them at import.
+
+    Returns:
+        (supabase_server, groq_server)
+    """
+
+    supabase = FakeServer(SupabaseHandler, supabase_port, supabase_latency_ms, jitter_ms, error_rate).start()
+    groq = FakeServer(GroqHandler, groq_port, groq_latency_ms, jitter_ms, error_rate, groq_token_ms).start()
+
+    if configure_env:
+        os.environ["SUPABASE_URL"] = supabase.url
+        # supabase-py expects a JWT-shaped key
+        os.environ["SUPABASE_SERVICE_ROLE_KEY"] = "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.fake"
+        os.environ["GROQ_BASE_URL"] = groq.url
+        os.environ["GROQ_API_KEY"] = "fake-key"
+
+    return supabase, groq
+
+
+def start_fake_sarvam(latency_ms=50.0, ms_per_second=20.0, port=0, configure_env=True):
+    """
+    Starts the transcription fake; with configure_env, SARVAM_URL and
+    SARVAM_API_KEY point at it (set before importing main).
+    """
+
+    handler = type("SarvamHandler", (SarvamHandler,), {"ms_per_second": ms_per_second})
+    sarvam = FakeServer(handler, port, latency_ms).start()
+    if configure_env:
+        os.environ["SARVAM_URL"] = f"{sarvam.url}/speech-to-text-translate"
+        os.environ["SARVAM_API_KEY"] = "fake-key"
+    return sarvam
+
+
+def start_fake_upstream(latency_ms=0.0, port=0):
+    """Starts the scriptable upstream; each server counts hits separately."""
+    handler = type("UpstreamHandler", (UpstreamHandler,), {"hits": {}, "hits_lock": threading.Lock()})
+    return FakeServer(handler, port, latency_ms).start()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Supabase + Groq servers")
+    parser.add_argument("--supabase-port", type=int, default=54321)
+    parser.add_argument("--groq-port", type=int, default=54322)
+    parser.add_argument("--supabase-latency-ms", type=float, default=10.0)
+    parser.add_argument("--groq-latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--groq-token-ms", type=float, default=0.0, help="delay between streamed chunks")
+    parser.add_argument("--sarvam-port", type=int, default=54323)
+    parser.add_argument("--sarvam-latency-ms", type=float, default=50.0)
+    parser.add_argument("--sarvam-ms-per-second", type=float, default=20.0, help="extra latency per second of audio")
+    args = parser.parse_args()
+
+    supabase, groq = start_fakes(
+        args.supabase_latency_ms, args.groq_latency_ms, args.jitter_ms, args.error_rate,
+        args.supabase_port, args.groq_port, configure_env=False, groq_token_ms=args.groq_token_ms
+    )
+    sarvam = start_fake_sarvam(
+        args.sarvam_latency_ms, args.sarvam_ms_per_second, args.sarvam_port, configure_env=False
+    )
+    print(f"Supabase fake on {supabase.url}, Groq fake on {groq.url}, "
+          f"Sarvam fake on {sarvam.url}/speech-to-text-translate (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        supabase.stop()
+        groq.stop()
+        sarvam.stop()
@@ -0,0 +1,242 @@
+# fastmlp.py
+#
+# Compiled inference path for the vitals MLP.
+#
+# The StandardScaler's mean/scale and the MLPRegressor's coefs_/intercepts_
+# are read once at load. The scaler is folded into the first layer
+# (W1' = W1 / scale, b1' = b1 - (mean / scale) @ W1), so a prediction is
+# three dense layers on raw vitals with no pandas, no sklearn validation and
+# no per-call allocation beyond the output: hidden activations go into
+# per-thread buffers preallocated for up to max_batch rows.
+#
+#   python fastmlp.py parity   # compare with scaler.transform + mlp.predict
+#   python fastmlp.py bench    # per-call latency, batch sizes 1 .. 10k
+
+import sys
+import time
+import threading
+
+import numpy as np
+
+FEATURES = ["Age", "Sex", "Heart_Rate", "Systolic_BP", "Diastolic_BP", "Temperature"]
+
+_HIDDEN = {
+    "identity": lambda z: z,
+    "relu": lambda z: np.maximum(z, 0.0, out=z),
+    "tanh": lambda z: np.tanh(z, out=z),
+    "logistic": lambda z: np.divide(1.0, 1.0 + np.exp(-z), out=z),
+}
+
+
+class CompiledMLP:
+
+    def __init__(self, mlp, scaler=None, features=FEATURES, max_batch=1024):
+        """
+        Args:
+            mlp: Fitted sklearn MLPRegressor.
+            scaler: Fitted StandardScaler applied before the MLP (or None).
+            features (list): Column order for dict / DataFrame inputs.
+            max_batch (int): Rows per forward pass; larger inputs are
+                processed in slices of this size.
+        """
+        names = getattr(scaler, "feature_names_in_", None)
+        self.features = list(names) if names is not None else list(features)
+        self.n_features = len(self.features)
+        self.max_batch = max_batch
+
+        coefs = [np.ascontiguousarray(W, dtype=np.float64) for W in mlp.coefs_]
+        intercepts = [np.asarray(b, dtype=np.float64).copy() for b in mlp.intercepts_]
+
+        mean = np.zeros(self.n_features)
+        scale = np.ones(self.n_features)
+        if scaler is not None:
+            if getattr(scaler, "mean_", None) is not None:
+                mean = np.asarray(scaler.mean_, dtype=np.float64)
+            if getattr(scaler, "scale_", None) is not None:
+                scale = np.asarray(scaler.scale_, dtype=np.float64)
+        self.mean = mean
+        self.scale_ = scale
+
+        # Unfused weights, for inputs that are already scaled (SHAP)
+        self.coefs = coefs
+        self.intercepts = intercepts
+
+        # Scaler folded into layer 1
+        self.fused_coefs = [np.ascontiguousarray(coefs[0] / scale[:, None])] + coefs[1:]
+        self.fused_intercepts = [intercepts[0] - (mean / scale) @ coefs[0]] + intercepts[1:]
+
+        self.hidden = _HIDDEN[mlp.activation]
+        self.out = _HIDDEN[mlp.out_activation_]
+        self.widths = [W.shape[1] for W in coefs]
+
+        self._local = threading.local()
+
+    # ----------------------------
+    # Inputs
+    # ----------------------------
+
+    def as_matrix(self, X):
+        """
+        Accepts a dict keyed by feature name, a list of such dicts, a
+        tuple/list of n_features numbers, an (n_features,) or
+        (n, n_features) array, or a DataFrame. Returns an (n, n_features)
+        float64 array.
+
+        Raises:
+            ValueError: naming the features that are missing (None) or not
+                finite; they would otherwise turn into a NaN prediction.
+        """
+        if isinstance(X, dict):
+            X = [X]
+
+        if hasattr(X, "columns"):
+            missing = [k for k in self.features if k not in X.columns]
+            if missing:
+                raise ValueError(f"Missing vitals: {missing}")
+            X = X[self.features].to_numpy(dtype=np.float64)
+
+        elif isinstance(X, (list, tuple)) and X and isinstance(X[0], dict):
+            missing = [k for k in self.features if any(row.get(k) is None for row in X)]
+            if missing:
+                raise ValueError(f"Missing vitals: {missing}")
+            X = np.array([[row[k] for k in self.features] for row in X], dtype=np.float64)
+
+        else:
+            X = np.asarray(X, dtype=np.float64)
+            if X.ndim == 1:
+                X = X.reshape(1, -1)
+            if X.shape[1] != self.n_features:
+                raise ValueError(f"Expected {self.n_features} features, got {X.shape[1]}")
+
+        finite = np.isfinite(X)
+        if not finite.all():
+            bad = [self.features[j] for j in np.flatnonzero(~finite.all(axis=0))]
+            raise ValueError(f"Missing or non-finite vitals: {bad}")
+        return X
+
+    def transform(self, X):
+        """StandardScaler.transform without sklearn's validation."""
+        return (self.as_matrix(X) - self.mean) / self.scale_
+
+    # ----------------------------
+    # Forward
+    # ----------------------------
+
+    def _buffers(self):
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = [np.empty((self.max_batch, w)) for w in self.widths]
+            self._local.buffers = buffers
+        return buffers
+
+    def _forward(self, X, coefs, intercepts):
+        n = X.shape[0]
+        result = np.empty(n)
+        buffers = self._buffers()
+        last = len(coefs) - 1
+
+        for start in range(0, n, self.max_batch):
+            stop = min(start + self.max_batch, n)
+            a = X[start:stop]
+            for i, (W, b) in enumerate(zip(coefs, intercepts)):
+                z = buffers[i][:stop - start]
+                np.dot(a, W, out=z)
+                z += b
+                a = self.out(z) if i == last else self.hidden(z)
+            result[start:stop] = a[:, 0]
+
+        return result
+
+    def predict(self, X):
+        """Risk for raw (unscaled) vitals in any format as_matrix accepts; (n,) array."""
+        return self._forward(self.as_matrix(X), self.fused_coefs, self.fused_intercepts)
+
+    def predict_one(self, vitals):
+        return float(self.predict(vitals)[0])
+
+    def predict_scaled(self, X_scaled):
+        """Same as mlp.predict on already-scaled inputs."""
+        X_scaled = np.asarray(X_scaled, dtype=np.float64)
+        if X_scaled.ndim == 1:
+            X_scaled = X_scaled.reshape(1, -1)
+        return self._forward(X_scaled, self.coefs, self.intercepts)
+
+# ----------------------------
+# Parity + benchmark
+# ----------------------------
+
+def _load():
+    from mplinf import load_vitals_model
+    model = load_vitals_model()
+    return model.mlp, model.scaler, model.compiled
+
+
+def _samples(n, seed=0):
+    from synth import generate_chunk
+    return generate_chunk(np.random.RandomState(seed), n)[:, :len(FEATURES)]
+
+
+def parity(n=10_000, tolerance=1e-9):
+    import pandas as pd
+
+    mlp, scaler, compiled = _load()
+    X = _samples(n)
+    frame = pd.DataFrame(X, columns=FEATURES)
+
+    reference = mlp.predict(scaler.transform(frame))
+    checks = {
+        "array": compiled.predict(X),
+        "dataframe": compiled.predict(frame),
+        "dicts": compiled.predict(frame.to_dict("records")),
+        "scaled": compiled.predict_scaled(scaler.transform(frame)),
+    }
+    single = frame.iloc[0].to_dict()
+    checks["dict"] = compiled.predict(single)
+    checks["tuple"] = compiled.predict(tuple(single[k] for k in FEATURES))
+
+    ok = True
+    for name, values in checks.items():
+        diff = float(np.max(np.abs(values - reference[:len(values)])))
+        ok &= diff <= tolerance
+        print(f"{name:<10} max |diff| {diff:.2e}")
+
+    print("PASS" if ok else "FAIL")
+    return ok
+
+
+def bench(sizes=(1, 10, 100, 1000, 10_000), min_time=0.2):
+    import pandas as pd
+
+    mlp, scaler, compiled = _load()
+
+    def sklearn_path(X):
+        return mlp.predict(scaler.transform(pd.DataFrame(X, columns=FEATURES)))
+
+    def timed(fn, X):
+        fn(X)
+        calls, started = 0, time.perf_counter()
+        while True:
+            fn(X)
+            calls += 1
+            elapsed = time.perf_counter() - started
+            if elapsed >= min_time:
+                return elapsed / calls * 1e6
+
+    print(f"{'batch':>6} {'sklearn us':>12} {'compiled us':>12} {'speedup':>8}")
+    report = {}
+    for n in sizes:
+        X = _samples(n)
+        slow, fast = timed(sklearn_path, X), timed(compiled.predict, X)
+        report[n] = {"sklearn_us": slow, "compiled_us": fast}
+        print(f"{n:>6} {slow:>12.1f} {fast:>12.1f} {slow / fast:>7.1f}x")
+
+    single = dict(zip(FEATURES, _samples(1)[0]))
+    print(f"single dict predict_one: {timed(compiled.predict_one, single):.1f} us")
+    return report
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "bench"
+    if command == "parity":
+        sys.exit(0 if parity() else 1)
+    bench()
@@ -0,0 +1,45 @@
+# gunicorn.conf.py
+#
+# Multi-worker deployment:
+#   gunicorn -c gunicorn.conf.py main:app
+#
+# The app (and every model in the registry) is loaded once in the master
+# process and the workers are forked from it, so read-only weights are
+# shared copy-on-write instead of being loaded once per worker.
+#
+# The triage queue must be one queue across workers, so it defaults to a
+# shared SQLite file (TRIAGE_QUEUE_PATH, see triage_queue.py). Setting
+# TRIAGE_QUEUE_PATH to an empty value keeps the in-process heap, which is
+# only correct with a single worker: WEB_CONCURRENCY is then forced to 1.
+# Patient cache invalidations and department reloads are fanned out to
+# every worker through a shared log (INVALIDATION_LOG_PATH, see
+# invalidation.py).
+#
+# Both files are created in SHARED_DIR: TRIAGE_CACHE_DIR, or else a per-user
+# 0700 directory under the temp dir. Anyone who can write there can inject
+# queue entries or invalidation events, so startup is refused unless the
+# directory is owned by this user and not group/world-writable.
+
+import os
+import stat
+import tempfile
+
+SHARED_DIR = os.getenv("TRIAGE_CACHE_DIR") or os.path.join(tempfile.gettempdir(), f"triage-shared-{os.getuid()}")
+
+os.makedirs(SHARED_DIR, mode=0o700, exist_ok=True)
+_st = os.stat(SHARED_DIR)
+if _st.st_uid != os.getuid() or _st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+    raise RuntimeError(
+        f"Shared state directory {SHARED_DIR} must be owned by this user and not "
+        "group/world-writable"
+    )
+
+os.environ.setdefault("PRELOAD_MODELS", "1")
+os.environ.setdefault("TRIAGE_QUEUE_PATH", os.path.join(SHARED_DIR, "triage-queue.sqlite3"))
+os.environ.setdefault("INVALIDATION_LOG_PATH", os.path.join(SHARED_DIR, "invalidations.sqlite3"))
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2")) if os.environ["TRIAGE_QUEUE_PATH"] else 1
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
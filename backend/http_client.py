@@ -0,0 +1,406 @@
+# http_client.py
+#
+# Shared HTTP clients for the upstream services (Sarvam, Groq, EHR file
+# storage).
+#
+# Each upstream gets one long-lived httpx client, so connections (and TLS
+# sessions) are kept alive and reused across requests instead of being
+# set up per call. The client's connection pool doubles as the upstream's
+# concurrency limit: once max_connections requests are in flight, further
+# ones wait up to the pool timeout for a free connection. Timeouts,
+# limits and retry policy are configured per upstream:
+#
+#   HTTP_<NAME>_CONNECT_TIMEOUT   seconds to establish a connection
+#   HTTP_<NAME>_TIMEOUT           seconds per read / write
+#   HTTP_<NAME>_MAX_CONNECTIONS   concurrent requests to that upstream
+#   HTTP_<NAME>_RETRIES           retries after the first attempt
+#
+# Redirects are followed (httpx does not by default): storage and signed
+# EHR URLs commonly answer 3xx.
+#
+# Retries use exponential backoff with full jitter (and honour a numeric
+# Retry-After) on connection errors, timeouts and 429/5xx responses.
+# Every attempt's latency (to response headers) is recorded in a
+# per-upstream histogram, including calls made by SDKs (Groq) that are
+# handed one of these clients.
+#
+# Self-check against the scriptable upstream in fake_services.py (retry
+# on 503, read timeout, no retry of a non-rewindable POST body, latency
+# histogram counts): python http_client.py
+
+import io
+import os
+import time
+import random
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+
+import httpx
+
+# Latency histogram bucket upper bounds (milliseconds)
+LATENCY_BUCKETS_MS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, float("inf")]
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class UpstreamConfig:
+
+    def __init__(self, name, connect_timeout=5.0, timeout=30.0, max_connections=10,
+                 retries=2, backoff_base=0.25, backoff_max=4.0, pool_timeout=10.0, follow_redirects=True):
+        prefix = f"HTTP_{name.upper()}_"
+        self.name = name
+        self.connect_timeout = float(os.getenv(prefix + "CONNECT_TIMEOUT", connect_timeout))
+        self.timeout = float(os.getenv(prefix + "TIMEOUT", timeout))
+        self.max_connections = int(os.getenv(prefix + "MAX_CONNECTIONS", max_connections))
+        self.retries = int(os.getenv(prefix + "RETRIES", retries))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_timeout = pool_timeout
+        self.follow_redirects = follow_redirects
+
+    def httpx_timeout(self):
+        return httpx.Timeout(self.timeout, connect=self.connect_timeout, pool=self.pool_timeout)
+
+    def httpx_limits(self):
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections,
+            keepalive_expiry=60.0
+        )
+
+    def backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+# ----------------------------
+# Latency histogram
+# ----------------------------
+
+class LatencyHistogram:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.errors = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS_MS)
+        self.status_counts = {}
+
+    def observe(self, elapsed_ms, status=None):
+        with self._lock:
+            self.count += 1
+            self.sum_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            for i, bound in enumerate(LATENCY_BUCKETS_MS):
+                if elapsed_ms <= bound:
+                    self.buckets[i] += 1
+                    break
+            if status is None:
+                self.errors += 1
+            else:
+                key = str(status)
+                self.status_counts[key] = self.status_counts.get(key, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "count": self.count,
+                "errors": self.errors,
+                "mean_ms": self.sum_ms / self.count if self.count else 0.0,
+                "max_ms": self.max_ms,
+                "sum_ms": self.sum_ms,
+                "status": dict(self.status_counts),
+                "buckets": {
+                    ("+Inf" if b == float("inf") else str(b)): c
+                    for b, c in zip(LATENCY_BUCKETS_MS, self.buckets)
+                },
+            }
+
+
+class _TimedAsyncTransport(httpx.AsyncBaseTransport):
+
+    def __init__(self, histogram, **kwargs):
+        self.histogram = histogram
+        self.transport = httpx.AsyncHTTPTransport(**kwargs)
+
+    async def handle_async_request(self, request):
+        started = time.perf_counter()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except Exception:
+            self.histogram.observe((time.perf_counter() - started) * 1000.0)
+            raise
+        self.histogram.observe((time.perf_counter() - started) * 1000.0, response.status_code)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class _TimedTransport(httpx.BaseTransport):
+
+    def __init__(self, histogram, **kwargs):
+        self.histogram = histogram
+        self.transport = httpx.HTTPTransport(**kwargs)
+
+    def handle_request(self, request):
+        started = time.perf_counter()
+        try:
+            response = self.transport.handle_request(request)
+        except Exception:
+            self.histogram.observe((time.perf_counter() - started) * 1000.0)
+            raise
+        self.histogram.observe((time.perf_counter() - started) * 1000.0, response.status_code)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+# ----------------------------
+# Upstream
+# ----------------------------
+
+def _retry_after(response):
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _rewind_files(files):
+    """Seeks file objects in a `files=` mapping back to 0; False if one can't be."""
+    for value in (files or {}).values():
+        f = value[1] if isinstance(value, tuple) else value
+        if hasattr(f, "read"):
+            if not (hasattr(f, "seekable") and f.seekable()):
+                return False
+            f.seek(0)
+    return True
+
+
+class Upstream:
+
+    def __init__(self, config):
+        self.config = config
+        self.latency = LatencyHistogram()
+        self.retried = 0
+        self._client = None
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def new_client(self, **kwargs):
+        """A pooled, timed AsyncClient with this upstream's limits (e.g. for an SDK)."""
+        kwargs.setdefault("follow_redirects", self.config.follow_redirects)
+        return httpx.AsyncClient(
+            transport=_TimedAsyncTransport(self.latency, limits=self.config.httpx_limits()),
+            timeout=self.config.httpx_timeout(),
+            **kwargs
+        )
+
+    def new_sync_client(self, **kwargs):
+        kwargs.setdefault("follow_redirects", self.config.follow_redirects)
+        return httpx.Client(
+            transport=_TimedTransport(self.latency, limits=self.config.httpx_limits()),
+            timeout=self.config.httpx_timeout(),
+            **kwargs
+        )
+
+    @property
+    def client(self):
+        # Connections belong to the event loop that opened them; a new loop
+        # (e.g. a script calling asyncio.run twice) gets a fresh client.
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._client is None or self._loop is not loop:
+                self._client = self.new_client()
+                self._loop = loop
+            return self._client
+
+    def _attempts(self, method, retry, kwargs):
+        if retry is None:
+            retry = method.upper() in IDEMPOTENT_METHODS
+        if retry and not _rewind_files(kwargs.get("files")):
+            retry = False
+        return 1 + (self.config.retries if retry else 0)
+
+    async def request(self, method, url, retry=None, **kwargs):
+        """
+        Sends a request, retrying transient failures. POSTs are retried only
+        when retry=True and any file bodies can be rewound.
+
+        Returns:
+            httpx.Response (body read). Raises httpx.HTTPError on failure.
+        """
+
+        attempts = self._attempts(method, retry, kwargs)
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError:
+                if last:
+                    raise
+                delay = self.config.backoff(attempt)
+            else:
+                if response.status_code not in RETRY_STATUS or last:
+                    return response
+                delay = self.config.backoff(attempt, _retry_after(response))
+
+            self.retried += 1
+            await asyncio.sleep(delay)
+            _rewind_files(kwargs.get("files"))
+
+    @asynccontextmanager
+    async def stream(self, method, url, retry=None, **kwargs):
+        """
+        Streams a response body (response.aiter_bytes()). Retries happen
+        only before the body is handed to the caller.
+        """
+
+        attempts = self._attempts(method, retry, kwargs)
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            request = self.client.build_request(method, url, **kwargs)
+            try:
+                response = await self.client.send(request, stream=True)
+            except httpx.TransportError:
+                if last:
+                    raise
+                delay = self.config.backoff(attempt)
+            else:
+                if response.status_code not in RETRY_STATUS or last:
+                    try:
+                        yield response
+                    finally:
+                        await response.aclose()
+                    return
+                await response.aclose()
+                delay = self.config.backoff(attempt, _retry_after(response))
+
+            self.retried += 1
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        return {
+            "timeout_s": self.config.timeout,
+            "connect_timeout_s": self.config.connect_timeout,
+            "max_connections": self.config.max_connections,
+            "retries": self.config.retries,
+            "retried": self.retried,
+            "latency_ms": self.latency.snapshot(),
+        }
+
+    async def aclose(self):
+        with self._lock:
+            client, self._client, self._loop = self._client, None, None
+        if client is not None:
+            await client.aclose()
+
+
+upstreams = {
+    "sarvam": Upstream(UpstreamConfig("sarvam", timeout=60.0, max_connections=8)),
+    "groq": Upstream(UpstreamConfig("groq", timeout=30.0, max_connections=16)),
+    "ehr": Upstream(UpstreamConfig(
+        "ehr", timeout=float(os.getenv("EHR_DOWNLOAD_TIMEOUT", "60")), max_connections=4
+    )),
+}
+
+
+def get_upstream(name):
+    return upstreams[name]
+
+
+def http_stats():
+    return {name: upstream.stats() for name, upstream in upstreams.items()}
+
+
+async def close_http_clients():
+    for upstream in upstreams.values():
+        await upstream.aclose()
+
+
+async def _selftest():
+    from fake_services import start_fake_upstream
+
+    fake = start_fake_upstream()
+    upstream = Upstream(UpstreamConfig("selftest", timeout=0.2, retries=2, backoff_base=0.01))
+    failures = []
+
+    def check(label, ok):
+        print(f"{label:<44} {'OK' if ok else 'FAIL'}")
+        if not ok:
+            failures.append(label)
+
+    # 503, 503, then 200: two retries used up, latency recorded per attempt
+    response = await upstream.request("GET", f"{fake.url}/fail/get/2")
+    check("retry on 503, then success", response.status_code == 200 and response.json()["hits"] == 3)
+
+    async with upstream.stream("GET", f"{fake.url}/fail/stream/1") as response:
+        body = b"".join([chunk async for chunk in response.aiter_bytes()])
+    check("streamed GET retried before the body", response.status_code == 200 and b'"hits": 2' in body)
+
+    response = await upstream.request("GET", f"{fake.url}/redirect/fail/redirect/0")
+    check("redirect followed", response.status_code == 200)
+
+    # Read timeout (0.2 s): retried like any transport error, then raised
+    started = time.perf_counter()
+    try:
+        await upstream.request("GET", f"{fake.url}/slow/1000")
+        timed_out = False
+    except httpx.ReadTimeout:
+        timed_out = True
+    check("read timeout retried, then raised", timed_out and time.perf_counter() - started < 0.9)
+
+    # A POST whose file body cannot be rewound is sent once, even with retry=True
+    class Unseekable(io.RawIOBase):
+        # e.g. a socket or pipe-backed upload: readable once, no seek
+        def __init__(self, data):
+            self.data = io.BytesIO(data)
+
+        def readable(self):
+            return True
+
+        def readinto(self, buffer):
+            return self.data.readinto(buffer)
+
+    retried = upstream.retried
+    response = await upstream.request(
+        "POST", f"{fake.url}/fail/post/1", retry=True, files={"file": ("clip.bin", Unseekable(b"x" * 1024))}
+    )
+    hits = fake.server.RequestHandlerClass.hits["/fail/post/1"]
+    check("non-rewindable POST body not retried",
+          response.status_code == 503 and upstream.retried == retried and hits == 1)
+
+    # Seekable body: rewound and resent
+    response = await upstream.request(
+        "POST", f"{fake.url}/fail/post-seekable/1", retry=True, files={"file": ("clip.bin", io.BytesIO(b"y" * 1024))}
+    )
+    check("rewindable POST body retried", response.status_code == 200 and response.json()["bytes"] > 1024)
+
+    # Attempts: 3 + 2 + 2 (302 and its target) + 3 timeouts + 1 + 2
+    latency = upstream.latency.snapshot()
+    check("latency histogram counts every attempt",
+          latency["count"] == 13 and latency["errors"] == 3
+          and latency["status"] == {"503": 5, "200": 4, "302": 1}
+          and sum(latency["buckets"].values()) == latency["count"])
+    check("retries counted", upstream.retried == 6)
+
+    await upstream.aclose()
+    fake.stop()
+    print("PASS" if not failures else "FAIL")
+    return not failures
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Runs against the scriptable upstream from fake_services.py (no network)
+    sys.exit(0 if asyncio.run(_selftest()) else 1)
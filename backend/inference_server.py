@@ -0,0 +1,540 @@
+# inference_server.py
+#
+# Shared zero-shot inference server.
+#
+# With several uvicorn/gunicorn workers every API process would otherwise
+# load its own copy of the zero-shot model and run it with its own
+# intra-op thread pool. Instead, run one inference server per host and
+# point the API workers at it:
+#
+#   export INFERENCE_AUTHKEY=$(openssl rand -hex 32)
+#   python inference_server.py serve --workers 2 --threads 4
+#   ZEROSHOT_SERVER=default gunicorn -c gunicorn.conf.py main:app
+#
+#   python inference_server.py ping|stats
+#   python inference_server.py bench --clients 4 --requests 100
+#
+# The server accepts connections from API processes over a local socket
+# (multiprocessing.connection: a Unix socket path, or host:port for TCP)
+# and feeds every request into one MicroBatcher, so requests coming from
+# different API processes share batches. Batches run on a pool of model
+# processes, each with a fixed number of intra-op threads, so
+# workers x threads can be sized to the cores independently of how many
+# API workers there are.
+#
+# The model is loaded once in the server before the pool is forked, so
+# the model processes share its weights copy-on-write (ONNX Runtime
+# sessions are not fork-safe, so with ZEROSHOT_BACKEND=onnx each model
+# process loads its own session instead).
+#
+# multiprocessing.connection unpickles every message, so a peer that
+# passes the handshake can run code as the server user. The server
+# therefore refuses to start without an explicit INFERENCE_AUTHKEY, keeps
+# its Unix socket in a private (0700) per-user directory with mode 0600,
+# and only binds TCP to loopback unless INFERENCE_ALLOW_REMOTE=1.
+#
+#   INFERENCE_ADDRESS       socket path or host:port ("default": the private
+#                           per-user socket)
+#   INFERENCE_AUTHKEY       shared secret for the connection handshake (required)
+#   INFERENCE_ALLOW_REMOTE  1 -> allow TCP on non-loopback interfaces
+#   INFERENCE_WORKERS       model processes (default 2)
+#   INFERENCE_THREADS       intra-op threads per model process
+#   INFERENCE_MAX_BATCH     texts per model call (default 16)
+#   INFERENCE_MAX_WAIT_MS   batching window (default 5)
+#   INFERENCE_TIMEOUT       client-side seconds per request (default 30)
+
+import os
+import sys
+import stat
+import time
+import tempfile
+import ipaddress
+import queue
+import logging
+import argparse
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import Future
+from multiprocessing.connection import Listener, Client, AuthenticationError
+
+from batcher import MicroBatcher
+
+logger = logging.getLogger(__name__)
+
+# Private per-user directory for the default Unix socket
+DEFAULT_SOCKET_DIR = os.path.join(tempfile.gettempdir(), f"triage-inference-{os.getuid()}")
+DEFAULT_ADDRESS = os.path.join(DEFAULT_SOCKET_DIR, "inference.sock")
+
+INFERENCE_ADDRESS = os.getenv("INFERENCE_ADDRESS", DEFAULT_ADDRESS)
+INFERENCE_AUTHKEY = os.getenv("INFERENCE_AUTHKEY", "").encode()
+INFERENCE_ALLOW_REMOTE = os.getenv("INFERENCE_ALLOW_REMOTE", "0") == "1"
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "0"))  # 0 -> cores / workers
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", "16"))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "5"))
+INFERENCE_TIMEOUT = float(os.getenv("INFERENCE_TIMEOUT", "30"))
+
+
+def parse_address(address):
+    """'host:port' -> (host, port) for TCP; anything else is a Unix socket path."""
+    if not address or address == "default":
+        return DEFAULT_ADDRESS
+    host, sep, port = str(address).rpartition(":")
+    if sep and port.isdigit() and "/" not in address:
+        return (host or "127.0.0.1", int(port))
+    return address
+
+
+def require_authkey(authkey):
+    if not authkey:
+        raise RuntimeError(
+            "INFERENCE_AUTHKEY is not set; the inference server unpickles what "
+            "clients send, so it needs an explicit shared secret"
+        )
+    return authkey
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def check_address(address, allow_remote=INFERENCE_ALLOW_REMOTE):
+    """
+    Refuses addresses other local users or the network could reach: TCP
+    off loopback (unless allowed) and socket directories not private to us.
+    """
+    if isinstance(address, tuple):
+        if not allow_remote and not is_loopback(address[0]):
+            raise RuntimeError(
+                f"Refusing to listen on {address[0]}:{address[1]}; "
+                "set INFERENCE_ALLOW_REMOTE=1 to accept non-loopback clients"
+            )
+        return
+
+    directory = os.path.dirname(os.path.abspath(address))
+    if directory == DEFAULT_SOCKET_DIR:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+    st = os.stat(directory)
+    if st.st_uid != os.getuid() or st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise RuntimeError(
+            f"Socket directory {directory} must be owned by this user and not "
+            "group/world-writable"
+        )
+
+
+def default_threads(workers):
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def limit_threads(threads):
+    """Caps BLAS/OpenMP/torch/onnxruntime intra-op threads for this process."""
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "ZEROSHOT_ONNX_THREADS"):
+        os.environ[var] = str(threads)
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(threads)
+
+# ----------------------------
+# Model processes
+# ----------------------------
+
+def _model_names():
+    import zeroshot
+    return ["severity_scorer"] if zeroshot.ZEROSHOT_SCORER == "severity" else ["zeroshot"]
+
+
+def _load_models():
+    from registry import registry
+    for name in _model_names():
+        registry.get(name)
+
+
+def _model_worker(conn, threads, preloaded):
+    limit_threads(threads)
+    from zeroshot import compute_risk_scores
+    if not preloaded:
+        _load_models()
+
+    while True:
+        try:
+            texts = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            conn.send((True, compute_risk_scores(texts)))
+        except Exception as e:
+            conn.send((False, f"{type(e).__name__}: {e}"))
+
+
+class ModelPool:
+
+    def __init__(self, workers=INFERENCE_WORKERS, threads=None, preload=None):
+        """
+        Args:
+            workers (int): Model processes.
+            threads (int | None): Intra-op threads per process.
+            preload (bool | None): Load the model here and fork the workers
+                from it (default: yes, except for the ONNX backend).
+        """
+        import zeroshot
+
+        self.size = max(1, int(workers))
+        self.threads = threads or default_threads(self.size)
+        if preload is None:
+            preload = zeroshot.ZEROSHOT_BACKEND != "onnx"
+        self.preloaded = preload
+        self.restarts = 0
+
+        if preload:
+            limit_threads(self.threads)
+            _load_models()
+
+        self._context = multiprocessing.get_context("fork")
+        self._idle = queue.Queue()
+        self._processes = {}
+        for index in range(self.size):
+            self._idle.put(self._spawn(index))
+
+    def _spawn(self, index):
+        parent, child = self._context.Pipe()
+        process = self._context.Process(
+            target=_model_worker,
+            args=(child, self.threads, self.preloaded),
+            name=f"inference-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        child.close()
+        self._processes[index] = process
+        return index, parent
+
+    def score(self, texts):
+        """Runs one batch on an idle model process (blocks until one is free)."""
+        index, conn = self._idle.get()
+        try:
+            conn.send(texts)
+            ok, value = conn.recv()
+        except (EOFError, OSError) as e:
+            logger.error("Inference worker %d died (%s); restarting it", index, e)
+            self._processes[index].kill()
+            conn.close()
+            index, conn = self._spawn(index)
+            self.restarts += 1
+            raise RuntimeError("inference worker died while scoring") from e
+        finally:
+            self._idle.put((index, conn))
+
+        if not ok:
+            raise RuntimeError(value)
+        return value
+
+    def stats(self):
+        return {
+            "workers": self.size,
+            "threads_per_worker": self.threads,
+            "preloaded": self.preloaded,
+            "alive": sum(p.is_alive() for p in self._processes.values()),
+            "restarts": self.restarts,
+        }
+
+    def close(self):
+        for process in self._processes.values():
+            process.kill()
+
+# ----------------------------
+# Server
+# ----------------------------
+
+def _gather(futures, callback):
+    """Calls callback(ok, results | error) once every future is done."""
+    results = [None] * len(futures)
+    state = {"remaining": len(futures), "failed": False}
+    lock = threading.Lock()
+
+    if not futures:
+        callback(True, [])
+        return
+
+    def done(i, future):
+        error = future.exception()
+        with lock:
+            if state["failed"]:
+                return
+            if error is not None:
+                state["failed"] = True
+            else:
+                results[i] = future.result()
+                state["remaining"] -= 1
+            last = state["remaining"] == 0
+        if error is not None:
+            callback(False, f"{type(error).__name__}: {error}")
+        elif last:
+            callback(True, results)
+
+    for i, future in enumerate(futures):
+        future.add_done_callback(lambda f, i=i: done(i, f))
+
+
+class InferenceServer:
+
+    def __init__(self, pool, address=INFERENCE_ADDRESS, authkey=INFERENCE_AUTHKEY,
+                 max_batch_size=INFERENCE_MAX_BATCH, max_wait_ms=INFERENCE_MAX_WAIT_MS):
+        self.pool = pool
+        self.address = parse_address(address)
+        self.authkey = authkey
+        # One batching thread per model process keeps every process busy
+        self.batcher = MicroBatcher(
+            pool.score, max_batch_size, max_wait_ms, name="inference", workers=pool.size
+        )
+        self.connections = 0
+        self._listener = None
+
+    def serve_forever(self):
+        require_authkey(self.authkey)
+        check_address(self.address)
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)  # stale socket from a previous run
+
+        # Socket created owner-only (no window where others could connect)
+        umask = os.umask(0o177)
+        try:
+            self._listener = Listener(self.address, authkey=self.authkey)
+        finally:
+            os.umask(umask)
+        if isinstance(self.address, str):
+            os.chmod(self.address, 0o600)
+        logger.info("Inference server listening on %s (%s)", self.address, self.pool.stats())
+
+        while True:
+            try:
+                conn = self._listener.accept()
+            except AuthenticationError:
+                logger.warning("Rejected inference client with a bad authkey")
+                continue
+            except OSError:
+                if self._listener is None:
+                    return  # closed
+                raise
+            threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def close(self):
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.close()
+        self.pool.close()
+
+    def stats(self):
+        return {
+            "address": self.address,
+            "connections": self.connections,
+            "pool": self.pool.stats(),
+            "batcher": self.batcher.stats(),
+        }
+
+    def _serve_connection(self, conn):
+        send_lock = threading.Lock()
+        self.connections += 1
+
+        def reply(request_id, ok, value):
+            with send_lock:
+                try:
+                    conn.send((request_id, ok, value))
+                except OSError:
+                    pass  # client went away; its requests are dropped
+
+        try:
+            while True:
+                try:
+                    request_id, kind, payload = conn.recv()
+                except (EOFError, OSError):
+                    return
+
+                if kind == "score":
+                    _gather([self.batcher.submit(payload)],
+                            lambda ok, value, r=request_id: reply(r, ok, value[0] if ok else value))
+                elif kind == "score_many":
+                    _gather([self.batcher.submit(text) for text in payload],
+                            lambda ok, value, r=request_id: reply(r, ok, value))
+                elif kind == "stats":
+                    reply(request_id, True, self.stats())
+                elif kind == "ping":
+                    reply(request_id, True, "pong")
+                else:
+                    reply(request_id, False, f"unknown request kind '{kind}'")
+        finally:
+            self.connections -= 1
+            conn.close()
+
+# ----------------------------
+# Client (used by the API workers)
+# ----------------------------
+
+class InferenceClient:
+    """
+    One multiplexed connection per process: any number of threads can
+    have requests in flight; a reader thread resolves their futures.
+    Reconnects on the next request after the server restarts.
+    """
+
+    def __init__(self, address=INFERENCE_ADDRESS, authkey=INFERENCE_AUTHKEY, timeout=INFERENCE_TIMEOUT):
+        self.address = parse_address(address)
+        self.authkey = authkey
+        self.timeout = timeout
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._pending = {}
+        self._ids = itertools.count()
+
+    def connect(self):
+        self._connection()
+        return self
+
+    def _connection(self):
+        with self._lock:
+            if self._conn is None or self._pid != os.getpid():
+                # A connection inherited over fork belongs to the parent
+                self._pending = {}
+                self._conn = Client(self.address, authkey=require_authkey(self.authkey))
+                self._pid = os.getpid()
+                threading.Thread(
+                    target=self._read, args=(self._conn,), name="inference-client", daemon=True
+                ).start()
+            return self._conn
+
+    def _read(self, conn):
+        while True:
+            try:
+                request_id, ok, value = conn.recv()
+            except (EOFError, OSError):
+                break
+            future = self._pending.pop(request_id, None)
+            if future is None or not future.set_running_or_notify_cancel():
+                continue  # timed out or cancelled on our side
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(RuntimeError(value))
+
+        with self._lock:
+            if self._conn is conn:
+                self._conn = None
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if future.set_running_or_notify_cancel():
+                future.set_exception(ConnectionError("inference server connection lost"))
+
+    def _request(self, kind, payload=None):
+        future = Future()
+        conn = self._connection()
+        request_id = next(self._ids)
+        self._pending[request_id] = future
+        try:
+            with self._send_lock:
+                conn.send((request_id, kind, payload))
+        except OSError as e:
+            self._pending.pop(request_id, None)
+            with self._lock:
+                if self._conn is conn:
+                    self._conn = None
+            future.set_exception(ConnectionError(f"inference server unreachable: {e}"))
+        return future
+
+    def submit(self, text):
+        """Future resolving to (risk_score, top_label)."""
+        return self._request("score", text)
+
+    def score(self, text):
+        return self.submit(text).result(self.timeout)
+
+    def score_many(self, texts):
+        return [tuple(r) for r in self._request("score_many", list(texts)).result(self.timeout)]
+
+    def stats(self, timeout=None):
+        return self._request("stats").result(timeout or self.timeout)
+
+    def ping(self):
+        return self._request("ping").result(self.timeout)
+
+# ----------------------------
+# CLI
+# ----------------------------
+
+def _bench_client(address, n_requests, concurrency, offset):
+    client = InferenceClient(address)
+    texts = [f"Patient {offset}-{i}: chest pain and shortness of breath" for i in range(n_requests)]
+    started = time.perf_counter()
+    futures = []
+    for i, text in enumerate(texts):
+        futures.append(client.submit(text))
+        if len(futures) >= concurrency:
+            futures.pop(0).result(client.timeout)
+    for future in futures:
+        future.result(client.timeout)
+    return time.perf_counter() - started
+
+
+def bench(address, clients=4, n_requests=100, concurrency=4):
+    """Drives the server from several processes, like API workers would."""
+    before = InferenceClient(address).stats()["batcher"]
+    context = multiprocessing.get_context("spawn")
+    started = time.perf_counter()
+    with context.Pool(clients) as p:
+        p.starmap(_bench_client, [(address, n_requests, concurrency, c) for c in range(clients)])
+    elapsed = time.perf_counter() - started
+    after = InferenceClient(address).stats()["batcher"]
+
+    batches = after["batches"] - before["batches"]
+    items = after["items"] - before["items"]
+    total = clients * n_requests
+    print(f"{total} requests from {clients} processes in {elapsed:.2f} s "
+          f"({total / elapsed:.1f} req/s), {batches} batches, "
+          f"mean batch size {items / batches if batches else 0.0:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared zero-shot inference server")
+    parser.add_argument("command", choices=["serve", "ping", "stats", "bench"])
+    parser.add_argument("--address", default=INFERENCE_ADDRESS)
+    parser.add_argument("--workers", type=int, default=INFERENCE_WORKERS)
+    parser.add_argument("--threads", type=int, default=INFERENCE_THREADS or None)
+    parser.add_argument("--max-batch", type=int, default=INFERENCE_MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=INFERENCE_MAX_WAIT_MS)
+    parser.add_argument("--no-preload", action="store_true", help="load the model in each worker")
+    parser.add_argument("--clients", type=int, default=4, help="bench: client processes")
+    parser.add_argument("--requests", type=int, default=100, help="bench: requests per client")
+    parser.add_argument("--concurrency", type=int, default=4, help="bench: in flight per client")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+
+    if args.command == "serve":
+        # This process hosts the model; never forward to another server
+        os.environ.pop("ZEROSHOT_SERVER", None)
+        server = InferenceServer(
+            ModelPool(args.workers, args.threads, False if args.no_preload else None),
+            args.address, max_batch_size=args.max_batch, max_wait_ms=args.max_wait_ms
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.close()
+    elif args.command == "ping":
+        started = time.perf_counter()
+        InferenceClient(args.address).ping()
+        print(f"pong in {(time.perf_counter() - started) * 1000.0:.1f} ms")
+    elif args.command == "stats":
+        import json
+        print(json.dumps(InferenceClient(args.address).stats(), indent=2, default=str))
+    else:
+        bench(args.address, args.clients, args.requests, args.concurrency)
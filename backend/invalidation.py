@@ -0,0 +1,181 @@
+# invalidation.py
+#
+# Cross-worker cache invalidation.
+#
+# The demographics and EHR feature caches are per process: under gunicorn
+# an invalidation (or an EHR re-ingest) received by one worker would leave
+# every other worker serving the old record until its TTL ran out. With
+# INVALIDATION_LOG_PATH set, invalidations are appended to a small shared
+# SQLite log; every worker polls it (a daemon thread, restarted after
+# fork) and applies the entries written by the others, so a change is seen
+# everywhere within INVALIDATION_POLL_SECONDS. gunicorn.conf.py sets the
+# path by default. Entries older than INVALIDATION_RETENTION_SECONDS are
+# pruned; a worker that falls further behind than that clears its caches.
+#
+# Without the path, invalidations only apply to the current process (a
+# single worker sees everything anyway).
+#
+# Entries carry a topic: "patients" (patient_id keys, for the demographics
+# and EHR caches) and "departments" (a catalog reload, keyed by source).
+#
+#   INVALIDATION_LOG_PATH            -> shared log file (unset: this process only)
+#   INVALIDATION_POLL_SECONDS        -> polling interval (default 1)
+#   INVALIDATION_RETENTION_SECONDS   -> log retention (default 3600)
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_LOG_PATH = os.getenv("INVALIDATION_LOG_PATH")
+INVALIDATION_POLL_SECONDS = float(os.getenv("INVALIDATION_POLL_SECONDS", "1"))
+INVALIDATION_RETENTION_SECONDS = float(os.getenv("INVALIDATION_RETENTION_SECONDS", "3600"))
+
+
+class InvalidationBus:
+
+    def __init__(self, path=INVALIDATION_LOG_PATH, poll_seconds=INVALIDATION_POLL_SECONDS,
+                 retention_seconds=INVALIDATION_RETENTION_SECONDS):
+        """
+        Args:
+            path (str | None): Shared SQLite log; None keeps invalidations
+                local to this process.
+            poll_seconds (float): How often other workers' entries are read.
+            retention_seconds (float): Age after which entries are pruned.
+        """
+        self.path = path
+        self.poll_seconds = poll_seconds
+        self.retention_seconds = retention_seconds
+
+        self._listeners = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._last_seq = 0
+        self._polled_at = time.time()
+        self._poller = None
+        self._poller_pid = None
+        self.published = 0
+        self.applied = 0
+        self.resets = 0
+
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Entries already in the log predate this process's caches
+            self._last_seq = self._connection().execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM invalidations"
+            ).fetchone()[0]
+
+    def subscribe(self, listener, topic="patients"):
+        """listener(key) drops one key; listener(None) drops everything."""
+        self._listeners.setdefault(topic, []).append(listener)
+
+    def _connection(self):
+        # Caller holds the lock (or is __init__); reopened after fork
+        pid = os.getpid()
+        if self._pid != pid:
+            self._pid = pid
+            self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS invalidations ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT, topic TEXT, key TEXT, pid INTEGER, created REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS invalidations_created ON invalidations(created)")
+        return self._conn
+
+    def _apply(self, topic, key):
+        for listener in self._listeners.get(topic, []):
+            try:
+                listener(key)
+            except Exception:
+                logger.exception("Invalidation listener failed for %s %s", topic, key)
+
+    def publish(self, key=None, local=True, topic="patients"):
+        """
+        Invalidates key (None: everything) in every worker.
+
+        Args:
+            local (bool): Also apply it in this process right away (False
+                when this process just wrote the fresh value itself).
+            topic (str): Which subscribers get it.
+        """
+        if local:
+            self._apply(topic, key)
+        if self.path:
+            with self._lock:
+                self._connection().execute(
+                    "INSERT INTO invalidations (topic, key, pid, created) VALUES (?, ?, ?, ?)",
+                    (topic, key, os.getpid(), time.time())
+                )
+        self.published += 1
+
+    def poll(self):
+        """Applies the entries other workers published since the last poll."""
+        if not self.path:
+            return 0
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute(
+                "SELECT seq, topic, key, pid FROM invalidations WHERE seq > ? ORDER BY seq", (self._last_seq,)
+            ).fetchall()
+            conn.execute("DELETE FROM invalidations WHERE created < ?", (now - self.retention_seconds,))
+            # Unread entries may have been pruned if this worker has not
+            # polled for longer than the retention
+            missed = now - self._polled_at > self.retention_seconds
+            self._polled_at = now
+            if rows:
+                self._last_seq = rows[-1][0]
+
+        if missed:
+            self.resets += 1
+            for topic in list(self._listeners):
+                self._apply(topic, None)
+            return len(rows)
+
+        applied = 0
+        for _, topic, key, pid in rows:
+            if pid != os.getpid():
+                self._apply(topic, key)
+                applied += 1
+        self.applied += applied
+        return applied
+
+    def start(self):
+        """Starts polling (once per process; restarted after fork)."""
+        if not self.path or self.poll_seconds <= 0:
+            return
+        pid = os.getpid()
+        with self._lock:
+            if self._poller_pid == pid and self._poller is not None and self._poller.is_alive():
+                return
+
+            def run():
+                while True:
+                    time.sleep(self.poll_seconds)
+                    try:
+                        self.poll()
+                    except Exception:
+                        logger.exception("Invalidation poller failed")
+
+            self._poller_pid = pid
+            self._poller = threading.Thread(target=run, name="invalidation-poller", daemon=True)
+            self._poller.start()
+
+    def stats(self):
+        return {
+            "shared": bool(self.path),
+            "poll_seconds": self.poll_seconds,
+            "published": self.published,
+            "applied_from_other_workers": self.applied,
+            "resets": self.resets,
+        }
+
+
+invalidations = InvalidationBus()
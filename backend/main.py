@@ -1,26 +1,49 @@
 import os
+import hmac
 import random
-import requests
+import asyncio
+import logging
+import httpx
 from dotenv import load_dotenv
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks, Header, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from supabase import create_client
-import pdfplumber
-from io import BytesIO
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 import json
 import pandas as pd
-from combine import run_combined_risk_assessment
+from combine import run_combined_risk_assessment_async, stream_combined_risk_assessment
 from zeroshot import *
+from zeroshot import batcher_stats as zeroshot_batcher_stats
 from mplinf import *
-from explain import generate_explanation_structured
+from cache import cache_stats
+from batch import score_chunk, BATCH_CHUNK_SIZE
+from ehr import extract_ehr_from_url_async
+from registry import registry
+from triage_queue import triage_queue
+from http_client import http_stats, close_http_clients
+from tracing import trace_request, render_prometheus
+from demographics import DemographicsCache
+from departments import catalog as department_catalog, DEPARTMENTS_SOURCES
+from audio import transcribe, transcribe_stream, stitch
+from ehr_features import EHRFeatureStore, triage_context, fill_missing_vitals
+from admission import admission, Overloaded
+from mplinf import vitals_watcher
+from artifacts import ArtifactError
+from invalidation import invalidations
 
 
 # 🔹 Load .env
 load_dotenv()
 
+# 🔹 Logging (LOG_LEVEL=DEBUG for per-request payload dumps)
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logger = logging.getLogger("main")
+
 
 
 
@@ -29,13 +52,77 @@ SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
 supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
+# 🔹 Patient age/gender, cached by patient_id (see demographics.py)
+demographics = DemographicsCache(supabase)
+
+# 🔹 Ingest-time EHR features, cached by patient_id (see ehr_features.py)
+ehr_store = EHRFeatureStore(supabase)
+
+# 🔹 Patient record changes reach the caches of every worker (see invalidation.py)
+invalidations.subscribe(demographics.invalidate)
+invalidations.subscribe(ehr_store.invalidate)
+invalidations.subscribe(lambda source: department_catalog.reload(source), topic="departments")
 
 
 app = FastAPI(title="Medical Voice + Triage Backend")
 
+# 🔹 Model loading
+# PRELOAD_MODELS=1 -> load everything now, before workers fork (gunicorn --preload)
+# MODEL_WARMUP=1   -> otherwise load in the background once the server starts
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "0") == "1"
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "1") == "1"
+
+if PRELOAD_MODELS:
+    registry.preload_for_fork()
+
+
+@app.on_event("startup")
+def start_model_warmup():
+    if MODEL_WARMUP and not registry.ready():
+        registry.start_background_warmup()
+    # Per worker: a watcher thread started before fork does not survive it
+    if registry.is_loaded("vitals"):
+        vitals_watcher.start()
+    if registry.is_loaded("departments"):
+        department_catalog.start_auto_reload()
+    invalidations.start()
+
+
+@app.on_event("shutdown")
+async def close_upstream_clients():
+    await close_http_clients()
+
+
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readyz():
+    status = registry.status()
+    if not registry.ready():
+        return JSONResponse(status_code=503, content={"ready": False, "models": status})
+    return {"ready": True, "models": status}
+
+@app.middleware("http")
+async def trace_requests(request, call_next):
+    # Route template (not the raw path) keeps the metric's label set bounded
+    def route_name():
+        route = request.scope.get("route")
+        return getattr(route, "path", "unmatched")
+
+    with trace_request(route_name):
+        return await call_next(request)
+
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request, exc):
-    print(f"OMFG Error: {exc.errors()}") # This will tell you exactly which field failed
+    logger.warning("Validation error: %s", exc.errors()) # This will tell you exactly which field failed
     return JSONResponse(status_code=422, content={"detail": exc.errors()})
 
 # 🔹 CORS (allow Next.js)
@@ -49,16 +136,29 @@ app.add_middleware(
 
 # 🔹 ENV VARIABLES
 SARVAM_API_KEY = os.getenv("SARVAM_API_KEY")
-SARVAM_URL = "https://api.sarvam.ai/speech-to-text-translate"
+SARVAM_URL = os.getenv("SARVAM_URL", "https://api.sarvam.ai/speech-to-text-translate")
+
+# 🔹 Admin endpoints (model activation, department reloads, cache
+# invalidation) require X-Admin-Token; they are disabled while ADMIN_TOKEN is unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# 🔹 The Supabase patients webhook must send this value in X-Webhook-Secret
+# (an HTTP header set on the webhook); it is rejected while unset
+SUPABASE_WEBHOOK_SECRET = os.getenv("SUPABASE_WEBHOOK_SECRET")
+
+
+def require_admin(x_admin_token: str | None = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN is not set)")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
 
-# 🔹 Departments for dummy triage
-DEPARTMENT_IDS = [
-    "703be28b-bc99-49e4-af4b-0cdd3d68edfc",  # Emergency
-    "e818f375-3596-4f14-87b1-aba37b7c18cc",  # Cardiology
-    "6a37f08c-41ab-4204-b745-dfce7e42c106",  # Neurology
-    "bfabb37c-fe0a-4329-a685-13ad4d5c1096",  # Pulmonology
-    "ab1d50e0-5262-4689-919b-b7aa13343a50"   # General Medicine
-]
+
+def require_webhook_secret(x_webhook_secret: str | None = Header(None)):
+    if not SUPABASE_WEBHOOK_SECRET:
+        raise HTTPException(status_code=403, detail="Webhook is disabled (SUPABASE_WEBHOOK_SECRET is not set)")
+    if x_webhook_secret is None or not hmac.compare_digest(x_webhook_secret.encode(), SUPABASE_WEBHOOK_SECRET.encode()):
+        raise HTTPException(status_code=401, detail="Invalid webhook secret")
 
 # ==============================
 # 🎤 Speech → Symptoms (Sarvam)
@@ -72,46 +172,79 @@ async def process_symptoms(
         raise HTTPException(status_code=500, detail="Sarvam API Key not configured")
 
     try:
-        audio_content = await file.read()
-
-        files = {
-            "file": (file.filename, audio_content, file.content_type)
-        }
-
-        data = {
-            "model": model
-        }
-
-        headers = {
-            "api-subscription-key": SARVAM_API_KEY
-        }
-
-        response = requests.post(
-            SARVAM_URL,
-            headers=headers,
-            data=data,
-            files=files,
-            timeout=30
+        # Long recordings are split at pauses and the segments transcribed
+        # concurrently (see audio.py); short clips are streamed to Sarvam
+        # from the spooled upload in a single call, never read into memory
+        result = await transcribe(
+            file.file,
+            filename=file.filename,
+            content_type=file.content_type,
+            model=model,
+            url=SARVAM_URL,
+            api_key=SARVAM_API_KEY
         )
 
-        response.raise_for_status()
-        sarvam_data = response.json()
-
         return {
             "success": True,
-            "transcript": sarvam_data.get("transcript"),
-            "symptoms": sarvam_data.get("translated_text")
+            "transcript": result["transcript"],
+            "symptoms": result["translated_text"],
+            "segments": len(result["segments"])
         }
 
-    except requests.exceptions.RequestException as e:
-        print(f"Sarvam error: {e}")
+    except httpx.HTTPError as e:
+        logger.error("Sarvam error: %s", e)
         raise HTTPException(status_code=502, detail="Error communicating with Sarvam AI")
 
     except Exception as e:
-        print(f"Server error: {e}")
+        logger.exception("Server error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/process-symptoms/stream")
+async def process_symptoms_stream(
+    file: UploadFile = File(...),
+    model: str = Form("saaras:v2.5")
+):
+    """
+    SSE version of /process-symptoms: one "segment" event per segment, in
+    order, as soon as it and every segment before it are transcribed, then
+    "done" with the stitched transcript and symptoms.
+    """
+
+    if not SARVAM_API_KEY:
+        raise HTTPException(status_code=500, detail="Sarvam API Key not configured")
+
+    async def events():
+        parts = []
+        try:
+            async for part in transcribe_stream(
+                file.file,
+                filename=file.filename,
+                content_type=file.content_type,
+                model=model,
+                url=SARVAM_URL,
+                api_key=SARVAM_API_KEY
+            ):
+                parts.append(part)
+                yield sse_event("segment", part)
+            yield sse_event("done", {
+                "success": True,
+                "transcript": stitch(parts, "transcript"),
+                "symptoms": stitch(parts, "translated_text"),
+                "segments": len(parts)
+            })
+        except Exception as e:
+            logger.error("Streaming transcription failed: %s", e)
+            yield sse_event("error", {"detail": "Error communicating with Sarvam AI"
+                                      if isinstance(e, httpx.HTTPError) else str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 # ==============================
 # 🧠 TRIAGE INPUT MODEL
 # ==============================
@@ -129,42 +262,395 @@ class TriageInput(BaseModel):
 # ==============================
 # 🏥 DUMMY TRIAGE AI
 # ==============================
+def build_triage_text(data: TriageInput):
+    text = ""
+    if data.symptoms:
+        text += data.symptoms + " "
+    if data.pre_existing_conditions:
+        text += data.pre_existing_conditions
+    return text
+
+
+def build_vitals(data: TriageInput, age, gender):
+    return {
+        "Age" : age,
+        "Sex" : 1 if gender == "Male" else 0,
+        "Heart_Rate": data.heart_rate,
+        "Systolic_BP": data.systolic_bp,
+        "Diastolic_BP": data.diastolic_bp,
+        "Temperature": data.temperature,
+    }
+
+
+async def _cached_or_fetched(store, patient_id):
+    # Cache hits and unknown ids resolve inline; the Supabase client is
+    # sync, so a miss is kept off the event loop
+    value = store.cached(patient_id)
+    if value is not None:
+        return value
+    return await asyncio.to_thread(store.fetch, patient_id)
+
+
+async def resolve_patient(data: TriageInput):
+    """(vitals, ehr context) with demographics and EHR features looked up together."""
+    (age, gender), features = await asyncio.gather(
+        _cached_or_fetched(demographics, data.patient_id),
+        _cached_or_fetched(ehr_store, data.patient_id)
+    )
+    vitals = build_vitals(data, age, gender)
+
+    # Vitals the request leaves out come from the EHR baseline
+    context = triage_context(features)
+    filled = fill_missing_vitals(vitals, features)
+    if context is not None:
+        context["baseline_vitals_used"] = filled
+
+    logger.debug("vitals: %s", vitals)
+    return vitals, context
+
+
+async def _vitals_of(patient):
+    vitals, _ = await patient
+    return vitals
+
+
 @app.post("/triage")
-def triage(data: TriageInput):
+async def triage(data: TriageInput, x_deadline_ms: float | None = Header(None)):
+    """
+    Scores one patient within a latency budget (X-Deadline-Ms header, else
+    TRIAGE_DEADLINE_MS). Under load the result may come from a cheaper
+    tier, reported as "tier" (see admission.py); 503 + Retry-After when
+    no tier can make it.
+    """
+
     try:
-        age = None
-        gender = None
-        fetchageandgender = supabase.table("patients").select("age, gender").eq("patient_id", data.patient_id).execute()
-        # console.log("fetchageandgender", fetchageandgender)
-        text = ""
-        if data.symptoms:
-            text += data.symptoms + " "
-        if data.pre_existing_conditions:
-            text += data.pre_existing_conditions
-        if fetchageandgender.data and len(fetchageandgender.data) > 0:  
-            age = fetchageandgender.data[0].get("age")
-            gender = fetchageandgender.data[0].get("gender")
-        vitals = {
-            "Age" : age,
-            "Sex" : 1 if gender == "Male" else 0,
-            "Heart_Rate": data.heart_rate,
-            "Systolic_BP": data.systolic_bp,
-            "Diastolic_BP": data.diastolic_bp,
-            "Temperature": data.temperature,
-            
-        }
-        
+        ticket = admission.admit(x_deadline_ms)
+    except Overloaded as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Triage overloaded: {e.reason}",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+    with ticket:
+        return await _triage_admitted(data, ticket)
+
+
+async def _triage_admitted(data: TriageInput, ticket):
+    try:
+        text = build_triage_text(data)
+
+        # Zero-shot starts while the patient lookup is still in flight
+        patient = asyncio.ensure_future(resolve_patient(data))
+        result = await run_combined_risk_assessment_async(
+            text, _vitals_of(patient), ticket.tier, ticket.deadline
+        )
+        ticket.serve(result["tier"])
+        _, ehr_context = await patient
+        # Results may come from the triage cache; never mutate them
+        result = {**result, "ehr": ehr_context}
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("triage result: %s", json.dumps(result, indent=2))
+
+        if data.patient_id:
+            triage_queue.enqueue(data.patient_id, result["recommended_department"], result["risk_score"])
 
-        print("vitals here", vitals)
-        result = run_combined_risk_assessment(text, vitals)    
-        print(json.dumps(result, indent=2))
-       
         return result
 
+    except ValueError as e:
+        # Vitals that are missing (and not filled from the patient record)
+        # or not finite; named in the message
+        raise HTTPException(status_code=422, detail=str(e))
+
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ==============================
+# 📡 STREAMING TRIAGE (Server-Sent Events)
+# ==============================
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/triage/stream")
+async def triage_stream(data: TriageInput, background_tasks: BackgroundTasks,
+                        x_deadline_ms: float | None = Header(None)):
+    """
+    Same pipeline as /triage, as an SSE stream: a "result" event (risk
+    score, SHAP, department) as soon as it is computed, then "token"
+    events with the explanation as the LLM writes it, then "done".
+    Admission and tiers work as for /triage; the deadline applies to the
+    "result" event.
+    """
+
+    try:
+        ticket = admission.admit(x_deadline_ms)
+    except Overloaded as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Triage overloaded: {e.reason}",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    # Released at the result event; this covers streams that fail or are
+    # dropped before it
+    background_tasks.add_task(admission.release, ticket)
+
+    text = build_triage_text(data)
+
+    async def events():
+        patient = asyncio.ensure_future(resolve_patient(data))
+        try:
+            async for event, payload in stream_combined_risk_assessment(
+                text, _vitals_of(patient), ticket.tier, ticket.deadline
+            ):
+                if event == "result":
+                    _, ehr_context = await patient
+                    payload = {**payload, "ehr": ehr_context}
+                    if data.patient_id:
+                        triage_queue.enqueue(data.patient_id, payload["recommended_department"], payload["risk_score"])
+                    # The ticket covers the work up to the result event; the
+                    # explanation tokens that follow are the LLM's pace
+                    ticket.serve(payload["tier"])
+                    admission.release(ticket)
+                yield sse_event(event, payload)
+        except Exception as e:
+            logger.exception("Streaming triage failed")
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+
+
+# ==============================
+# 📦 BULK TRIAGE (NDJSON stream)
+# ==============================
+class BatchTriageInput(BaseModel):
+    items: list[TriageInput]
+    explain: bool = False
+
+
+def fetch_patients_demographics(patient_ids):
+    return demographics.get_many(patient_ids)
+
+
+@app.post("/triage/batch")
+def triage_batch(data: BatchTriageInput):
+
+    def generate():
+        # One Supabase in_ lookup and one model pass per chunk
+        for start in range(0, len(data.items), BATCH_CHUNK_SIZE):
+            chunk = data.items[start:start + BATCH_CHUNK_SIZE]
+            try:
+                demographics = fetch_patients_demographics([entry.patient_id for entry in chunk])
+
+                items = []
+                for offset, entry in enumerate(chunk):
+                    age, gender = demographics.get(entry.patient_id, (None, None))
+                    items.append({
+                        "index": start + offset,
+                        "patient_id": entry.patient_id,
+                        "text": build_triage_text(entry),
+                        "vitals": build_vitals(entry, age, gender)
+                    })
+
+                results = score_chunk(items, explain=data.explain)
+            except Exception as e:
+                results = [
+                    {"index": start + offset, "patient_id": entry.patient_id, "error": str(e)}
+                    for offset, entry in enumerate(chunk)
+                ]
+
+            for result in results:
+                if result.get("patient_id") and "error" not in result:
+                    triage_queue.enqueue(result["patient_id"], result["recommended_department"], result["risk_score"])
+                yield json.dumps(result) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+# ==============================
+# 🚑 PRIORITY QUEUE (per department)
+# ==============================
+class QueuePriorityInput(BaseModel):
+    risk_score: float
+
+
+def resolve_department(key):
+    # Queue routes accept a department id, name or alias; unknown keys
+    # pass through (an empty queue, as before)
+    department = department_catalog.get(key, fuzzy=False)
+    return department["department_id"] if department is not None else key
+
+
+@app.get("/queue/{department_id}")
+def queue_top(department_id: str, background_tasks: BackgroundTasks, k: int = 10):
+    department_id = resolve_department(department_id)
+    patients = triage_queue.top(department_id, max(0, min(k, 500)))
+
+    # Listed patients are the ones about to be re-assessed; warm their
+    # demographics in one bulk query after the response is sent
+    background_tasks.add_task(demographics.prefetch, [p["patient_id"] for p in patients])
+
+    return {
+        "department_id": department_id,
+        "waiting": triage_queue.size(department_id),
+        "patients": patients
+    }
+
+
+@app.post("/queue/{department_id}/pop")
+def queue_pop(department_id: str):
+    department_id = resolve_department(department_id)
+    entry = triage_queue.pop(department_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="No patients waiting")
+    return entry
+
+
+@app.put("/queue/patients/{patient_id}/priority")
+def queue_reprioritize(patient_id: str, data: QueuePriorityInput):
+    if not triage_queue.reprioritize(patient_id, data.risk_score):
+        raise HTTPException(status_code=404, detail="Patient not in queue")
+    return {"success": True}
+
+
+@app.delete("/queue/patients/{patient_id}")
+def queue_remove(patient_id: str):
+    if not triage_queue.remove(patient_id):
+        raise HTTPException(status_code=404, detail="Patient not in queue")
+    return {"success": True}
+
+
+# ==============================
+# 🏥 DEPARTMENT CATALOG
+# ==============================
+@app.get("/departments")
+def list_departments():
+    return {**department_catalog.stats(), "items": department_catalog.all()}
+
+
+@app.get("/departments/resolve")
+def resolve_department_name(name: str):
+    department = department_catalog.get(name)
+    if department is None:
+        raise HTTPException(status_code=404, detail=f"No department matches '{name}'")
+    return department
+
+
+@app.get("/models/vitals")
+def vitals_model_status():
+    store = vitals_watcher.store
+    return {
+        **vitals_watcher.status(),
+        "active": store.pointer(),
+        "versions": store.versions(),
+    }
+
+
+@app.post("/models/vitals/activate/{version}", dependencies=[Depends(require_admin)])
+def activate_vitals_model(version: str):
+    # Swaps this worker now; other workers follow within ARTIFACTS_POLL_SECONDS
+    try:
+        return vitals_watcher.activate(version)
+    except ArtifactError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/models/vitals/rollback", dependencies=[Depends(require_admin)])
+def rollback_vitals_model():
+    try:
+        return vitals_watcher.rollback()
+    except ArtifactError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/departments/reload", dependencies=[Depends(require_admin)])
+def reload_departments(source: str | None = None):
+    # Reloads this worker now; the other workers reload through the
+    # invalidation log within INVALIDATION_POLL_SECONDS
+    if source is not None and source.lower() not in DEPARTMENTS_SOURCES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown department source '{source}' (configured: {', '.join(DEPARTMENTS_SOURCES)})"
+        )
+    source = source.lower() if source is not None else None
+    try:
+        result = department_catalog.reload(source)
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    invalidations.publish(source, local=False, topic="departments")
+    return result
+
+
+# ==============================
+# 👤 PATIENT DEMOGRAPHICS CACHE
+# ==============================
+class PrefetchInput(BaseModel):
+    patient_ids: list[str]
+
+
+@app.post("/patients/prefetch")
+def prefetch_patients(data: PrefetchInput):
+    # For frontends that load their own patient list (e.g. straight from Supabase)
+    return {"fetched": demographics.prefetch(data.patient_ids)}
+
+
+@app.post("/patients/{patient_id}/invalidate", dependencies=[Depends(require_admin)])
+def invalidate_patient(patient_id: str):
+    invalidations.publish(patient_id)
+    return {"success": True}
+
+
+@app.post("/webhooks/patients", dependencies=[Depends(require_webhook_secret)])
+def patients_webhook(payload: dict):
+    # Supabase database webhook on the patients table:
+    # {"type": "UPDATE", "table": "patients", "record": {...}, "old_record": {...}}
+    ids = {
+        (payload.get(key) or {}).get("patient_id")
+        for key in ("record", "old_record")
+    } - {None}
+    for patient_id in ids:
+        invalidations.publish(patient_id)
+    return {"invalidated": sorted(ids)}
+
+
+@app.get("/stats/demographics")
+def demographics_stats():
+    return {**demographics.stats(), "invalidation": invalidations.stats()}
+
+
+@app.get("/stats/ehr")
+def ehr_feature_stats():
+    return ehr_store.stats()
+
+
+@app.get("/stats/admission")
+def admission_stats():
+    return admission.stats()
+
+
+# ==============================
+# 📊 ZERO-SHOT BATCHER STATS
+# ==============================
+@app.get("/stats/zeroshot")
+def zeroshot_stats():
+    return zeroshot_batcher_stats()
+
+
+@app.get("/stats/cache")
+def triage_cache_stats():
+    return cache_stats()
+
+
+@app.get("/stats/http")
+def upstream_http_stats():
+    return http_stats()
 
 
 class EHRInput(BaseModel):
@@ -173,28 +659,21 @@ class EHRInput(BaseModel):
 
 
 @app.post("/extract-ehr")
-def extract_ehr(data: EHRInput):
+async def extract_ehr(data: EHRInput):
     try:
-        # 1️⃣ Download PDF
-        response = requests.get(data.fileUrl)
-        response.raise_for_status()
-
-        # 2️⃣ Extract text
-        extracted_text = ""
-        with pdfplumber.open(BytesIO(response.content)) as pdf:
-            for page in pdf.pages:
-                extracted_text += page.extract_text() or ""
-
-        # limit size (important)
-        extracted_text = extracted_text[:20000]
-
-        # 3️⃣ Update Supabase
-        supabase.table("patients") \
-            .update({"ehr_data": extracted_text}) \
-            .eq("patient_id", data.patientId) \
-            .execute()
-
-        return {"success": True}
+        # 1️⃣ Download (pooled client, spooled to disk) + 2️⃣ extract up to the char budget
+        extracted_text, report = await extract_ehr_from_url_async(data.fileUrl)
+
+        # 3️⃣ Features (skipped when the text is unchanged) + update Supabase
+        features, rebuilt = await asyncio.to_thread(ehr_store.ingest, data.patientId, extracted_text)
+        # This worker holds the new features; the others drop their copy
+        await asyncio.to_thread(invalidations.publish, data.patientId, False)
+
+        return {
+            "success": True,
+            "extraction": report,
+            "features": {**triage_context(features), "rebuilt": rebuilt} if features else None
+        }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,50 +1,113 @@
 # inference_with_shap.py
 
+import os
+import logging
 import joblib
-import shap
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+from registry import registry, artifact_path, ARTIFACT_MMAP_MODE
+from artifacts import ArtifactStore, ModelWatcher
+from fastmlp import CompiledMLP
+from exact_shap import ExactShapExplainer
+from tracing import span
+
+logger = logging.getLogger(__name__)
 
 # ----------------------------
-# Load Model + Scaler + Explainer
+# SHAP engine
 # ----------------------------
-mlp = joblib.load("mlp_regressor.pkl")
-scaler = joblib.load("scaler.pkl")
-explainer = joblib.load("shap_explainer.pkl")
+# "exact"  -> enumerate all 64 coalitions over the KernelExplainer's
+#             background set (exact, deterministic)
+# "kernel" -> sampled shap.KernelExplainer (nsamples=60)
+SHAP_ENGINE = os.getenv("SHAP_ENGINE", "exact").lower()
+
+# Background summary rows of the approximate explainer (degraded tiers)
+SHAP_APPROX_ROWS = int(os.getenv("SHAP_APPROX_ROWS", "8"))
+
+if SHAP_ENGINE not in ("exact", "kernel"):
+    raise ValueError(f"Unknown SHAP_ENGINE: '{SHAP_ENGINE}' (expected 'exact' or 'kernel')")
 
 # ----------------------------
-# Inference Function
+# Model + Scaler + Explainer
 # ----------------------------
-def run_mlp_inference(sample_df, visualize=True):
+class VitalsModel:
 
-    # Scale
-    sample_scaled = scaler.transform(sample_df)
+    def __init__(self, mlp, scaler, kernel_explainer, shap_engine=SHAP_ENGINE, version=None):
+        self.mlp = mlp
+        self.scaler = scaler
+        self.kernel_explainer = kernel_explainer
 
-    # Predict
-    prediction = mlp.predict(sample_scaled)[0]
+        # Scaler fused into the first layer; plain NumPy forward pass
+        self.compiled = CompiledMLP(mlp, scaler)
 
-    # Efficient SHAP (limit sampling)
-    shap_values = explainer.shap_values(sample_scaled, nsamples=60)
+        exact = ExactShapExplainer.from_kernel_explainer(mlp, kernel_explainer)
+        self.explainer = exact if shap_engine == "exact" else kernel_explainer
 
-    contributions = dict(
-        zip(sample_df.columns, shap_values[0])
+        # Few-row background summary, for when the request deadline is tight
+        self.approx_explainer = exact.summarized(SHAP_APPROX_ROWS)
+
+        # Artifact version (set by the watcher, see artifacts.py)
+        self.version = version
+
+
+def load_vitals_model(directory=None):
+    def path(name):
+        return os.path.join(directory, name) if directory else artifact_path(name)
+
+    # shap is imported by joblib when the explainer is unpickled
+    return VitalsModel(
+        joblib.load(path("mlp_regressor.pkl"), mmap_mode=ARTIFACT_MMAP_MODE),
+        joblib.load(path("scaler.pkl"), mmap_mode=ARTIFACT_MMAP_MODE),
+        joblib.load(path("shap_explainer.pkl"), mmap_mode=ARTIFACT_MMAP_MODE)
     )
 
+
+# Fixed input for the warm-up inference before a model is swapped in
+WARMUP_VITALS = {
+    "Age": 45, "Sex": 1, "Heart_Rate": 80,
+    "Systolic_BP": 120, "Diastolic_BP": 80, "Temperature": 37.0
+}
+
+
+def warm_up_vitals_model(model):
+    """One full inference (predict + both SHAP paths); raises if unusable."""
+    prediction, contributions, _ = run_vitals_inference(WARMUP_VITALS, model)
+    run_vitals_inference_approx(WARMUP_VITALS, model)
+    values = [prediction, *contributions.values()]
+    if not np.all(np.isfinite(values)):
+        raise ValueError(f"Warm-up inference is not finite: {values}")
+
+
+# Versioned artifacts, hot-swapped in the background (see artifacts.py)
+vitals_watcher = ModelWatcher(ArtifactStore(), "vitals", load_vitals_model, warm_up_vitals_model)
+
+registry.register("vitals", vitals_watcher.load_active)
+
+# ----------------------------
+# Inference Function
+# ----------------------------
+def run_mlp_inference(sample_df, visualize=True):
+
+    prediction, contributions, base_value = run_vitals_inference(sample_df)
+
     # print("\nPredicted Risk:", round(prediction, 4))
     # print("\nFeature Contributions (sorted):")
 
-    for k, v in sorted(contributions.items(),
-                       key=lambda x: abs(x[1]),
-                       reverse=True):
-        print(f"{k}: {v:.4f}")
+    if logger.isEnabledFor(logging.DEBUG):
+        for k, v in sorted(contributions.items(),
+                           key=lambda x: abs(x[1]),
+                           reverse=True):
+            logger.debug("%s: %.4f", k, v)
 
     # ----------------------------
     # Optional Visualization
     # ----------------------------
     # if visualize:
+    #     import shap
+    #     import matplotlib.pyplot as plt
     #     explanation = shap.Explanation(
     #         values=shap_values[0],
-    #         base_values=explainer.expected_value,
+    #         base_values=model.explainer.expected_value,
     #         data=sample_df.iloc[0].values,
     #         feature_names=sample_df.columns
     #     )
@@ -52,8 +115,95 @@ def run_mlp_inference(sample_df, visualize=True):
     #     shap.plots.waterfall(explanation)
     #     plt.show()
 
-    return prediction, contributions, explainer.expected_value
+    return prediction, contributions, base_value
+
+
+def run_vitals_inference(vitals, model=None):
+    """
+    Single-patient path without pandas or sklearn validation.
+
+    Args:
+        vitals: dict keyed by feature name, tuple of 6 values, (6,) array
+            or a one-row DataFrame.
+        model (VitalsModel | None): Pinned model; the active one if None.
+
+    Returns:
+        prediction (float), contributions (dict), base value
+    """
+
+    model = model or registry.get("vitals")
+    compiled = model.compiled
+
+    with span("vitals_predict"):
+        X = compiled.as_matrix(vitals)
+        prediction = float(compiled.predict(X)[0])
+
+    # SHAP (nsamples only applies to the kernel engine)
+    with span("shap"):
+        shap_values = model.explainer.shap_values(compiled.transform(X), nsamples=60)
+
+    contributions = dict(
+        zip(compiled.features, shap_values[0])
+    )
+
+    return prediction, contributions, model.explainer.expected_value
+
+
+def run_vitals_inference_approx(vitals, model=None):
+    """
+    run_vitals_inference with approximate SHAP values (summarized
+    background), for the degraded admission tiers.
+
+    Returns:
+        prediction (float), contributions (dict), base value
+    """
+
+    model = model or registry.get("vitals")
+    compiled = model.compiled
+
+    with span("vitals_predict"):
+        X = compiled.as_matrix(vitals)
+        prediction = float(compiled.predict(X)[0])
+
+    with span("shap_approx"):
+        shap_values = model.approx_explainer.shap_values(compiled.transform(X))
+
+    contributions = dict(
+        zip(compiled.features, shap_values[0])
+    )
+
+    return prediction, contributions, model.approx_explainer.expected_value
+
+
+# ----------------------------
+# Batch Inference Function
+# ----------------------------
+def run_mlp_inference_batch(samples_df, model=None):
+    """
+    Scores n patients in one scaler/predict/SHAP pass. Accepts an (n, 6)
+    frame or array, or a list of vitals dicts.
+
+    Returns:
+        predictions (ndarray), contributions (list of dicts), base value
+    """
+
+    model = model or registry.get("vitals")
+
+    compiled = model.compiled
+
+    with span("vitals_predict"):
+        X = compiled.as_matrix(samples_df)
+        predictions = compiled.predict(X)
+
+    with span("shap"):
+        shap_values = model.explainer.shap_values(compiled.transform(X), nsamples=60)
+
+    columns = compiled.features
+    contributions = [
+        dict(zip(columns, row)) for row in shap_values
+    ]
 
+    return predictions, contributions, model.explainer.expected_value
 
 # ----------------------------
 # Example Usage
@@ -0,0 +1,128 @@
+# registry.py
+#
+# Lazy, shared model registry. Modules register a loader per artifact at
+# import time; nothing heavy is loaded until the first get() (or until a
+# warm-up is requested). Paths resolve relative to this package, so the
+# service no longer depends on the working directory.
+#
+# For multi-worker deployments load everything in the master process
+# before forking (PRELOAD_MODELS=1, see gunicorn.conf.py): workers then
+# share the read-only weights copy-on-write instead of each holding a copy.
+
+import gc
+import os
+import logging
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# joblib arrays are memory-mapped read-only when set (e.g. "r")
+ARTIFACT_MMAP_MODE = os.getenv("ARTIFACT_MMAP_MODE") or None
+
+logger = logging.getLogger(__name__)
+
+
+def artifact_path(name):
+    return os.path.join(BASE_DIR, name)
+
+
+class ModelRegistry:
+
+    def __init__(self):
+        self._loaders = {}
+        self._models = {}
+        self._errors = {}
+        self._load_ms = {}
+        self._locks = {}
+        self._registry_lock = threading.Lock()
+        self._warmup_thread = None
+
+    def register(self, name, loader):
+        with self._registry_lock:
+            self._loaders[name] = loader
+            self._locks.setdefault(name, threading.Lock())
+
+    def get(self, name):
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        if name not in self._loaders:
+            raise KeyError(f"No model registered under '{name}'")
+
+        with self._locks[name]:
+            # Another thread may have finished loading while we waited
+            if name in self._models:
+                return self._models[name]
+
+            started = time.perf_counter()
+            try:
+                model = self._loaders[name]()
+            except Exception as e:
+                self._errors[name] = f"{type(e).__name__}: {e}"
+                raise
+
+            self._load_ms[name] = (time.perf_counter() - started) * 1000.0
+            self._errors.pop(name, None)
+            self._models[name] = model
+            return model
+
+    def set(self, name, model):
+        """Replaces a loaded model (the old object stays valid for holders)."""
+        self._models[name] = model
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    # ----------------------------
+    # Warm-up
+    # ----------------------------
+
+    def warm_up(self, names=None):
+        for name in names or list(self._loaders):
+            try:
+                self.get(name)
+            except Exception:
+                logger.exception("Model warm-up failed for '%s'", name)
+
+    def start_background_warmup(self, names=None):
+        if self._warmup_thread is None or not self._warmup_thread.is_alive():
+            self._warmup_thread = threading.Thread(
+                target=self.warm_up, args=(names,), name="model-warmup", daemon=True
+            )
+            self._warmup_thread.start()
+        return self._warmup_thread
+
+    def preload_for_fork(self):
+        """
+        Loads everything, then moves the resulting objects to the permanent
+        GC generation so collections in forked workers don't write to (and
+        un-share) the pages holding them.
+        """
+        self.warm_up()
+        gc.collect()
+        gc.freeze()
+
+    # ----------------------------
+    # Status
+    # ----------------------------
+
+    def ready(self):
+        return all(name in self._models for name in self._loaders)
+
+    def status(self):
+        status = {}
+        for name in self._loaders:
+            if name in self._models:
+                status[name] = {"state": "loaded", "load_ms": round(self._load_ms.get(name, 0.0), 1)}
+            elif name in self._errors:
+                status[name] = {"state": "error", "error": self._errors[name]}
+            elif self._locks[name].locked():
+                status[name] = {"state": "loading"}
+            else:
+                status[name] = {"state": "pending"}
+        return status
+
+
+registry = ModelRegistry()
@@ -0,0 +1,130 @@
+# router.py
+#
+# Local department router: picks a department for a patient without an
+# LLM round trip. Each department is indexed once as a TF-IDF vector over
+# its name, description and a short list of routing hints (word + char
+# n-grams, so "cardiac" still lands near "Cardiology"). A request is scored
+# against every department in a single sparse matrix product over the
+# patient text; the top zero-shot label adds a per-department prior.
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+# --------------------------------------------------
+# Routing hints (lowercase department name -> terms)
+# --------------------------------------------------
+
+ROUTING_HINTS = {
+    "emergency": "unconscious unresponsive collapse fainted severe bleeding trauma accident injury crash fall burn seizure choking not breathing anaphylaxis overdose critical life-threatening emergency",
+    "cardiology": "chest pain chest tightness palpitations heart attack angina arrhythmia irregular heartbeat racing heart high blood pressure hypertension cardiac",
+    "neurology": "headache migraine seizure numbness tingling weakness one side slurred speech stroke dizziness vertigo confusion memory loss tremor paralysis",
+    "pulmonology": "cough shortness of breath breathlessness difficulty breathing wheezing asthma pneumonia lungs sputum copd tuberculosis",
+    "general medicine": "fever cold flu fatigue tiredness body ache weakness general checkup routine mild",
+    "gastroenterology": "stomach pain abdominal pain nausea vomiting diarrhea constipation acidity heartburn bloating jaundice liver blood in stool",
+    "infectious diseases": "infection fever chills high fever dengue malaria typhoid covid contagious rash fever",
+    "orthopedics": "fracture broken bone joint pain back pain knee pain sprain dislocation swelling limb",
+    "dermatology": "rash itching skin lesion acne eczema hair loss nail infection hives",
+    "ent": "ear pain hearing loss sore throat tonsils sinus nosebleed blocked nose hoarse voice",
+    "ophthalmology": "eye pain blurred vision red eye vision loss eye injury",
+    "nephrology": "kidney decreased urine swelling dialysis kidney failure creatinine",
+    "urology": "painful urination burning urination urinary kidney stone blood in urine prostate",
+    "endocrinology": "thyroid hormone weight gain weight loss excessive thirst",
+    "diabetology": "diabetes blood sugar high sugar low sugar hypoglycemia insulin",
+    "psychiatry": "depression anxiety suicidal hallucinations panic mood insomnia",
+    "clinical psychology": "stress counselling therapy grief",
+    "pediatrics": "child baby infant toddler kid",
+    "neonatology": "newborn neonate premature",
+    "obstetrics": "pregnant pregnancy labor contractions bleeding during pregnancy",
+    "gynecology": "menstrual period pain vaginal bleeding pelvic pain",
+    "toxicology": "poisoning overdose ingested chemical snake bite",
+    "hematology": "anemia bruising bleeding disorder low hemoglobin",
+    "oncology": "cancer tumor lump chemotherapy",
+    "allergy & asthma": "allergy allergic reaction sneezing hives swelling",
+    "rheumatology": "joint swelling stiffness arthritis lupus",
+    "geriatrics": "elderly old age frailty falls",
+    "dentistry": "tooth toothache gums dental",
+    "vascular surgery": "leg swelling varicose veins cold limb poor circulation",
+    "general surgery": "appendicitis hernia abdominal surgery",
+    "sleep medicine": "snoring sleep apnea insomnia",
+    "pain management": "chronic pain",
+}
+
+# Extra score added to a department when the zero-shot label is the key
+SEVERITY_PRIORS = {
+    "critical life-threatening emergency": {"emergency": 0.15},
+    "routine non-urgent condition": {"general medicine": 0.02},
+}
+
+DEFAULT_DEPARTMENT = "general medicine"
+
+
+class DepartmentRouter:
+
+    def __init__(self, departments_df, min_score=0.05):
+        """
+        Args:
+            departments_df (DataFrame): Needs department_id, name, description.
+            min_score (float): Below this similarity the route is reported as
+                low-confidence (callers may fall back to the LLM).
+        """
+        self.min_score = min_score
+
+        self.ids = departments_df["department_id"].tolist()
+        self.names = departments_df["name"].tolist()
+        names_lower = [n.lower().strip() for n in self.names]
+        self._index = {n: i for i, n in enumerate(names_lower)}
+
+        docs = [
+            f"{name} {name} {desc} {ROUTING_HINTS.get(key, '')}"
+            for name, key, desc in zip(
+                self.names,
+                names_lower,
+                departments_df["description"].fillna("").tolist()
+            )
+        ]
+
+        self._word = TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, stop_words="english")
+        self._char = TfidfVectorizer(analyzer="char_wb", ngram_range=(3, 5), sublinear_tf=True)
+
+        self._word_matrix = self._word.fit_transform(docs)
+        self._char_matrix = self._char.fit_transform(docs)
+
+        self._priors = {}
+        for label, boosts in SEVERITY_PRIORS.items():
+            prior = np.zeros(len(self.ids))
+            for name, boost in boosts.items():
+                if name in self._index:
+                    prior[self._index[name]] = boost
+            self._priors[label] = prior
+
+        self.default_index = self._index.get(DEFAULT_DEPARTMENT, 0)
+
+    def scores(self, text, top_label=None):
+        query = [text or ""]
+        word = (self._word_matrix @ normalize(self._word.transform(query)).T).toarray().ravel()
+        char = (self._char_matrix @ normalize(self._char.transform(query)).T).toarray().ravel()
+
+        scores = 0.7 * word + 0.3 * char
+        if top_label in self._priors:
+            scores = scores + self._priors[top_label]
+        return scores
+
+    def route(self, text, top_label=None):
+        """
+        Returns:
+            dict: department_id, name, score and whether it cleared min_score.
+                  Low-confidence requests get the default department.
+        """
+        scores = self.scores(text, top_label)
+        best = int(np.argmax(scores))
+        confident = bool(scores[best] >= self.min_score)
+        if not confident:
+            best = self.default_index
+
+        return {
+            "department_id": self.ids[best],
+            "name": self.names[best],
+            "score": float(scores[best]),
+            "confident": confident
+        }
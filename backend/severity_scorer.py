@@ -0,0 +1,210 @@
+# severity_scorer.py
+#
+# Dedicated scorer for the three fixed severity hypotheses.
+#
+# The generic zero-shot pipeline re-renders the hypothesis template,
+# re-tokenizes the premise once per label and pads each call on its own.
+# Here the hypotheses are tokenized once at load, each premise is
+# tokenized once, and the premise/hypothesis pairs are assembled directly
+# from token ids. Pairs go to the model as one padded batch whose length
+# is rounded up to a bucket size, and multi-text batches are grouped by
+# bucket so short texts are not padded to the longest one.
+#
+# BART is a cross-encoder (premise and hypothesis attend to each other),
+# so the encoder pass itself cannot be shared across hypotheses; the
+# saving is in tokenization, padding and one forward call per bucket.
+#
+#   python severity_scorer.py [repeats]   # speedup vs the generic pipeline call
+
+import os
+import sys
+import time
+
+import numpy as np
+
+from zeroshot import labels, severity_map
+from zeroshot_onnx import HYPOTHESIS_TEMPLATE, SYMPTOM_TEXTS
+
+SEVERITY_BUCKET = int(os.getenv("SEVERITY_BUCKET", "16"))
+
+
+def _torch_forward(model):
+    import torch
+
+    def forward(input_ids, attention_mask):
+        with torch.inference_mode():
+            out = model(
+                input_ids=torch.from_numpy(input_ids),
+                attention_mask=torch.from_numpy(attention_mask)
+            )
+        return out.logits.float().numpy()
+
+    return forward
+
+
+def _onnx_forward(session):
+
+    def forward(input_ids, attention_mask):
+        return session.run(
+            ["logits"],
+            {"input_ids": input_ids, "attention_mask": attention_mask}
+        )[0]
+
+    return forward
+
+
+def _pair_template(tokenizer):
+    """
+    Learns how the tokenizer wraps a (premise, hypothesis) pair in special
+    tokens, e.g. BART: <s> A </s></s> B </s> -> ([0], [2, 2], [2]).
+    """
+    a = tokenizer.encode("premise", add_special_tokens=False)
+    b = tokenizer.encode("hypothesis", add_special_tokens=False)
+    full = tokenizer.encode("premise", "hypothesis")
+
+    i = next(k for k in range(len(full)) if full[k:k + len(a)] == a)
+    j = next(k for k in range(i + len(a), len(full)) if full[k:k + len(b)] == b)
+    return full[:i], full[i + len(a):j], full[j + len(b):]
+
+
+def _entailment_id(config):
+    for i, label in config.id2label.items():
+        if label.lower().startswith("entail"):
+            return int(i)
+    return -1
+
+
+class SeverityScorer:
+
+    def __init__(self, tokenizer, forward, entailment_id, bucket=SEVERITY_BUCKET,
+                 max_length=None, hypothesis_template=HYPOTHESIS_TEMPLATE):
+        """
+        Args:
+            tokenizer: Hugging Face tokenizer of the NLI model.
+            forward (callable): (input_ids, attention_mask) int64 arrays -> logits.
+            entailment_id (int): Index of the entailment logit.
+            bucket (int): Padded sequence lengths are rounded up to a multiple of this.
+        """
+        self.tokenizer = tokenizer
+        self.forward = forward
+        self.entailment_id = entailment_id
+        self.bucket = max(1, bucket)
+        self.max_length = max_length or min(getattr(tokenizer, "model_max_length", 1024), 1024)
+        self.pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else 0
+
+        # Precomputed once: hypothesis ids and the severity weight per label
+        self.hypothesis_ids = [
+            tokenizer.encode(hypothesis_template.format(label), add_special_tokens=False)
+            for label in labels
+        ]
+        self.weights = np.array([severity_map[label] for label in labels])
+
+        # Special tokens placed around a pair, measured once
+        self._prefix, self._middle, self._suffix = _pair_template(tokenizer)
+        self._special = len(self._prefix) + len(self._middle) + len(self._suffix)
+
+    @classmethod
+    def from_pipeline(cls, pipe, **kwargs):
+        return cls(pipe.tokenizer, _torch_forward(pipe.model), _entailment_id(pipe.model.config), **kwargs)
+
+    @classmethod
+    def from_onnx(cls, classifier, **kwargs):
+        return cls(classifier.tokenizer, _onnx_forward(classifier.session), classifier.entailment_id, **kwargs)
+
+    @classmethod
+    def from_backend(cls, backend, **kwargs):
+        if hasattr(backend, "session"):
+            return cls.from_onnx(backend, **kwargs)
+        return cls.from_pipeline(backend, **kwargs)
+
+    def _pairs(self, text):
+        premise = self.tokenizer.encode(text, add_special_tokens=False)
+        rows = []
+        for hyp in self.hypothesis_ids:
+            # truncation="only_first": only the premise is cut
+            room = self.max_length - len(hyp) - self._special
+            rows.append(self._prefix + premise[:room] + self._middle + hyp + self._suffix)
+        return rows
+
+    def _bucketed(self, length):
+        return -(-length // self.bucket) * self.bucket
+
+    def _run(self, rows):
+        longest = max(len(r) for r in rows)
+        # Never pad past the model's max length just to fill a bucket
+        width = max(longest, min(self._bucketed(longest), self.max_length))
+        input_ids = np.full((len(rows), width), self.pad_id, dtype=np.int64)
+        attention_mask = np.zeros((len(rows), width), dtype=np.int64)
+        for i, row in enumerate(rows):
+            input_ids[i, :len(row)] = row
+            attention_mask[i, :len(row)] = 1
+        return self.forward(input_ids, attention_mask)
+
+    def score(self, texts):
+        """
+        Returns:
+            list of (risk_score, top_label), same contract as compute_risk_score.
+        """
+
+        texts = list(texts)
+        n_labels = len(labels)
+        pairs = [self._pairs(text) for text in texts]
+
+        # Group texts by bucketed length: one forward call per bucket
+        groups = {}
+        for i, rows in enumerate(pairs):
+            groups.setdefault(self._bucketed(max(len(r) for r in rows)), []).append(i)
+
+        entail = np.empty((len(texts), n_labels))
+        for members in groups.values():
+            rows = [row for i in members for row in pairs[i]]
+            logits = self._run(rows)[:, self.entailment_id]
+            entail[members] = logits.reshape(len(members), n_labels)
+
+        # Softmax of the entailment logit across labels (pipeline, multi_label=False)
+        entail = np.exp(entail - entail.max(axis=1, keepdims=True))
+        probs = entail / entail.sum(axis=1, keepdims=True)
+
+        risk = probs @ self.weights
+        top = probs.argmax(axis=1)
+        return [(float(r), labels[t]) for r, t in zip(risk, top)]
+
+# ----------------------------
+# Benchmark
+# ----------------------------
+
+def bench(repeats=20):
+    from zeroshot import load_backend, _score_result
+
+    backend = load_backend()
+    scorer = SeverityScorer.from_backend(backend)
+
+    def generic(text):
+        return _score_result(backend(text, labels))
+
+    def dedicated(text):
+        return scorer.score([text])[0]
+
+    for fn in (generic, dedicated):
+        fn(SYMPTOM_TEXTS[0])  # warm-up
+
+    results = {}
+    for name, fn in (("pipeline", generic), ("severity", dedicated)):
+        times = []
+        for i in range(repeats):
+            started = time.perf_counter()
+            fn(SYMPTOM_TEXTS[i % len(SYMPTOM_TEXTS)])
+            times.append((time.perf_counter() - started) * 1000.0)
+        results[name] = np.median(times)
+        print(f"{name:<9} p50 {results[name]:8.2f} ms  p95 {np.percentile(times, 95):8.2f} ms")
+
+    max_diff = max(
+        abs(generic(t)[0] - dedicated(t)[0]) for t in SYMPTOM_TEXTS
+    )
+    print(f"speedup {results['pipeline'] / results['severity']:.2f}x, "
+          f"max |risk diff| vs pipeline {max_diff:.2e}")
+    return results
+
+
+if __name__ == "__main__":
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
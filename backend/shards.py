@@ -0,0 +1,112 @@
+# shards.py
+#
+# Columnar training-data shards shared by synth.py (writer) and MLP.py
+# (reader). A shard directory holds part-NNNNN.npy float32 matrices (or
+# .parquet files) plus a manifest.json listing columns and row counts, so
+# readers can stream one shard at a time with bounded memory.
+
+import os
+import json
+import glob
+
+import numpy as np
+
+COLUMNS = ["Age", "Sex", "Heart_Rate", "Systolic_BP", "Diastolic_BP", "Temperature", "Risk"]
+FEATURES = COLUMNS[:-1]
+TARGET = COLUMNS[-1]
+
+MANIFEST = "manifest.json"
+
+
+class ShardWriter:
+
+    def __init__(self, directory, fmt="npy", columns=COLUMNS):
+        if fmt not in ("npy", "parquet"):
+            raise ValueError(f"Unknown shard format: '{fmt}' (expected 'npy' or 'parquet')")
+        self.directory = directory
+        self.fmt = fmt
+        self.columns = list(columns)
+        self.shards = []
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, matrix):
+        """Writes one (n, len(columns)) chunk as the next shard."""
+        matrix = np.asarray(matrix, dtype=np.float32)
+        name = f"part-{len(self.shards):05d}.{self.fmt}"
+        path = os.path.join(self.directory, name)
+
+        if self.fmt == "npy":
+            np.save(path, matrix)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.table({c: matrix[:, i] for i, c in enumerate(self.columns)})
+            pq.write_table(table, path)
+
+        self.shards.append({"file": name, "rows": int(matrix.shape[0])})
+
+    def close(self):
+        manifest = {
+            "format": self.fmt,
+            "columns": self.columns,
+            "rows": sum(s["rows"] for s in self.shards),
+            "shards": self.shards,
+        }
+        with open(os.path.join(self.directory, MANIFEST), "w") as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+
+def read_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+
+    # No manifest: fall back to whatever part files are present
+    files = sorted(glob.glob(os.path.join(directory, "part-*.npy"))) or \
+        sorted(glob.glob(os.path.join(directory, "part-*.parquet")))
+    return {
+        "format": "npy" if files and files[0].endswith(".npy") else "parquet",
+        "columns": COLUMNS,
+        "shards": [{"file": os.path.basename(f)} for f in files],
+    }
+
+
+def load_shard(directory, shard, fmt, columns=COLUMNS, mmap=True):
+    path = os.path.join(directory, shard["file"])
+    if fmt == "npy":
+        return np.load(path, mmap_mode="r" if mmap else None)
+
+    import pyarrow.parquet as pq
+    table = pq.read_table(path, columns=list(columns))
+    return np.column_stack([table[c].to_numpy() for c in columns]).astype(np.float32)
+
+
+def iter_shards(directory, shards=None):
+    """
+    Yields (X, y) per shard as float64 arrays, in manifest order.
+    `shards` optionally restricts to a subset of shard indices.
+    """
+    manifest = read_manifest(directory)
+    columns = manifest["columns"]
+    feature_idx = [columns.index(c) for c in FEATURES]
+    target_idx = columns.index(TARGET)
+
+    for i, shard in enumerate(manifest["shards"]):
+        if shards is not None and i not in shards:
+            continue
+        data = load_shard(directory, shard, manifest["format"], columns)
+        yield (
+            np.asarray(data[:, feature_idx], dtype=np.float64),
+            np.asarray(data[:, target_idx], dtype=np.float64),
+        )
+
+
+def iter_batches(directory, batch_size, shards=None, rng=None):
+    """Mini-batches over the shards; rows are shuffled within each shard if rng is given."""
+    for X, y in iter_shards(directory, shards):
+        order = rng.permutation(len(y)) if rng is not None else np.arange(len(y))
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            yield X[idx], y[idx]
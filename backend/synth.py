@@ -1,8 +1,13 @@
+import argparse
+
 import numpy as np
 import pandas as pd
 
-np.random.seed(42)
+from shards import COLUMNS, ShardWriter
+
+SEED = 42
 N = 5000
+OUTPUT_CSV = "synthetic_medical_data.csv"  # read by MLP.py
 
 # ----------------------------
 # Helper: Piecewise severity
@@ -15,77 +20,119 @@ def scale(value, low, mid, high):
     low → mid → linear to 0.6
     mid → high → linear to 1
     above high → 1
+
+    Works on scalars and arrays (np.interp clamps outside [low, high]).
+    Unlike the old np.vectorize version, the result is always float: that
+    one took its output dtype from the first element and truncated every
+    score to 0/1 whenever the first value was <= low.
     """
-    if value <= low:
-        return 0
-    elif value <= mid:
-        return 0.6 * (value - low) / (mid - low)
-    elif value <= high:
-        return 0.6 + 0.4 * (value - mid) / (high - mid)
-    else:
-        return 1
+    return np.interp(value, [low, mid, high], [0.0, 0.6, 1.0])
 
-# Vectorized version
-def vscale(arr, low, mid, high):
-    return np.vectorize(scale)(arr, low, mid, high)
+# Kept for callers of the old name; scale is already vectorized
+vscale = scale
 
 # ----------------------------
 # Generate vitals
 # ----------------------------
 
-age = np.random.randint(18, 90, N)
-sex = np.random.binomial(1, 0.5, N)
+def generate_chunk(rng, n):
+    """
+    Generates n rows as an (n, len(COLUMNS)) float matrix.
+    Draw order matches the original single-shot script, so a fresh
+    RandomState(42) with n=5000 reproduces the original vitals.
+    """
 
-heart_rate = np.clip(np.random.normal(85, 25, N), 40, 180)
-sbp = np.clip(np.random.normal(130 + 0.3*age, 25, N), 70, 220)
-dbp = np.clip(np.random.normal(80 + 0.2*age, 15, N), 40, 130)
-temperature = np.clip(np.random.normal(37.2, 0.8, N), 34, 41)
+    age = rng.randint(18, 90, n)
+    sex = rng.binomial(1, 0.5, n)
 
-# ----------------------------
-# Severity Scores
-# ----------------------------
+    heart_rate = np.clip(rng.normal(85, 25, n), 40, 180)
+    sbp = np.clip(rng.normal(130 + 0.3*age, 25, n), 70, 220)
+    dbp = np.clip(rng.normal(80 + 0.2*age, 15, n), 40, 130)
+    temperature = np.clip(rng.normal(37.2, 0.8, n), 34, 41)
 
-sbp_sev = vscale(sbp, 130, 160, 190)
-dbp_sev = vscale(dbp, 85, 100, 115)
-hr_sev = vscale(heart_rate, 100, 120, 150)
-temp_sev = vscale(temperature, 37.5, 38.5, 39.5)
-age_sev = vscale(age, 60, 70, 85)
+    # ----------------------------
+    # Severity Scores
+    # ----------------------------
 
-# Shock condition bonus
-shock = ((sbp < 95) & (heart_rate > 110)).astype(float)
+    sbp_sev = scale(sbp, 130, 160, 190)
+    dbp_sev = scale(dbp, 85, 100, 115)
+    hr_sev = scale(heart_rate, 100, 120, 150)
+    temp_sev = scale(temperature, 37.5, 38.5, 39.5)
+    age_sev = scale(age, 60, 70, 85)
 
-# ----------------------------
-# Combine Severity (Structured)
-# ----------------------------
+    # Shock condition bonus
+    shock = ((sbp < 95) & (heart_rate > 110)).astype(float)
+
+    # ----------------------------
+    # Combine Severity (Structured)
+    # ----------------------------
 
-risk = (
-    0.30 * sbp_sev +
-    0.15 * dbp_sev +
-    0.15 * hr_sev +
-    0.15 * temp_sev +
-    0.10 * age_sev +
-    0.10 * shock +
-    0.05 * sex
-)
+    risk = (
+        0.30 * sbp_sev +
+        0.15 * dbp_sev +
+        0.15 * hr_sev +
+        0.15 * temp_sev +
+        0.10 * age_sev +
+        0.10 * shock +
+        0.05 * sex
+    )
 
-risk = np.clip(risk, 0, 0.95)  # intentional ceiling
+    risk = np.clip(risk, 0, 0.95)  # intentional ceiling
+
+    return np.column_stack([age, sex, heart_rate, sbp, dbp, temperature, risk])
+
+
+def generate(n, chunk_rows, seed=SEED):
+    """Yields chunks of at most chunk_rows rows until n rows have been produced."""
+    rng = np.random.RandomState(seed)
+    remaining = n
+    while remaining > 0:
+        size = min(chunk_rows, remaining)
+        yield generate_chunk(rng, size)
+        remaining -= size
 
 # ----------------------------
 # Save
 # ----------------------------
 
-data = pd.DataFrame({
-    "Age": age,
-    "Sex": sex,
-    "Heart_Rate": heart_rate,
-    "Systolic_BP": sbp,
-    "Diastolic_BP": dbp,
-    "Temperature": temperature,
-    "Risk": risk
-})
-
-data.to_csv("structured_synthetic_medical_data.csv", index=False)
-
-print("Saved to structured_synthetic_medical_data.csv")
-print("\nRisk Summary:")
-print(data["Risk"].describe())
+def write_csv(n=N, path=OUTPUT_CSV, chunk_rows=1_000_000, seed=SEED):
+    for i, chunk in enumerate(generate(n, chunk_rows, seed)):
+        frame = pd.DataFrame(chunk, columns=COLUMNS)
+        frame["Age"] = frame["Age"].astype(int)
+        frame["Sex"] = frame["Sex"].astype(int)
+        frame.to_csv(path, mode="w" if i == 0 else "a", header=(i == 0), index=False)
+
+    print(f"Saved {n} rows to {path}")
+    if n <= chunk_rows:
+        print("\nRisk Summary:")
+        print(frame["Risk"].describe())
+
+
+def write_shards(n, directory, chunk_rows=1_000_000, fmt="npy", seed=SEED):
+    """
+    Streams n rows into columnar shards of chunk_rows each. Only one chunk
+    is held in memory at a time, so n is bounded by disk, not RAM.
+    """
+
+    writer = ShardWriter(directory, fmt=fmt)
+    for chunk in generate(n, chunk_rows, seed):
+        writer.write(chunk)
+        print(f"  shard {len(writer.shards) - 1}: {len(chunk)} rows")
+    manifest = writer.close()
+    print(f"Saved {manifest['rows']} rows in {len(manifest['shards'])} {fmt} shards to {directory}")
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetic vitals/risk training data")
+    parser.add_argument("--rows", type=int, default=N)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--chunk-rows", type=int, default=1_000_000)
+    parser.add_argument("--format", choices=["csv", "npy", "parquet"], default="csv")
+    parser.add_argument("--out", help=f"CSV path (default {OUTPUT_CSV}) or shard directory")
+    args = parser.parse_args()
+
+    if args.format == "csv":
+        write_csv(args.rows, args.out or OUTPUT_CSV, args.chunk_rows, args.seed)
+    else:
+        write_shards(args.rows, args.out or "shards", args.chunk_rows, args.format, args.seed)
@@ -0,0 +1,279 @@
+# tracing.py
+#
+# Lightweight request tracing and latency metrics.
+#
+#   with span("zeroshot"):
+#       ...
+#
+# Every span is recorded in a per-stage histogram. Inside a request (see
+# trace_request, applied by the middleware in main.py) spans are also
+# collected on the request's trace, so slow requests can be logged with a
+# per-stage breakdown. Slow-request logging is sampled (TRACE_SLOW_SAMPLE)
+# to bound log volume under load.
+#
+# render_prometheus() renders all histograms, plus the HTTP upstream and
+# batcher metrics, in the Prometheus text exposition format for /metrics.
+# With ZEROSHOT_SERVER the batcher lives in the inference server; a scrape
+# waits at most METRICS_SERVER_TIMEOUT for it and leaves the batcher
+# metrics out when it is slow or down, so /metrics never fails.
+#
+#   TRACE_SLOW_MS            request duration above which a request is "slow"
+#   TRACE_SLOW_SAMPLE        fraction of slow requests that are logged (0..1)
+#   METRICS_SERVER_TIMEOUT   seconds a scrape waits for inference server stats (0.5)
+
+import os
+import time
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "1000"))
+TRACE_SLOW_SAMPLE = float(os.getenv("TRACE_SLOW_SAMPLE", "0.1"))
+METRICS_SERVER_TIMEOUT = float(os.getenv("METRICS_SERVER_TIMEOUT", "0.5"))
+
+# Histogram bucket upper bounds (seconds)
+DURATION_BUCKETS_S = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf")]
+
+# Stages of a /triage request
+STAGES = [
+    "supabase_lookup",
+    "zeroshot",
+    "vitals_predict",
+    "shap",
+    "shap_approx",
+    "explanation_llm",
+    "department_routing",
+]
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+# Called as fn(route, seconds, trace) after every traced request
+_trace_listeners = []
+
+# Called as fn(stage, seconds, completed) after every span (e.g. admission.py's
+# estimates); completed is False when the block raised or was cancelled
+_span_listeners = []
+
+
+class Histogram:
+
+    def __init__(self, buckets=DURATION_BUCKETS_S):
+        self.bounds = list(buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.sum = 0.0
+        self.buckets = [0] * len(self.bounds)
+
+    def observe(self, value):
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            for i, bound in enumerate(self.bounds):
+                if value <= bound:
+                    self.buckets[i] += 1
+                    break
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "count": self.count,
+                "sum": self.sum,
+                "buckets": dict(zip(self.bounds, self.buckets)),
+            }
+
+
+class HistogramFamily:
+    """Histograms of one metric, keyed by a single label value."""
+
+    def __init__(self, name, label, help_text):
+        self.name = name
+        self.label = label
+        self.help = help_text
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def get(self, value):
+        histogram = self._histograms.get(value)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(value, Histogram())
+        return histogram
+
+    def observe(self, value, seconds):
+        self.get(value).observe(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            items = list(self._histograms.items())
+        return {value: histogram.snapshot() for value, histogram in sorted(items)}
+
+
+stage_durations = HistogramFamily(
+    "triage_stage_duration_seconds", "stage", "Time spent per triage pipeline stage"
+)
+request_durations = HistogramFamily(
+    "http_request_duration_seconds", "route", "End-to-end request duration per route"
+)
+
+for _stage in STAGES:
+    stage_durations.get(_stage)
+
+# ----------------------------
+# Spans + request traces
+# ----------------------------
+
+class Trace:
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def add(self, stage, seconds):
+        self.spans.append((stage, seconds))
+
+    def breakdown_ms(self):
+        totals = {}
+        for stage, seconds in self.spans:
+            totals[stage] = totals.get(stage, 0.0) + seconds * 1000.0
+        return {stage: round(ms, 2) for stage, ms in totals.items()}
+
+
+@contextmanager
+def span(stage):
+    """Times the block into the stage histogram (and the current request trace)."""
+    started = time.perf_counter()
+    completed = False
+    try:
+        yield
+        completed = True
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_durations.observe(stage, elapsed)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(stage, elapsed)
+        for listener in _span_listeners:
+            listener(stage, elapsed, completed)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def add_trace_listener(fn):
+    _trace_listeners.append(fn)
+
+
+def remove_trace_listener(fn):
+    if fn in _trace_listeners:
+        _trace_listeners.remove(fn)
+
+
+def add_span_listener(fn):
+    _span_listeners.append(fn)
+
+
+@contextmanager
+def trace_request(name):
+    """
+    Collects spans for one request. `name` may be a callable evaluated at
+    the end (e.g. the matched route template, known only after routing).
+    """
+    trace = Trace(name)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        elapsed = time.perf_counter() - trace.started
+        route = trace.name() if callable(trace.name) else trace.name
+        request_durations.observe(route, elapsed)
+        for listener in _trace_listeners:
+            listener(route, elapsed, trace)
+
+        if elapsed * 1000.0 >= TRACE_SLOW_MS and random.random() < TRACE_SLOW_SAMPLE:
+            logger.warning(
+                "slow request %s: %.1f ms, stages %s",
+                route, elapsed * 1000.0, trace.breakdown_ms()
+            )
+
+# ----------------------------
+# Prometheus text format
+# ----------------------------
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _histogram_lines(name, label, value, snapshot):
+    lines = []
+    cumulative = 0
+    for bound, count in snapshot["buckets"].items():
+        cumulative += count
+        lines.append(f'{name}_bucket{{{label}="{_escape(value)}",le="{_format_bound(bound)}"}} {cumulative}')
+    lines.append(f'{name}_sum{{{label}="{_escape(value)}"}} {snapshot["sum"]}')
+    lines.append(f'{name}_count{{{label}="{_escape(value)}"}} {snapshot["count"]}')
+    return lines
+
+
+def _family_lines(name, label, help_text, snapshots):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for value, snapshot in snapshots.items():
+        lines.extend(_histogram_lines(name, label, value, snapshot))
+    return lines
+
+
+def _ms_to_seconds(buckets_ms, sum_ms, count):
+    buckets = {}
+    for bound, c in buckets_ms.items():
+        buckets[float("inf") if bound == "+Inf" else float(bound) / 1000.0] = c
+    return {"buckets": buckets, "sum": sum_ms / 1000.0, "count": count}
+
+
+def render_prometheus():
+    lines = []
+    for family in (stage_durations, request_durations):
+        lines.extend(_family_lines(family.name, family.label, family.help, family.snapshot()))
+
+    # Upstream HTTP latency (http_client.py)
+    from http_client import http_stats
+    upstreams = {
+        name: _ms_to_seconds(s["latency_ms"]["buckets"], s["latency_ms"]["sum_ms"], s["latency_ms"]["count"])
+        for name, s in http_stats().items()
+    }
+    lines.extend(_family_lines(
+        "upstream_request_duration_seconds", "upstream",
+        "Upstream HTTP latency to response headers, per attempt", upstreams
+    ))
+    lines.append("# HELP upstream_retries_total Upstream HTTP retries")
+    lines.append("# TYPE upstream_retries_total counter")
+    for name, s in http_stats().items():
+        lines.append(f'upstream_retries_total{{upstream="{name}"}} {s["retried"]}')
+
+    # Zero-shot micro-batcher queue wait (batcher.py)
+    from zeroshot import batcher_stats
+    try:
+        b = batcher_stats(METRICS_SERVER_TIMEOUT)
+    except Exception as e:
+        logger.warning("Skipping zero-shot batcher metrics: %s: %s", type(e).__name__, e)
+        return "\n".join(lines) + "\n"
+    wait = b["queue_wait_ms"]
+    lines.extend(_family_lines(
+        "zeroshot_batch_queue_wait_seconds", "batcher",
+        "Time a zero-shot request waited for its batch",
+        {b["name"]: _ms_to_seconds(wait["buckets"], wait["sum"], b["items"])}
+    ))
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,312 @@
+# triage_queue.py
+#
+# Server-side priority queue of waiting patients, one heap per department.
+#
+# Entries are ordered by (highest risk first, then earliest arrival). An
+# index from patient_id to its live heap entry gives O(log n) enqueue,
+# pop and re-prioritize, and O(1) remove: superseded entries are only
+# marked dead and dropped lazily when they reach the top (the heap is
+# compacted once dead entries outnumber live ones). Top-k reads walk the
+# heap from the root with a small frontier heap, O(k log k), instead of
+# sorting or scanning the whole queue.
+#
+# That heap lives in one process. Under gunicorn every worker would hold a
+# different slice of the queue, so with TRIAGE_QUEUE_PATH set the queue is
+# kept in a shared SQLite file instead (SQLiteTriageQueue, same API): all
+# workers on the host read and pop the same patients, ordered by an index
+# on (department, risk desc, arrival); a second index on the insertion
+# sequence keeps enqueue and re-prioritize O(log n) like the heap.
+# gunicorn.conf.py sets the path by default. The file is per host; a
+# multi-host deployment needs a queue service in front of it.
+#
+#   TRIAGE_QUEUE_PATH   -> shared SQLite queue file (unset: in-process heap)
+
+import os
+import heapq
+import sqlite3
+import itertools
+import threading
+import time
+
+TRIAGE_QUEUE_PATH = os.getenv("TRIAGE_QUEUE_PATH")
+
+_REMOVED = None
+
+
+class DepartmentQueue:
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {}
+        self._seq = itertools.count()
+        self._dead = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, patient_id):
+        return patient_id in self._entries
+
+    def push(self, patient_id, risk_score, arrival):
+        if patient_id in self._entries:
+            self._discard(patient_id)
+            self._maybe_compact()
+        # [sort key..., patient_id, risk_score, arrival]
+        entry = [-float(risk_score), arrival, next(self._seq), patient_id, float(risk_score), arrival]
+        self._entries[patient_id] = entry
+        heapq.heappush(self._heap, entry)
+
+    def remove(self, patient_id):
+        if patient_id not in self._entries:
+            return False
+        self._discard(patient_id)
+        self._maybe_compact()
+        return True
+
+    def pop(self):
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            if entry[3] is _REMOVED:
+                self._dead -= 1
+                continue
+            del self._entries[entry[3]]
+            return self._public(entry)
+        return None
+
+    def top(self, k):
+        results = []
+        frontier = [(self._heap[0], 0)] if self._heap else []
+        while frontier and len(results) < k:
+            entry, i = heapq.heappop(frontier)
+            if entry[3] is not _REMOVED:
+                results.append(self._public(entry))
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(self._heap):
+                    heapq.heappush(frontier, (self._heap[child], child))
+        return results
+
+    def get(self, patient_id):
+        entry = self._entries.get(patient_id)
+        return self._public(entry) if entry is not None else None
+
+    def _discard(self, patient_id):
+        entry = self._entries.pop(patient_id)
+        entry[3] = _REMOVED
+        self._dead += 1
+
+    def _maybe_compact(self):
+        if self._dead > 64 and self._dead > len(self._entries):
+            self._heap = [e for e in self._heap if e[3] is not _REMOVED]
+            heapq.heapify(self._heap)
+            self._dead = 0
+
+    @staticmethod
+    def _public(entry):
+        return {"patient_id": entry[3], "risk_score": entry[4], "arrival": entry[5]}
+
+
+class TriageQueue:
+
+    def __init__(self):
+        self._queues = {}
+        self._department_of = {}
+        self._lock = threading.Lock()
+
+    def enqueue(self, patient_id, department_id, risk_score, arrival=None):
+        """
+        Adds a patient, or re-prioritizes / moves them if already waiting.
+        A re-triaged patient keeps their original arrival time.
+        """
+        with self._lock:
+            previous = self._department_of.get(patient_id)
+            if previous is not None:
+                queue = self._queues[previous]
+                current = queue.get(patient_id)
+                if arrival is None:
+                    arrival = current["arrival"]
+                if previous != department_id:
+                    queue.remove(patient_id)
+
+            if arrival is None:
+                arrival = time.time()
+
+            queue = self._queues.get(department_id)
+            if queue is None:
+                queue = self._queues[department_id] = DepartmentQueue()
+            queue.push(patient_id, risk_score, arrival)
+            self._department_of[patient_id] = department_id
+
+    def reprioritize(self, patient_id, risk_score):
+        with self._lock:
+            department_id = self._department_of.get(patient_id)
+            if department_id is None:
+                return False
+            queue = self._queues[department_id]
+            queue.push(patient_id, risk_score, queue.get(patient_id)["arrival"])
+            return True
+
+    def pop(self, department_id):
+        with self._lock:
+            queue = self._queues.get(department_id)
+            entry = queue.pop() if queue is not None else None
+            if entry is not None:
+                del self._department_of[entry["patient_id"]]
+            return entry
+
+    def remove(self, patient_id):
+        with self._lock:
+            department_id = self._department_of.pop(patient_id, None)
+            if department_id is None:
+                return False
+            return self._queues[department_id].remove(patient_id)
+
+    def top(self, department_id, k=10):
+        with self._lock:
+            queue = self._queues.get(department_id)
+            return queue.top(k) if queue is not None else []
+
+    def size(self, department_id=None):
+        with self._lock:
+            if department_id is None:
+                return len(self._department_of)
+            queue = self._queues.get(department_id)
+            return len(queue) if queue is not None else 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "waiting": len(self._department_of),
+                "departments": {d: len(q) for d, q in self._queues.items() if len(q)},
+            }
+
+
+class SQLiteTriageQueue:
+    """
+    TriageQueue backed by a SQLite file shared by every worker process.
+
+    Read-modify-write operations (enqueue, pop) run in BEGIN IMMEDIATE
+    transactions, so two workers never pop the same patient.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._connection()
+
+    def _connection(self):
+        # A SQLite connection must not cross fork(): reopened per process
+        pid = os.getpid()
+        if self._pid != pid:
+            self._pid = pid
+            self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS queue ("
+                " patient_id TEXT PRIMARY KEY, department_id, risk_score REAL, arrival REAL, seq INTEGER)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS queue_order"
+                " ON queue(department_id, risk_score DESC, arrival, seq)"
+            )
+            # Keeps MAX(seq) for the next enqueue an index lookup, not a scan
+            self._conn.execute("CREATE INDEX IF NOT EXISTS queue_seq ON queue(seq)")
+        return self._conn
+
+    def _transaction(self, operation):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = operation(conn)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+
+    def _read(self, sql, params=()):
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    @staticmethod
+    def _public(row):
+        return {"patient_id": row[0], "risk_score": row[1], "arrival": row[2]}
+
+    def enqueue(self, patient_id, department_id, risk_score, arrival=None):
+        """
+        Adds a patient, or re-prioritizes / moves them if already waiting.
+        A re-triaged patient keeps their original arrival time.
+        """
+        def operation(conn):
+            nonlocal arrival
+            if arrival is None:
+                row = conn.execute("SELECT arrival FROM queue WHERE patient_id = ?", (patient_id,)).fetchone()
+                arrival = row[0] if row is not None else time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO queue (patient_id, department_id, risk_score, arrival, seq)"
+                " VALUES (?, ?, ?, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM queue))",
+                (patient_id, department_id, float(risk_score), arrival)
+            )
+        self._transaction(operation)
+
+    def reprioritize(self, patient_id, risk_score):
+        def operation(conn):
+            return conn.execute(
+                "UPDATE queue SET risk_score = ?, seq = (SELECT COALESCE(MAX(seq), 0) + 1 FROM queue)"
+                " WHERE patient_id = ?",
+                (float(risk_score), patient_id)
+            ).rowcount > 0
+        return self._transaction(operation)
+
+    def pop(self, department_id):
+        def operation(conn):
+            row = conn.execute(
+                "SELECT patient_id, risk_score, arrival FROM queue WHERE department_id = ?"
+                " ORDER BY risk_score DESC, arrival, seq LIMIT 1",
+                (department_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("DELETE FROM queue WHERE patient_id = ?", (row[0],))
+            return self._public(row)
+        return self._transaction(operation)
+
+    def remove(self, patient_id):
+        with self._lock:
+            return self._connection().execute(
+                "DELETE FROM queue WHERE patient_id = ?", (patient_id,)
+            ).rowcount > 0
+
+    def top(self, department_id, k=10):
+        rows = self._read(
+            "SELECT patient_id, risk_score, arrival FROM queue WHERE department_id = ?"
+            " ORDER BY risk_score DESC, arrival, seq LIMIT ?",
+            (department_id, k)
+        )
+        return [self._public(row) for row in rows]
+
+    def size(self, department_id=None):
+        if department_id is None:
+            return self._read("SELECT COUNT(*) FROM queue")[0][0]
+        return self._read("SELECT COUNT(*) FROM queue WHERE department_id = ?", (department_id,))[0][0]
+
+    def stats(self):
+        rows = self._read("SELECT department_id, COUNT(*) FROM queue GROUP BY department_id")
+        return {
+            "waiting": sum(n for _, n in rows),
+            "departments": {d: n for d, n in rows},
+        }
+
+
+def make_triage_queue(path=TRIAGE_QUEUE_PATH):
+    if path:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return SQLiteTriageQueue(path)
+    return TriageQueue()
+
+
+triage_queue = make_triage_queue()
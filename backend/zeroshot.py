@@ -1,41 +1,146 @@
-import os
-from transformers import pipeline
-
-# 1. Force transformers to look ONLY at your local cache
-os.environ['TRANSFORMERS_OFFLINE'] = '1'
-os.environ['HF_HUB_OFFLINE'] = '1'
-
-print("Loading facebook/bart-large-mnli from local cache...")
-try:
-    # 2. Added local_files_only=True to prevent network calls
-    classifier = pipeline(
-        "zero-shot-classification", 
-        model="facebook/bart-large-mnli",
-        local_files_only=True
-    )
-except Exception as e:
-    print(f"Error loading model: {e}")
-    print("If it says 'Entry Not Found', you may need to run this once on a mobile hotspot.")
-
-labels = [
-    "routine non-urgent condition",
-    "urgent medical attention needed", 
-    "critical life-threatening emergency"
-]
-
-
-def compute_risk_score(text):
-    result = classifier(text, labels)
-
-    severity_map = {
-        "routine non-urgent condition": 0.1,
-        "urgent medical attention needed": 0.6,
-        "critical life-threatening emergency": 0.95
-    }
-
-    risk_score = 0.0
-    for label, score in zip(result["labels"], result["scores"]):
-        risk_score += severity_map[label] * score
-
-    # Return the score and the TOP label string
-    return risk_score, result["labels"][0]
\ No newline at end of file
+import os
+import logging
+from batcher import MicroBatcher
+from registry import registry
+
+logger = logging.getLogger(__name__)
+
+# 1. Force transformers to look ONLY at your local cache
+os.environ['TRANSFORMERS_OFFLINE'] = '1'
+os.environ['HF_HUB_OFFLINE'] = '1'
+
+
+# ZEROSHOT_BACKEND=pytorch -> transformers pipeline (default)
+# ZEROSHOT_BACKEND=onnx    -> ONNX Runtime session from `python zeroshot_onnx.py export`
+ZEROSHOT_MODEL = os.getenv("ZEROSHOT_MODEL", "facebook/bart-large-mnli")
+ZEROSHOT_BACKEND = os.getenv("ZEROSHOT_BACKEND", "pytorch").lower()
+
+
+def load_classifier():
+    # transformers/torch are imported here so importing this module stays cheap
+    from transformers import pipeline
+
+    logger.info("Loading %s from local cache...", ZEROSHOT_MODEL)
+    try:
+        # 2. Added local_files_only=True to prevent network calls
+        return pipeline(
+            "zero-shot-classification",
+            model=ZEROSHOT_MODEL,
+            local_files_only=True
+        )
+    except Exception as e:
+        logger.error("Error loading model: %s", e)
+        logger.error("If it says 'Entry Not Found', you may need to run this once on a mobile hotspot.")
+        raise
+
+
+def load_backend():
+    if ZEROSHOT_BACKEND == "onnx":
+        from zeroshot_onnx import OnnxZeroShotClassifier
+        return OnnxZeroShotClassifier()
+    if ZEROSHOT_BACKEND == "pytorch":
+        return load_classifier()
+    raise ValueError(f"Unknown ZEROSHOT_BACKEND: '{ZEROSHOT_BACKEND}' (expected 'pytorch' or 'onnx')")
+
+
+# ZEROSHOT_SCORER=severity -> severity_scorer.SeverityScorer (pre-tokenized
+#                            hypotheses, one bucketed padded batch)
+# ZEROSHOT_SCORER=pipeline -> generic zero-shot pipeline call
+ZEROSHOT_SCORER = os.getenv("ZEROSHOT_SCORER", "severity").lower()
+
+
+def load_severity_scorer():
+    from severity_scorer import SeverityScorer
+    return SeverityScorer.from_backend(registry.get("zeroshot"))
+
+
+# ZEROSHOT_SERVER=<address> -> score through the shared inference server
+#                              (inference_server.py); the model is never
+#                              loaded in this process. "default" is the
+#                              server's private per-user socket;
+#                              INFERENCE_AUTHKEY must match the server's
+ZEROSHOT_SERVER = os.getenv("ZEROSHOT_SERVER")
+
+
+def load_server_client():
+    from inference_server import InferenceClient
+    return InferenceClient(ZEROSHOT_SERVER).connect()
+
+
+# Loaded on first use (or by the warm-up task), not at import
+if ZEROSHOT_SERVER:
+    registry.register("zeroshot_server", load_server_client)
+else:
+    registry.register("zeroshot", load_backend)
+    registry.register("severity_scorer", load_severity_scorer)
+
+labels = [
+    "routine non-urgent condition",
+    "urgent medical attention needed", 
+    "critical life-threatening emergency"
+]
+
+severity_map = {
+    "routine non-urgent condition": 0.1,
+    "urgent medical attention needed": 0.6,
+    "critical life-threatening emergency": 0.95
+}
+
+# Micro-batching of concurrent compute_risk_score calls.
+# ZEROSHOT_MAX_BATCH=1 disables batching (direct pipeline call per request).
+ZEROSHOT_MAX_BATCH = int(os.getenv("ZEROSHOT_MAX_BATCH", "8"))
+ZEROSHOT_MAX_WAIT_MS = float(os.getenv("ZEROSHOT_MAX_WAIT_MS", "5"))
+
+
+def _score_result(result):
+    risk_score = 0.0
+    for label, score in zip(result["labels"], result["scores"]):
+        risk_score += severity_map[label] * score
+
+    # Return the score and the TOP label string
+    return risk_score, result["labels"][0]
+
+
+def compute_risk_scores(texts):
+    """
+    Scores several texts in one pipeline call.
+    All text/hypothesis pairs go through the model as a single batch.
+    """
+    texts = list(texts)
+    if ZEROSHOT_SERVER:
+        return registry.get("zeroshot_server").score_many(texts)
+    if ZEROSHOT_SCORER == "severity":
+        return registry.get("severity_scorer").score(texts)
+
+    classifier = registry.get("zeroshot")
+    results = classifier(texts, labels, batch_size=len(texts) * len(labels))
+    if isinstance(results, dict):
+        results = [results]
+    return [_score_result(r) for r in results]
+
+
+batcher = MicroBatcher(
+    compute_risk_scores,
+    max_batch_size=ZEROSHOT_MAX_BATCH,
+    max_wait_ms=ZEROSHOT_MAX_WAIT_MS,
+    name="zeroshot"
+)
+
+
+def compute_risk_score(text):
+    if ZEROSHOT_SERVER:
+        # Batched server-side, together with the other API processes
+        return registry.get("zeroshot_server").score(text)
+    if ZEROSHOT_MAX_BATCH > 1:
+        return batcher(text)
+    return compute_risk_scores([text])[0]
+
+
+def batcher_stats(timeout=None):
+    """
+    Micro-batcher stats; with ZEROSHOT_SERVER, fetched from the server
+    (timeout: seconds to wait for it, default INFERENCE_TIMEOUT).
+    """
+    if ZEROSHOT_SERVER:
+        return registry.get("zeroshot_server").stats(timeout)["batcher"]
+    return batcher.stats()
@@ -0,0 +1,298 @@
+# zeroshot_onnx.py
+#
+# ONNX Runtime backend for the zero-shot classifier.
+#
+#   python zeroshot_onnx.py export [--no-quantize]   # BART-MNLI -> ONNX (+ int8)
+#   python zeroshot_onnx.py parity                   # compare with the PyTorch pipeline
+#   python zeroshot_onnx.py bench                    # latency / memory per backend
+#
+# OnnxZeroShotClassifier is call-compatible with the transformers
+# zero-shot pipeline as used by zeroshot.compute_risk_scores, so
+# ZEROSHOT_BACKEND=onnx keeps the same (risk_score, top_label) contract.
+#
+# Optional dependencies: onnxruntime (runtime), onnx + torch (export).
+
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+from registry import artifact_path
+
+MODEL_NAME = os.getenv("ZEROSHOT_MODEL", "facebook/bart-large-mnli")
+ONNX_DIR = os.getenv("ZEROSHOT_ONNX_DIR") or artifact_path(os.path.join("onnx", "bart-large-mnli"))
+ONNX_QUANTIZED = os.getenv("ZEROSHOT_ONNX_QUANTIZED", "1") == "1"
+ONNX_THREADS = int(os.getenv("ZEROSHOT_ONNX_THREADS", "0"))  # 0 -> onnxruntime default
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+HYPOTHESIS_TEMPLATE = "This example is {}."
+
+# Fixed parity/benchmark set
+SYMPTOM_TEXTS = [
+    "Severe crushing chest pain radiating to the left arm with sweating",
+    "Mild sore throat and runny nose for two days",
+    "Sudden weakness on the right side of the body and slurred speech",
+    "High fever, stiff neck and confusion since this morning",
+    "Itchy rash on both forearms after gardening",
+    "Shortness of breath and wheezing, history of asthma",
+    "Twisted ankle while running, mild swelling, can walk",
+    "Vomiting blood and feeling lightheaded",
+    "Routine follow-up for blood pressure medication refill",
+    "Child with high fever and seizure lasting five minutes",
+]
+
+
+def _require_onnxruntime():
+    try:
+        import onnxruntime
+    except ImportError as e:
+        raise ImportError(
+            "ZEROSHOT_BACKEND=onnx needs onnxruntime (pip install onnxruntime)"
+        ) from e
+    return onnxruntime
+
+# ----------------------------
+# Export
+# ----------------------------
+
+def export_onnx(output_dir=ONNX_DIR, model_name=MODEL_NAME, quantize=True, opset=17):
+    """
+    Exports the sequence-classification head behind the zero-shot
+    pipeline to ONNX (dynamic batch and sequence axes), saves the
+    tokenizer/config next to it, and optionally writes a dynamically
+    int8-quantized copy.
+    """
+
+    import torch
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    model.eval()
+    model.config.return_dict = False
+
+    dummy = tokenizer(
+        ["a patient text"], ["This example is urgent."],
+        return_tensors="pt", padding=True
+    )
+
+    fp32_path = os.path.join(output_dir, FP32_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (dummy["input_ids"], dummy["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch"},
+            },
+            opset_version=opset,
+            dynamo=False,
+        )
+
+    tokenizer.save_pretrained(output_dir)
+    model.config.save_pretrained(output_dir)
+    print(f"Exported {model_name} -> {fp32_path}")
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        int8_path = os.path.join(output_dir, INT8_FILE)
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        print(f"Quantized (dynamic int8) -> {int8_path}")
+
+    return output_dir
+
+# ----------------------------
+# Runtime
+# ----------------------------
+
+class OnnxZeroShotClassifier:
+
+    def __init__(self, model_dir=ONNX_DIR, quantized=ONNX_QUANTIZED, threads=ONNX_THREADS):
+        ort = _require_onnxruntime()
+        from transformers import AutoConfig, AutoTokenizer
+
+        filename = INT8_FILE if quantized else FP32_FILE
+        path = os.path.join(model_dir, filename)
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"{path} not found; run `python zeroshot_onnx.py export` first"
+            )
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+        config = AutoConfig.from_pretrained(model_dir)
+        self.entailment_id = next(
+            (int(i) for i, label in config.id2label.items() if label.lower().startswith("entail")),
+            -1
+        )
+        self.model_file = filename
+
+    def logits(self, premises, hypotheses):
+        encoded = self.tokenizer(
+            premises, hypotheses,
+            truncation="only_first", padding=True, return_tensors="np"
+        )
+        return self.session.run(
+            ["logits"],
+            {
+                "input_ids": encoded["input_ids"].astype(np.int64),
+                "attention_mask": encoded["attention_mask"].astype(np.int64),
+            }
+        )[0]
+
+    def __call__(self, sequences, candidate_labels, hypothesis_template=HYPOTHESIS_TEMPLATE, batch_size=None):
+        single = isinstance(sequences, str)
+        sequences = [sequences] if single else list(sequences)
+        candidate_labels = list(candidate_labels)
+        n_labels = len(candidate_labels)
+
+        premises = [s for s in sequences for _ in candidate_labels]
+        hypotheses = [hypothesis_template.format(l) for _ in sequences for l in candidate_labels]
+
+        # Same scoring as the pipeline (multi_label=False): softmax of the
+        # entailment logit across candidate labels
+        entail = self.logits(premises, hypotheses)[:, self.entailment_id].reshape(len(sequences), n_labels)
+        entail = np.exp(entail - entail.max(axis=1, keepdims=True))
+        scores = entail / entail.sum(axis=1, keepdims=True)
+
+        results = []
+        for sequence, row in zip(sequences, scores):
+            order = np.argsort(-row)
+            results.append({
+                "sequence": sequence,
+                "labels": [candidate_labels[i] for i in order],
+                "scores": [float(row[i]) for i in order],
+            })
+
+        return results[0] if single else results
+
+# ----------------------------
+# Parity + benchmark
+# ----------------------------
+
+def _load_pipeline():
+    from zeroshot import load_classifier
+    return load_classifier()
+
+
+def _risk_scores(classifier, texts):
+    from zeroshot import labels, _score_result
+    results = classifier(texts, labels)
+    if isinstance(results, dict):
+        results = [results]
+    return [_score_result(r) for r in results]
+
+
+def parity(model_dir=ONNX_DIR, quantized=ONNX_QUANTIZED, tolerance=0.05):
+    """
+    Compares risk scores and top labels against the PyTorch pipeline on
+    SYMPTOM_TEXTS. Returns True when every top label matches and every
+    score is within tolerance.
+    """
+
+    reference = _risk_scores(_load_pipeline(), SYMPTOM_TEXTS)
+    candidate = _risk_scores(OnnxZeroShotClassifier(model_dir, quantized), SYMPTOM_TEXTS)
+
+    ok = True
+    max_diff = 0.0
+    for text, (ref_score, ref_label), (score, label) in zip(SYMPTOM_TEXTS, reference, candidate):
+        diff = abs(ref_score - score)
+        max_diff = max(max_diff, diff)
+        match = label == ref_label and diff <= tolerance
+        ok &= match
+        print(f"{'OK ' if match else 'BAD'} {diff:.4f}  {ref_label:<36} {label:<36} {text[:40]}")
+
+    print(f"\nmax |risk diff| = {max_diff:.4f} (tolerance {tolerance}), "
+          f"{'PASS' if ok else 'FAIL'}")
+    return ok
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def bench(model_dir=ONNX_DIR, repeats=20):
+    """Per-request latency and resident-memory growth for each backend."""
+
+    backends = [
+        ("pytorch", _load_pipeline),
+        ("onnx-fp32", lambda: OnnxZeroShotClassifier(model_dir, quantized=False)),
+        ("onnx-int8", lambda: OnnxZeroShotClassifier(model_dir, quantized=True)),
+    ]
+
+    report = {}
+    for name, loader in backends:
+        before = _rss_mb()
+        try:
+            classifier = loader()
+        except (ImportError, FileNotFoundError) as e:
+            print(f"{name}: skipped ({e})")
+            continue
+        loaded_mb = _rss_mb() - before
+
+        _risk_scores(classifier, SYMPTOM_TEXTS[:2])  # warm-up
+
+        times = []
+        for i in range(repeats):
+            text = SYMPTOM_TEXTS[i % len(SYMPTOM_TEXTS)]
+            started = time.perf_counter()
+            _risk_scores(classifier, [text])
+            times.append((time.perf_counter() - started) * 1000.0)
+
+        report[name] = {
+            "p50_ms": float(np.percentile(times, 50)),
+            "p95_ms": float(np.percentile(times, 95)),
+            "rss_delta_mb": round(loaded_mb, 1),
+        }
+        print(f"{name:<10} p50 {report[name]['p50_ms']:8.1f} ms  "
+              f"p95 {report[name]['p95_ms']:8.1f} ms  "
+              f"+RSS {loaded_mb:8.1f} MB")
+        del classifier
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("command", choices=["export", "parity", "bench"])
+    parser.add_argument("--dir", default=ONNX_DIR)
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--no-quantize", action="store_true")
+    parser.add_argument("--fp32", action="store_true", help="parity against the fp32 model")
+    parser.add_argument("--json", help="write bench results to this file")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_onnx(args.dir, args.model, quantize=not args.no_quantize)
+    elif args.command == "parity":
+        sys.exit(0 if parity(args.dir, quantized=not args.fp32) else 1)
+    else:
+        results = bench(args.dir)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)